@@ -0,0 +1,262 @@
+"""
+Autoajuste de hilos, tamaño de batch, workers y backend para esta máquina
+
+Mide combinaciones en el host actual y guarda la mejor configuración en el perfil de
+hardware (artifacts/hw_profile.json, ver hw_profile.py), que se carga al arrancar:
+
+- Inferencia (predict.py / API / evaluate.py): hilos de torch por worker × backend
+  (eager, torchscript) × precisión × tamaño de batch. Los hilos, el backend y la precisión
+  se eligen por la latencia p50 con batch 1 (la API clasifica imagen a imagen) y el tamaño
+  de batch por el mayor throughput cuya latencia p95 cabe en --latency-budget-ms.
+- Entrenamiento (train_cats_pytorch.py / incremental_train.py): hilos × tamaño de batch ×
+  precisión con pasos sintéticos (forward + backward + Adam; a igualdad de throughput, ±5%,
+  gana el batch más pequeño), y después los workers del DataLoader con imágenes reales de
+  --csv: el menor número de workers que alimenta el entrenamiento sin ser el cuello de botella.
+
+Los hilos de inferencia se limitan a CPUs / --api-workers para no sobresuscribir la CPU con
+varios workers de uvicorn. bf16 solo se mide con --precisions fp32 bf16 (cambia ligeramente
+las predicciones; ver benchmarks/bf16_precision.py).
+
+Uso:
+    python autotune.py
+    python autotune.py --only inference --api-workers 4 --latency-budget-ms 100
+    python autotune.py --threads 1 2 4 --train-batch-sizes 16 32 --output outputs/hw_profile_test.json
+"""
+import argparse
+import os
+import statistics
+import time
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+
+from hw_profile import PROFILE_PATH, available_cpus, host_info, load_hw_profile, save_hw_profile
+from precision import PRECISIONS, autocast, resolve_precision
+from predict import MODEL_PATH, IMG_SIZE, SimpleCNN, compile_model, load_model
+
+CPU = torch.device("cpu")
+BACKENDS = ("eager", "torchscript")
+# El loader debe producir al menos este margen sobre el throughput del entrenamiento
+LOADER_HEADROOM = 1.2
+# Entre configuraciones de entrenamiento a menos de este margen del mejor throughput se
+# prefiere el batch más pequeño (más pasos de optimización por época) y menos hilos
+TRAIN_TOLERANCE = 0.05
+
+
+def default_threads(max_threads: int) -> list:
+    """1, 2, 4, ... hasta max_threads (incluido)"""
+    threads, t = [], 1
+    while t < max_threads:
+        threads.append(t)
+        t *= 2
+    return threads + [max_threads]
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def inference_model():
+    """Modelo servido (MODEL_PATH) o SimpleCNN con pesos aleatorios (mismo coste)"""
+    try:
+        return load_model(), str(MODEL_PATH)
+    except FileNotFoundError:
+        return SimpleCNN().eval(), "SimpleCNN (pesos aleatorios)"
+
+
+def time_inference(model, batch_size: int, precision: str, repeats: int) -> dict:
+    """Latencia por batch (ms) e imágenes/s"""
+    batch = torch.randn(batch_size, 3, IMG_SIZE, IMG_SIZE)
+    latencies = []
+    with torch.no_grad(), autocast(precision, CPU):
+        for _ in range(2):
+            model(batch)  # calentamiento
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(batch)
+            latencies.append((time.perf_counter() - start) * 1000)
+    p50 = statistics.median(latencies)
+    return {
+        "batch_size": batch_size,
+        "p50_ms": round(p50, 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "images_per_second": round(batch_size * 1000 / p50, 1),
+    }
+
+
+def tune_inference(threads_list, batch_sizes, precisions, backends, repeats: int, latency_budget_ms: float):
+    base_model, model_name = inference_model()
+    print(f"🚀 Inferencia: {model_name}")
+    results = []
+    for backend in backends:
+        for precision in precisions:
+            if backend == "torchscript" and precision != "fp32":
+                continue  # compile_model mantiene eager con bf16
+            model = compile_model(base_model, backend=backend, precision=precision)
+            for threads in threads_list:
+                torch.set_num_threads(threads)
+                for bs in batch_sizes:
+                    r = {"backend": backend, "precision": precision, "threads": threads,
+                         **time_inference(model, bs, precision, repeats)}
+                    results.append(r)
+                    print(f"   {backend:11s} {precision} hilos={threads:<2d} batch={bs:<3d} "
+                          f"p50={r['p50_ms']:.2f}ms p95={r['p95_ms']:.2f}ms {r['images_per_second']:.0f} img/s")
+
+    # Configuración de servicio: menor latencia con una imagen (o con el menor batch medido)
+    smallest = min(batch_sizes)
+    best = min((r for r in results if r["batch_size"] == smallest), key=lambda r: r["p50_ms"])
+    same_config = [r for r in results if (r["backend"], r["precision"], r["threads"]) ==
+                   (best["backend"], best["precision"], best["threads"])]
+    within_budget = [r for r in same_config if r["p95_ms"] <= latency_budget_ms] or [best]
+    best_batch = max(within_budget, key=lambda r: r["images_per_second"])
+    config = {
+        "threads": best["threads"],
+        "backend": best["backend"],
+        "precision": best["precision"],
+        "batch_size": best_batch["batch_size"],
+        "latency_p50_ms": best["p50_ms"],
+        "images_per_second": best_batch["images_per_second"],
+    }
+    return config, results
+
+
+def time_training(threads: int, batch_size: int, precision: str, steps: int) -> float:
+    """Imágenes/s de pasos de entrenamiento sintéticos (forward + backward + Adam)"""
+    torch.set_num_threads(threads)
+    torch.manual_seed(0)
+    model = SimpleCNN().train()
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    criterion = nn.CrossEntropyLoss()
+    x = torch.randn(batch_size, 3, IMG_SIZE, IMG_SIZE)
+    y = torch.randint(0, 2, (batch_size,))
+    start = None
+    for step in range(steps + 1):
+        if step == 1:
+            start = time.perf_counter()  # el primer paso es calentamiento
+        optimizer.zero_grad()
+        with autocast(precision, CPU):
+            out = model(x)
+        loss = criterion(out.float(), y)
+        loss.backward()
+        optimizer.step()
+    return batch_size * steps / (time.perf_counter() - start)
+
+
+def time_loader(csv_path: str, batch_size: int, workers: int, batches: int) -> float:
+    """Imágenes/s que produce el DataLoader de entrenamiento (decodificación + aumentos)"""
+    import pandas as pd
+    from train_cats_pytorch import CatsDataset
+
+    df = pd.read_csv(csv_path).sample(frac=1, random_state=0).head(batch_size * (batches + 1))
+    loader = DataLoader(CatsDataset(df, train=True), batch_size=batch_size, shuffle=False, num_workers=workers)
+    images, start = 0, None
+    for i, (x, _) in enumerate(loader):
+        if i == 0:
+            start = time.perf_counter()  # el primer batch incluye el arranque de los workers
+            continue
+        images += x.size(0)
+    return images / (time.perf_counter() - start) if images else 0.0
+
+
+def tune_training(threads_list, batch_sizes, precisions, steps: int, csv_path: str, workers_list, loader_batches: int):
+    print("🚀 Entrenamiento: SimpleCNN (pasos sintéticos)")
+    results = []
+    for precision in precisions:
+        for threads in threads_list:
+            for bs in batch_sizes:
+                ips = time_training(threads, bs, precision, steps)
+                results.append({"precision": precision, "threads": threads, "batch_size": bs,
+                                "images_per_second": round(ips, 1)})
+                print(f"   {precision} hilos={threads:<2d} batch={bs:<3d} {ips:.0f} img/s")
+    top = max(r["images_per_second"] for r in results)
+    best = min((r for r in results if r["images_per_second"] >= top * (1 - TRAIN_TOLERANCE)),
+               key=lambda r: (r["batch_size"], r["threads"]))
+    config = {"threads": best["threads"], "batch_size": best["batch_size"], "precision": best["precision"],
+              "num_workers": 0, "images_per_second": best["images_per_second"]}
+
+    loader_results = []
+    if csv_path and os.path.exists(csv_path):
+        print(f"🚀 DataLoader: {csv_path} (batch={best['batch_size']})")
+        for workers in workers_list:
+            ips = time_loader(csv_path, best["batch_size"], workers, loader_batches)
+            loader_results.append({"num_workers": workers, "images_per_second": round(ips, 1)})
+            print(f"   workers={workers:<2d} {ips:.0f} img/s")
+        target = best["images_per_second"] * LOADER_HEADROOM
+        enough = [r for r in loader_results if r["images_per_second"] >= target]
+        chosen = (min(enough, key=lambda r: r["num_workers"]) if enough
+                  else max(loader_results, key=lambda r: r["images_per_second"]))
+        config["num_workers"] = chosen["num_workers"]
+    else:
+        print(f"⚠️  No existe {csv_path}: no se miden los workers del DataLoader (se usa 0)")
+    return config, {"compute": results, "loader": loader_results}
+
+
+def main():
+    cpus = available_cpus()
+    parser = argparse.ArgumentParser(description="Mide hilos, batch, workers y backend y guarda el perfil de hardware")
+    parser.add_argument("--only", choices=["inference", "training"], default=None,
+                        help="Ajustar solo una parte (se conserva la otra del perfil existente)")
+    parser.add_argument("--output", default=str(PROFILE_PATH), help="Perfil a escribir")
+    parser.add_argument("--api-workers", type=int, default=2,
+                        help="Workers de uvicorn que comparten la CPU (limita los hilos de inferencia; start.sh usa 2)")
+    parser.add_argument("--threads", type=int, nargs="+", default=None, help="Hilos a probar (default: 1, 2, 4, ...)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16, 32],
+                        help="Tamaños de batch de inferencia")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--precisions", nargs="+", choices=PRECISIONS, default=["fp32"],
+                        help="Precisiones a probar (bf16 se descarta si la CPU no lo soporta)")
+    parser.add_argument("--repeats", type=int, default=20, help="Repeticiones por medición de inferencia")
+    parser.add_argument("--latency-budget-ms", type=float, default=200.0,
+                        help="Latencia p95 máxima por batch para elegir el tamaño de batch de inferencia")
+    parser.add_argument("--train-batch-sizes", type=int, nargs="+", default=[8, 16, 32, 64])
+    parser.add_argument("--train-steps", type=int, default=5, help="Pasos de entrenamiento medidos por combinación")
+    parser.add_argument("--csv", default="dataset.csv", help="CSV para medir los workers del DataLoader")
+    parser.add_argument("--num-workers", type=int, nargs="+", default=None,
+                        help="Workers del DataLoader a probar (default: 0, 1, 2, 4 hasta CPUs - 1)")
+    parser.add_argument("--loader-batches", type=int, default=10, help="Batches medidos por configuración del loader")
+    args = parser.parse_args()
+
+    precisions = sorted({resolve_precision(p, CPU) for p in args.precisions}, key=PRECISIONS.index)
+    inference_threads = sorted({t for t in (args.threads or default_threads(max(1, cpus // args.api_workers)))
+                                if 0 < t <= cpus})
+    training_threads = sorted({t for t in (args.threads or default_threads(cpus)) if 0 < t <= cpus})
+    workers_list = args.num_workers or [w for w in (0, 1, 2, 4) if w == 0 or w < cpus]
+
+    print(f"📊 Host: {cpus} CPUs, {host_info()['machine']}, torch {torch.__version__}")
+    output = Path(args.output)
+    # Con --only se conserva la otra parte del perfil (si se midió en esta misma máquina)
+    profile = load_hw_profile(output) if args.only else {}
+    benchmarks = profile.get("benchmarks", {})
+
+    start = time.perf_counter()
+    if args.only in (None, "inference"):
+        profile["inference"], benchmarks["inference"] = tune_inference(
+            inference_threads, args.batch_sizes, precisions, args.backends, args.repeats, args.latency_budget_ms)
+    if args.only in (None, "training"):
+        profile["training"], benchmarks["training"] = tune_training(
+            training_threads, args.train_batch_sizes, precisions, args.train_steps, args.csv,
+            workers_list, args.loader_batches)
+    profile.update({
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "torch_version": torch.__version__,
+        "api_workers": args.api_workers,
+        "benchmarks": benchmarks,
+    })
+    path = save_hw_profile(profile, output)
+
+    print(f"\n✅ Perfil guardado en {path} ({time.perf_counter() - start:.0f}s)")
+    if "inference" in profile:
+        i = profile["inference"]
+        print(f"   Inferencia: {i['threads']} hilos, {i['backend']}, {i['precision']}, batch {i['batch_size']} "
+              f"({i['latency_p50_ms']:.2f}ms con una imagen)")
+    if "training" in profile:
+        t = profile["training"]
+        print(f"   Entrenamiento: {t['threads']} hilos, batch {t['batch_size']}, {t['num_workers']} workers, "
+              f"{t['precision']} ({t['images_per_second']:.0f} img/s)")
+
+
+if __name__ == "__main__":
+    main()
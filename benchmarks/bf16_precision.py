@@ -0,0 +1,136 @@
+"""
+Benchmark de precisión mixta bf16 frente a fp32 en CPU
+
+Mide el throughput de inferencia (por tamaño de batch) y de entrenamiento de SimpleCNN
+en fp32 y en bf16 (autocast), y el coste en exactitud: con --csv compara la precisión
+sobre imágenes reales; sin CSV compara el acuerdo de predicciones y la diferencia de
+probabilidades sobre entradas sintéticas.
+
+Uso:
+    python benchmarks/bf16_precision.py
+    python benchmarks/bf16_precision.py --checkpoint artifacts/best_model.pth --csv holdout.csv --output outputs/bf16.json
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import torch
+import torch.nn as nn
+
+from precision import cpu_supports_bf16, autocast
+from predict import SimpleCNN, IMG_SIZE, load_model
+
+CPU = torch.device("cpu")
+
+
+def time_inference(model, batch, precision, repeats):
+    with torch.no_grad(), autocast(precision, CPU):
+        model(batch)  # calentamiento
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model(batch)
+    return batch.size(0) * repeats / (time.perf_counter() - start)
+
+
+def time_training(precision, batch_size, steps):
+    torch.manual_seed(0)
+    model = SimpleCNN()
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    criterion = nn.CrossEntropyLoss()
+    x = torch.randn(batch_size, 3, IMG_SIZE, IMG_SIZE)
+    y = torch.randint(0, 2, (batch_size,))
+    start = None
+    for step in range(steps + 1):
+        if step == 1:
+            start = time.perf_counter()  # el primer paso es calentamiento
+        optimizer.zero_grad()
+        with autocast(precision, CPU):
+            out = model(x)
+        loss = criterion(out.float(), y)
+        loss.backward()
+        optimizer.step()
+    return batch_size * steps / (time.perf_counter() - start)
+
+
+def synthetic_agreement(model, samples):
+    x = torch.randn(samples, 3, IMG_SIZE, IMG_SIZE, generator=torch.Generator().manual_seed(0))
+    with torch.no_grad():
+        p32 = torch.softmax(model(x), dim=1)
+        with autocast("bf16", CPU):
+            out = model(x)
+        p16 = torch.softmax(out.float(), dim=1)
+    return {
+        "samples": samples,
+        "prediction_agreement": round((p32.argmax(1) == p16.argmax(1)).float().mean().item(), 4),
+        "max_probability_diff": round((p32 - p16).abs().max().item(), 5),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput y exactitud bf16 vs fp32")
+    parser.add_argument("--checkpoint", default=None, help="Modelo a medir (por defecto pesos aleatorios)")
+    parser.add_argument("--csv", default=None, help="CSV con labels para comparar la precisión real")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--repeats", type=int, default=10, help="Repeticiones por medición de inferencia")
+    parser.add_argument("--train-steps", type=int, default=10, help="Pasos de entrenamiento medidos")
+    parser.add_argument("--threads", type=int, default=None, help="Hilos de torch")
+    parser.add_argument("--force", action="store_true", help="Medir bf16 aunque la CPU no lo soporte de forma nativa")
+    parser.add_argument("--output", default=None, help="Guardar resultados en JSON")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    native = cpu_supports_bf16()
+    print(f"🖥️  bf16 nativo: {'sí' if native else 'no'} | hilos: {torch.get_num_threads()}")
+    if not native and not args.force:
+        print("⚠️  La CPU no soporta bf16: la aplicación usará fp32 (use --force para medir la emulación)")
+        sys.exit(0)
+
+    if args.checkpoint:
+        model = load_model(args.checkpoint).to(CPU)
+    else:
+        torch.manual_seed(0)
+        model = SimpleCNN().eval()
+
+    results = {"native_bf16": native, "threads": torch.get_num_threads(), "inference": [], "training": {}}
+    print(f"\n{'batch':>6} {'fp32 img/s':>11} {'bf16 img/s':>11} {'speedup':>8}")
+    for bs in args.batch_sizes:
+        batch = torch.randn(bs, 3, IMG_SIZE, IMG_SIZE)
+        fp32 = time_inference(model, batch, "fp32", args.repeats)
+        bf16 = time_inference(model, batch, "bf16", args.repeats)
+        results["inference"].append({"batch_size": bs, "fp32_images_per_sec": round(fp32, 1),
+                                     "bf16_images_per_sec": round(bf16, 1), "speedup": round(bf16 / fp32, 2)})
+        print(f"{bs:>6} {fp32:>11.1f} {bf16:>11.1f} {bf16 / fp32:>8.2f}")
+
+    fp32 = time_training("fp32", 16, args.train_steps)
+    bf16 = time_training("bf16", 16, args.train_steps)
+    results["training"] = {"batch_size": 16, "fp32_images_per_sec": round(fp32, 1),
+                           "bf16_images_per_sec": round(bf16, 1), "speedup": round(bf16 / fp32, 2)}
+    print(f"\n🏋️  Entrenamiento (batch 16): fp32 {fp32:.1f} img/s, bf16 {bf16:.1f} img/s ({bf16 / fp32:.2f}x)")
+
+    if args.csv:
+        from evaluate import evaluate_checkpoint
+        r32 = evaluate_checkpoint(args.csv, checkpoint=args.checkpoint, workers=0, precision="fp32")
+        r16 = evaluate_checkpoint(args.csv, checkpoint=args.checkpoint, workers=0, precision="bf16")
+        delta = (r16["accuracy"] - r32["accuracy"]) if r32["accuracy"] is not None else None
+        results["accuracy"] = {"csv": args.csv, "fp32": r32["accuracy"], "bf16": r16["accuracy"], "delta": delta}
+        print(f"🎯 Precisión en {args.csv}: fp32 {r32['accuracy']}, bf16 {r16['accuracy']} (delta {delta})")
+    else:
+        results["accuracy"] = synthetic_agreement(model, 256)
+        print(f"🎯 Acuerdo de predicciones fp32/bf16: {results['accuracy']['prediction_agreement']:.2%}, "
+              f"diferencia máxima de probabilidad: {results['accuracy']['max_probability_diff']}")
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark de escalado del entrenamiento data-parallel (DistributedDataParallel + gloo)
+
+Mide el tiempo por época de SimpleCNN con 1, 2, 4 y 8 procesos sobre el mismo número
+total de imágenes. Por defecto usa imágenes sintéticas en memoria para aislar el cómputo;
+con --csv usa imágenes reales (incluye el coste de decodificación).
+
+Uso:
+    python benchmarks/ddp_scaling.py
+    python benchmarks/ddp_scaling.py --procs 1 2 4 8 --samples 2048 --output outputs/ddp_scaling.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import torch
+import torch.nn as nn
+import torch.multiprocessing as mp
+from torch.nn.parallel import DistributedDataParallel as DDP
+from torch.utils.data import DataLoader, DistributedSampler, TensorDataset
+
+from train_cats_pytorch import SimpleCNN, CatsDataset, IMG_SIZE, BATCH
+from training_engine import setup_distributed, cleanup_distributed, train_one_epoch
+
+
+def build_dataset(args):
+    if args.csv:
+        import pandas as pd
+        df = pd.read_csv(args.csv).head(args.samples)
+        return CatsDataset(df, train=True)
+    g = torch.Generator().manual_seed(0)
+    x = torch.randn(args.samples, 3, IMG_SIZE, IMG_SIZE, generator=g)
+    y = torch.randint(0, 2, (args.samples,), generator=g)
+    return TensorDataset(x, y)
+
+
+def worker(rank, world_size, args, port, results):
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // world_size))
+    if world_size > 1:
+        setup_distributed(rank, world_size, "127.0.0.1", port)
+    torch.manual_seed(0)
+    model = SimpleCNN()
+    if world_size > 1:
+        model = DDP(model)
+    dataset = build_dataset(args)
+    sampler = DistributedSampler(dataset, num_replicas=world_size, rank=rank, shuffle=True) if world_size > 1 else None
+    loader = DataLoader(dataset, batch_size=args.batch_size, sampler=sampler, shuffle=sampler is None)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    criterion = nn.CrossEntropyLoss()
+
+    times = []
+    for epoch in range(args.warmup + args.epochs):
+        if sampler is not None:
+            sampler.set_epoch(epoch)
+        if world_size > 1:
+            torch.distributed.barrier()
+        start = time.perf_counter()
+        train_one_epoch(model, loader, criterion, optimizer, torch.device("cpu"))
+        if world_size > 1:
+            torch.distributed.barrier()
+        if epoch >= args.warmup:
+            times.append(time.perf_counter() - start)
+
+    if rank == 0:
+        results[world_size] = sum(times) / len(times)
+    cleanup_distributed()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Escalado del entrenamiento DDP en CPU")
+    parser.add_argument("--procs", type=int, nargs="+", default=[1, 2, 4, 8], help="Número de procesos a medir")
+    parser.add_argument("--samples", type=int, default=1024, help="Imágenes por época (total, no por proceso)")
+    parser.add_argument("--batch-size", type=int, default=BATCH, help="Batch por proceso")
+    parser.add_argument("--epochs", type=int, default=2, help="Épocas medidas")
+    parser.add_argument("--warmup", type=int, default=1, help="Épocas de calentamiento (no se miden)")
+    parser.add_argument("--csv", default=None, help="Usar imágenes reales de este CSV en lugar de sintéticas")
+    parser.add_argument("--output", default=None, help="Guardar resultados en JSON")
+    args = parser.parse_args()
+
+    manager = mp.Manager()
+    results = manager.dict()
+    for i, n in enumerate(args.procs):
+        print(f"⏱️  Midiendo {n} proceso(s)...", flush=True)
+        mp.spawn(worker, args=(n, args, 29600 + i, results), nprocs=n, join=True)
+
+    base = results.get(args.procs[0])
+    rows = []
+    print(f"\n{'procesos':>9} {'s/época':>10} {'speedup':>9} {'eficiencia':>11}")
+    for n in args.procs:
+        t = results[n]
+        speedup = base / t * args.procs[0] if base else 0.0
+        rows.append({"procs": n, "epoch_time_s": round(t, 3), "speedup": round(speedup, 2),
+                     "efficiency": round(speedup / n, 2)})
+        print(f"{n:>9} {t:>10.2f} {speedup:>9.2f} {speedup / n:>11.2f}")
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"samples": args.samples, "batch_size": args.batch_size, "cpu_count": os.cpu_count(),
+                       "source": args.csv or "synthetic", "results": rows}, f, indent=2)
+        print(f"💾 Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Presupuesto de tiempo de importación de los módulos de entrada (python -X importtime)
+
+Para cada módulo mide el tiempo acumulado de importación (mínimo de varias ejecuciones en
+un proceso nuevo), muestra las dependencias más costosas y falla (código 1) si:
+
+- se supera el presupuesto en milisegundos del módulo
+- el módulo importa una dependencia pesada prohibida (p. ej. main no debe importar torch
+  ni pandas al cargar: eso retrasa el arranque de cada worker de uvicorn)
+
+Uso:
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --budget main=500 --output outputs/import_time.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Presupuesto (ms) y dependencias que no deben importarse al cargar el módulo.
+# predict, train_cats_pytorch e incremental_train importan torch al cargar a propósito: definen
+# subclases de nn.Module a nivel de módulo y los tests y otros módulos parchean o importan sus
+# nombres (SimpleCNN, check_precision, ...). Solo se ejecutan para inferir o entrenar, donde
+# torch se necesita de todas formas. Su presupuesto es torch (~2 s) más un margen pequeño, para
+# detectar cualquier otra dependencia pesada que se cuele (sklearn, matplotlib, ...).
+BUDGETS_MS = {
+    "main": 800,
+    "feedback_storage": 1500,
+    "replay_buffer": 50,
+    "generate_csv": 300,
+    "predict": 2600,
+    "train_cats_pytorch": 2900,
+    "incremental_train": 3000,
+}
+FORBIDDEN = {
+    "main": ["torch", "pandas", "numpy", "sklearn", "matplotlib"],
+    "feedback_storage": ["torch", "sklearn", "matplotlib"],
+    "replay_buffer": ["torch", "pandas", "numpy"],
+    "generate_csv": ["torch", "pandas"],
+    "predict": ["pandas", "sklearn", "matplotlib"],
+    "train_cats_pytorch": ["sklearn", "matplotlib"],
+    "incremental_train": ["sklearn", "matplotlib"],
+}
+
+
+def import_profile(module: str) -> dict:
+    """
+    Importa el módulo en un proceso nuevo con -X importtime
+
+    Returns:
+        {"total_ms", "modules": {nombre: cumulative_ms}}
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {module}: {result.stderr.strip().splitlines()[-1:]}")
+    modules = {}
+    total_ms = None
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        ms = int(cumulative) / 1000
+        modules[name.strip()] = max(ms, modules.get(name.strip(), 0.0))
+        if name.rstrip() == f" {module}":
+            total_ms = ms
+    return {"total_ms": total_ms if total_ms is not None else 0.0, "modules": modules}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comprueba el presupuesto de tiempo de importación")
+    parser.add_argument("modules", nargs="*", default=list(BUDGETS_MS), help="Módulos a medir")
+    parser.add_argument("--repeat", type=int, default=3, help="Ejecuciones por módulo (se usa la más rápida)")
+    parser.add_argument("--budget", action="append", default=[], metavar="MODULO=MS",
+                        help="Sobrescribe el presupuesto de un módulo")
+    parser.add_argument("--top", type=int, default=5, help="Dependencias más costosas a mostrar")
+    parser.add_argument("--output", default=None, help="Guardar resultados en JSON")
+    args = parser.parse_args()
+
+    budgets = dict(BUDGETS_MS)
+    for item in args.budget:
+        name, ms = item.split("=")
+        budgets[name] = float(ms)
+
+    results = []
+    failed = False
+    for module in args.modules:
+        try:
+            runs = [import_profile(module) for _ in range(max(1, args.repeat))]
+        except RuntimeError as e:
+            print(f"⚠️  {e}")
+            results.append({"module": module, "error": str(e)})
+            failed = True
+            continue
+        best = min(runs, key=lambda r: r["total_ms"])
+        budget = budgets.get(module)
+        forbidden = [m for m in FORBIDDEN.get(module, []) if m in best["modules"]]
+        ok = (budget is None or best["total_ms"] <= budget) and not forbidden
+        failed = failed or not ok
+        top = sorted(((ms, name) for name, ms in best["modules"].items() if name != module), reverse=True)[:args.top]
+        results.append({"module": module, "total_ms": round(best["total_ms"], 1), "budget_ms": budget,
+                        "forbidden_imported": forbidden, "ok": ok,
+                        "top": [{"module": n, "ms": round(ms, 1)} for ms, n in top]})
+
+        status = "✅" if ok else "❌"
+        print(f"{status} {module}: {best['total_ms']:.0f} ms (presupuesto: {budget if budget is not None else '-'} ms)")
+        if forbidden:
+            print(f"   ❌ importa dependencias pesadas al cargar: {', '.join(forbidden)}")
+        for ms, name in top:
+            print(f"   - {name}: {ms:.0f} ms")
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+        print(f"💾 Resultados guardados en {args.output}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
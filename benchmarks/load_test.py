@@ -0,0 +1,243 @@
+"""
+Prueba de carga HTTP local con barrido de concurrencia
+
+Arranca la API con uvicorn (workers configurables) en un directorio de trabajo temporal
+y la somete a una carga mixta con N usuarios concurrentes (bucle cerrado: cada usuario
+envía una petición, espera la respuesta y envía la siguiente):
+
+- POST /api/v1/images/process   (subida de imágenes sintéticas)
+- POST /api/v1/feedback/correct  (corrección de una imagen procesada antes)
+- GET  /api/v1/feedback/stats
+
+Para cada nivel de concurrencia reporta throughput, latencias p50/p95/p99 por endpoint y
+tasa de errores, y estima el punto de saturación: el primer nivel en el que el throughput
+deja de crecer (< --min-gain), los errores superan --max-error-rate o el p95 supera --slo-ms.
+
+Uso:
+    python benchmarks/load_test.py --workers 2 --concurrency 1 2 4 8 16 32 --duration 20
+    python benchmarks/load_test.py --mix process=0.7,correct=0.1,stats=0.2 --output outputs/load_test.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+ENDPOINTS = ("process", "correct", "stats")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def synthetic_images(count: int, size=(1280, 960)):
+    """JPEGs sintéticos (gradiente + ruido) en memoria"""
+    import numpy as np
+    from PIL import Image
+
+    images = []
+    for i in range(count):
+        rng = np.random.default_rng(i)
+        w, h = size
+        base = np.linspace(0, 255, w, dtype=np.float32)[None, :, None].repeat(h, 0).repeat(3, 2)
+        arr = np.clip(base + rng.normal(0, 25, (h, w, 3)), 0, 255).astype("uint8")
+        buf = io.BytesIO()
+        Image.fromarray(arr, "RGB").save(buf, "JPEG", quality=85)
+        images.append((f"load_{i}.jpg", buf.getvalue()))
+    return images
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    ms = sorted(l * 1000 for l in latencies)
+    pick = lambda q: round(ms[min(len(ms) - 1, int(round(q * (len(ms) - 1))))], 1)
+    return {"p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+def start_server(workdir: Path, port: int, workers: int, checkpoint: str):
+    env = {**os.environ, "PYTHONUNBUFFERED": "1"}
+    if checkpoint and Path(checkpoint).exists():
+        env["MODEL_PATH"] = str(Path(checkpoint).resolve())
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", str(ROOT),
+           "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+    return subprocess.Popen(cmd, cwd=workdir, env=env, start_new_session=True)
+
+
+def wait_ready(base_url: str, timeout: float):
+    """Espera a que /ready responda 200 (modelo cargado y calentado)"""
+    import httpx
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/ready", timeout=2).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+async def run_level(base_url, concurrency, duration, mix, images, images_per_request, processed_paths):
+    import httpx
+
+    stats = {e: {"latencies": [], "errors": 0} for e in ENDPOINTS}
+    names, weights = zip(*mix.items())
+    deadline = time.perf_counter() + duration
+
+    async def call(client, endpoint, rng):
+        if endpoint == "correct" and processed_paths:
+            body = {"image_path": rng.choice(processed_paths), "corrected_label": rng.randint(0, 1)}
+            return await client.post("/api/v1/feedback/correct", json=body)
+        if endpoint == "stats" or endpoint == "correct":
+            return await client.get("/api/v1/feedback/stats")
+        files = [("files", (name, data, "image/jpeg")) for name, data in rng.sample(images, images_per_request)]
+        response = await client.post("/api/v1/images/process", files=files)
+        if response.status_code == 200:
+            for f in response.json().get("processed_files", []):
+                # Solo las clasificadas quedan en el historial de feedback (corregibles)
+                if f.get("path") and (f.get("classification") or {}).get("label") is not None:
+                    processed_paths.append(f["path"])
+        return response
+
+    async def user(client, seed):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            endpoint = rng.choices(names, weights)[0]
+            if endpoint == "correct" and not processed_paths:
+                endpoint = "stats"
+            start = time.perf_counter()
+            try:
+                response = await call(client, endpoint, rng)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            stats[endpoint]["latencies"].append(time.perf_counter() - start)
+            if not ok:
+                stats[endpoint]["errors"] += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(user(client, i) for i in range(concurrency)))
+        wall = time.perf_counter() - start
+
+    all_latencies = [l for s in stats.values() for l in s["latencies"]]
+    total = len(all_latencies)
+    errors = sum(s["errors"] for s in stats.values())
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "requests_per_sec": round(total / wall, 2),
+        "error_rate": round(errors / total, 4) if total else None,
+        **percentiles(all_latencies),
+        "endpoints": {
+            e: {"requests": len(s["latencies"]), "errors": s["errors"], **percentiles(s["latencies"])}
+            for e, s in stats.items() if s["latencies"]
+        },
+    }
+
+
+def find_saturation(levels, min_gain, max_error_rate, slo_ms):
+    """Primer nivel que ya no escala o que incumple errores/SLO (None si no se alcanzó)"""
+    for prev, level in zip([None] + levels[:-1], levels):
+        reasons = []
+        if level["error_rate"] and level["error_rate"] > max_error_rate:
+            reasons.append(f"error_rate {level['error_rate']:.2%}")
+        if slo_ms and level["p95_ms"] and level["p95_ms"] > slo_ms:
+            reasons.append(f"p95 {level['p95_ms']} ms > {slo_ms} ms")
+        if prev and level["requests_per_sec"] < prev["requests_per_sec"] * (1 + min_gain):
+            reasons.append(f"throughput +{level['requests_per_sec'] / max(prev['requests_per_sec'], 1e-9) - 1:.1%}")
+        if reasons:
+            return {"concurrency": level["concurrency"], "reasons": reasons,
+                    "max_sustainable_rps": prev["requests_per_sec"] if prev else level["requests_per_sec"]}
+    return None
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for item in text.split(","):
+        name, weight = item.split("=")
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Endpoint desconocido: {name} (opciones: {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga local de la API con barrido de concurrencia")
+    parser.add_argument("--workers", type=int, default=2, help="Workers de uvicorn")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--duration", type=float, default=20, help="Segundos por nivel de concurrencia")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("process=0.6,correct=0.1,stats=0.3"),
+                        help="Pesos de cada endpoint")
+    parser.add_argument("--images-per-request", type=int, default=4)
+    parser.add_argument("--checkpoint", default=str(ROOT / "artifacts" / "best_model.pth"))
+    parser.add_argument("--slo-ms", type=float, default=None, help="p95 máximo aceptable (ms)")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--min-gain", type=float, default=0.10,
+                        help="Mejora mínima de throughput al subir la concurrencia para considerar que escala")
+    parser.add_argument("--url", default=None, help="Usar un servidor ya en marcha en lugar de arrancar uno")
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--output", default=None, help="Guardar resultados en JSON")
+    args = parser.parse_args()
+
+    images = synthetic_images(16)
+    processed_paths = []
+    levels = []
+    with tempfile.TemporaryDirectory(prefix="load_test_") as tmp:
+        server = None
+        base_url = args.url
+        if not base_url:
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            print(f"🚀 Arrancando uvicorn con {args.workers} worker(s) en {base_url} (directorio {tmp})")
+            server = start_server(Path(tmp), port, args.workers, args.checkpoint)
+        try:
+            if not wait_ready(base_url, args.startup_timeout):
+                print("❌ El servidor no respondió /ready a tiempo")
+                sys.exit(1)
+            print(f"\n{'usuarios':>8} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errores':>8}")
+            for concurrency in args.concurrency:
+                level = asyncio.run(run_level(base_url, concurrency, args.duration, args.mix, images,
+                                              args.images_per_request, processed_paths))
+                levels.append(level)
+                print(f"{concurrency:>8} {level['requests_per_sec']:>8.1f} {level['p50_ms'] or 0:>6.0f}ms "
+                      f"{level['p95_ms'] or 0:>6.0f}ms {level['p99_ms'] or 0:>6.0f}ms {level['error_rate'] or 0:>8.2%}",
+                      flush=True)
+        finally:
+            if server:
+                os.killpg(server.pid, signal.SIGTERM)
+                server.wait(timeout=30)
+
+    saturation = find_saturation(levels, args.min_gain, args.max_error_rate, args.slo_ms)
+    if saturation:
+        print(f"\n📈 Saturación con {saturation['concurrency']} usuarios ({'; '.join(saturation['reasons'])}); "
+              f"throughput sostenible ≈ {saturation['max_sustainable_rps']} req/s")
+    else:
+        print("\n📈 No se alcanzó la saturación: prueba con más concurrencia")
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"timestamp": datetime.now().isoformat(), "workers": args.workers, "mix": args.mix,
+                       "duration_s": args.duration, "images_per_request": args.images_per_request,
+                       "cpu_count": os.cpu_count(), "levels": levels, "saturation": saturation}, f, indent=2)
+        print(f"💾 Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+Suite de benchmarks de extremo a extremo
+
+Genera imágenes sintéticas de tamaños y formatos realistas (fotos de móvil en JPEG,
+capturas en PNG, WEBP) en un directorio temporal y mide por separado:
+
+- preprocess: predict.preprocess_image por formato y tamaño
+- predict: predict_image (una imagen) y predict_batch por tamaño de batch
+- feedback: save_feedback y get_statistics con 10k / 100k / 1M filas de feedback
+- generate_csv: build_manifest completo e incremental
+- api: /api/v1/images/process con un cliente ASGI en proceso (throughput y p50/p95/p99)
+
+Todo se ejecuta en un directorio de trabajo temporal: no toca feedback_data/, uploads/
+ni outputs/ del proyecto. Los resultados se guardan en JSON para comparar ejecuciones:
+
+Uso:
+    python benchmarks/run_benchmarks.py --output outputs/bench_$(git rev-parse --short HEAD).json
+    python benchmarks/run_benchmarks.py --only predict api --compare outputs/bench_base.json --threshold 0.15
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+SECTIONS = ("preprocess", "predict", "feedback", "generate_csv", "api")
+# (nombre, tamaño, formato, opciones de guardado)
+IMAGE_SPECS = [
+    ("phone_jpeg", (4032, 3024), "JPEG", {"quality": 90}),
+    ("web_jpeg", (1280, 960), "JPEG", {"quality": 85}),
+    ("screenshot_png", (1920, 1080), "PNG", {}),
+    ("thumb_webp", (640, 480), "WEBP", {"quality": 80}),
+]
+
+
+# ------------- Utilidades -------------
+
+def percentiles(samples_s):
+    """p50/p95/p99 y media en milisegundos"""
+    ms = sorted(s * 1000 for s in samples_s)
+    pick = lambda q: ms[min(len(ms) - 1, int(round(q * (len(ms) - 1))))]
+    return {"mean_ms": round(statistics.fmean(ms), 3), "p50_ms": round(pick(0.50), 3),
+            "p95_ms": round(pick(0.95), 3), "p99_ms": round(pick(0.99), 3)}
+
+
+def timeit(fn, repeats, warmup=1):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def make_image(size, seed):
+    """Imagen con gradiente y ruido: comprime de forma parecida a una foto real"""
+    from PIL import Image
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    w, h = size
+    x = np.linspace(0, 255, w, dtype=np.float32)
+    y = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    noise = rng.normal(0, 25, (h, w, 3))
+    return Image.fromarray(np.clip(base + noise, 0, 255).astype("uint8"), "RGB")
+
+
+def write_images(directory: Path, count_per_spec: int):
+    """Escribe count_per_spec imágenes por especificación. Devuelve {spec: [rutas]}"""
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = {}
+    for name, size, fmt, opts in IMAGE_SPECS:
+        paths[name] = []
+        for i in range(count_per_spec):
+            path = directory / f"{name}_{i}.{fmt.lower().replace('jpeg', 'jpg')}"
+            make_image(size, seed=i).save(path, fmt, **opts)
+            paths[name].append(path)
+    return paths
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# ------------- Benchmarks -------------
+
+def bench_preprocess(ctx, args):
+    from predict import preprocess_image
+
+    results = {}
+    for name, paths in ctx["images"].items():
+        samples = []
+        for path in paths:
+            samples += timeit(lambda: preprocess_image(str(path)), repeats=args.repeats)
+        results[name] = {"images_per_sec": round(len(samples) / sum(samples), 2), **percentiles(samples)}
+    return results
+
+
+def load_bench_model(args):
+    import torch
+    from predict import SimpleCNN, load_model
+
+    if args.checkpoint and Path(args.checkpoint).exists():
+        return load_model(args.checkpoint)
+    torch.manual_seed(0)
+    return SimpleCNN().eval()
+
+
+def bench_predict(ctx, args):
+    import torch
+    from predict import predict_image, predict_batch, IMG_SIZE
+
+    model = load_bench_model(args)
+    path = str(ctx["images"]["web_jpeg"][0])
+    samples = timeit(lambda: predict_image(model, path), repeats=args.repeats * 5)
+    results = {"predict_image": {"images_per_sec": round(len(samples) / sum(samples), 2), **percentiles(samples)}}
+    for bs in args.batch_sizes:
+        batch = torch.randn(bs, 3, IMG_SIZE, IMG_SIZE)
+        samples = timeit(lambda: predict_batch(model, batch), repeats=args.repeats)
+        results[f"predict_batch_{bs}"] = {"images_per_sec": round(bs * len(samples) / sum(samples), 2),
+                                          **percentiles(samples)}
+    return results
+
+
+def write_feedback_rows(path: Path, rows: int):
+    """CSV de feedback sintético con el esquema de feedback_storage.save_feedback"""
+    rng = random.Random(0)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "image_path", "predicted_label", "predicted_label_name", "confidence",
+                         "corrected_label", "corrected_label_name", "user_feedback", "needs_review"])
+        for i in range(rows):
+            label = rng.randint(0, 1)
+            corrected = rng.random() < 0.05
+            writer.writerow([f"2025-01-01T00:00:{i:07d}", f"uploads/{i:08x}.jpg", label,
+                             "healthy" if label == 0 else "sick", round(rng.random(), 4),
+                             1 - label if corrected else "", ("sano", "enfermo")[1 - label] if corrected else "",
+                             "", corrected])
+
+
+def bench_feedback(ctx, args):
+    import feedback_storage
+
+    results = {}
+    for rows in args.feedback_rows:
+        csv_path = ctx["workdir"] / f"feedback_{rows}.csv"
+        write_feedback_rows(csv_path, rows)
+        feedback_storage.FEEDBACK_CSV = csv_path
+        repeats = max(1, args.repeats if rows <= 100_000 else 1)
+        stats = timeit(feedback_storage.get_statistics, repeats=repeats, warmup=0)
+        save = timeit(lambda: feedback_storage.save_feedback("uploads/bench.jpg", 0, "healthy", 0.9),
+                      repeats=repeats, warmup=0)
+        results[f"rows_{rows}"] = {"get_statistics": percentiles(stats), "save_feedback": percentiles(save),
+                                   "csv_bytes": csv_path.stat().st_size}
+        csv_path.unlink()
+    return results
+
+
+def bench_generate_csv(ctx, args):
+    import shutil
+    from generate_csv import build_manifest
+
+    dataset = ctx["workdir"] / "dataset"
+    for label, paths in zip(("healthy", "sick"), (ctx["images"]["web_jpeg"], ctx["images"]["thumb_webp"])):
+        (dataset / label).mkdir(parents=True, exist_ok=True)
+        for j in range(args.dataset_copies):
+            for path in paths:
+                shutil.copy(path, dataset / label / f"{j}_{path.name}")
+    csv_path = ctx["workdir"] / "bench_dataset.csv"
+    files = sum(1 for _ in dataset.rglob("*.*"))
+    full = timeit(lambda: build_manifest(str(dataset), str(csv_path), full=True), repeats=1, warmup=0)
+    incremental = timeit(lambda: build_manifest(str(dataset), str(csv_path)), repeats=args.repeats, warmup=0)
+    return {"files": files,
+            "full": {"files_per_sec": round(files / full[0], 2), **percentiles(full)},
+            "incremental": percentiles(incremental)}
+
+
+async def _api_run(app, payloads, concurrency, requests):
+    import httpx
+
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(payloads[i % len(payloads)])
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                 timeout=300) as client:
+        async def user():
+            nonlocal errors
+            while not queue.empty():
+                files = queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.post("/api/v1/images/process", files=files)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+
+        await client.post("/api/v1/images/process", files=payloads[0])  # calentamiento (carga del modelo)
+        start = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+    return latencies, errors, wall
+
+
+def bench_api(ctx, args):
+    from main import app
+
+    paths = ctx["images"]["web_jpeg"] + ctx["images"]["thumb_webp"]
+    payloads = []
+    for i in range(len(paths)):
+        chosen = [paths[(i + k) % len(paths)] for k in range(args.images_per_request)]
+        payloads.append([("files", (p.name, p.read_bytes(), "image/jpeg")) for p in chosen])
+    results = {}
+    for concurrency in args.concurrency:
+        latencies, errors, wall = asyncio.run(_api_run(app, payloads, concurrency, args.api_requests))
+        results[f"concurrency_{concurrency}"] = {
+            "requests": len(latencies),
+            "errors": errors,
+            "requests_per_sec": round(len(latencies) / wall, 2),
+            "images_per_sec": round(len(latencies) * args.images_per_request / wall, 2),
+            **percentiles(latencies),
+        }
+    return results
+
+
+# ------------- Comparación -------------
+
+def flatten(d, prefix=""):
+    out = {}
+    for k, v in d.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            out.update(flatten(v, key + "."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[key] = v
+    return out
+
+
+def compare(current: dict, baseline: dict, threshold: float):
+    """Lista de regresiones: latencias (_ms) que suben o throughput (_per_sec) que baja más del umbral"""
+    cur, base = flatten(current["results"]), flatten(baseline["results"])
+    regressions = []
+    for key, value in cur.items():
+        old = base.get(key)
+        if not old:
+            continue
+        change = (value - old) / old
+        if (key.endswith("_ms") and change > threshold) or (key.endswith("_per_sec") and change < -threshold):
+            regressions.append({"metric": key, "baseline": old, "current": value, "change": round(change, 4)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de preprocesado, inferencia, feedback, CSV y API")
+    parser.add_argument("--only", nargs="+", choices=SECTIONS, default=list(SECTIONS), help="Secciones a ejecutar")
+    parser.add_argument("--checkpoint", default=str(ROOT / "artifacts" / "best_model.pth"),
+                        help="Modelo a usar (pesos aleatorios si no existe)")
+    parser.add_argument("--images", type=int, default=4, help="Imágenes sintéticas por formato")
+    parser.add_argument("--repeats", type=int, default=5, help="Repeticiones por medición")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--feedback-rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dataset-copies", type=int, default=25, help="Copias de las imágenes para generate_csv")
+    parser.add_argument("--api-requests", type=int, default=50, help="Peticiones por nivel de concurrencia")
+    parser.add_argument("--images-per-request", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--output", default=None, help="Guardar resultados en JSON")
+    parser.add_argument("--compare", default=None, help="JSON de una ejecución anterior para detectar regresiones")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Cambio relativo considerado regresión")
+    args = parser.parse_args()
+    output = Path(args.output).resolve() if args.output else None
+    baseline_path = Path(args.compare).resolve() if args.compare else None
+
+    if Path(args.checkpoint).exists():
+        # predict lee MODEL_PATH al importarse; la API lo usa desde el directorio temporal
+        os.environ["MODEL_PATH"] = str(Path(args.checkpoint).resolve())
+    elif "api" in args.only:
+        print(f"⚠️  No existe {args.checkpoint}: la API se mide sin clasificación")
+
+    import torch
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "cpu_count": os.cpu_count(),
+            "torch_threads": torch.get_num_threads(),
+            "platform": platform.platform(),
+        },
+        "results": {},
+    }
+    benches = {"preprocess": bench_preprocess, "predict": bench_predict, "feedback": bench_feedback,
+               "generate_csv": bench_generate_csv, "api": bench_api}
+
+    with tempfile.TemporaryDirectory(prefix="bench_") as tmp:
+        workdir = Path(tmp)
+        os.chdir(workdir)  # feedback_data/, uploads/ y outputs/ se crean aquí
+        print(f"🖼️  Generando imágenes sintéticas en {workdir}...")
+        ctx = {"workdir": workdir, "images": write_images(workdir / "images", args.images)}
+        for name in args.only:
+            print(f"⏱️  {name}...", flush=True)
+            start = time.perf_counter()
+            report["results"][name] = benches[name](ctx, args)
+            print(f"   {time.perf_counter() - start:.1f}s")
+        os.chdir(ROOT)
+
+    print(json.dumps(report["results"], indent=2))
+    if output:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Resultados guardados en {output}")
+
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        print(f"\n📊 Comparación con {baseline_path} (commit {baseline['meta'].get('commit')}):")
+        if not regressions:
+            print(f"✅ Sin regresiones mayores al {args.threshold:.0%}")
+        for r in regressions:
+            print(f"❌ {r['metric']}: {r['baseline']} → {r['current']} ({r['change']:+.1%})")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
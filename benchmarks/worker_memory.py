@@ -0,0 +1,131 @@
+"""
+Memoria por worker al cargar el modelo: copia privada (torch.load) frente a mmap compartido
+
+Lanza N procesos con spawn (como los workers de uvicorn), cada uno carga el modelo y hace
+una predicción; con todos cargados se lee /proc/<pid>/smaps_rollup de cada proceso:
+
+- RSS: páginas residentes (cuenta completas las compartidas)
+- PSS: páginas compartidas divididas entre los procesos que las usan
+- USS: memoria privada del proceso (lo que se libera si el proceso muere)
+
+Con --backend torchscript el modelo pasa por predict.compile_model como en la API. Si
+congelar el grafo reescribe pesos (fusiones como conv + BatchNorm), esas constantes son
+memoria privada de cada worker: compile_model usa entonces el grafo sin congelar, salvo con
+--freeze, que congela siempre (el USS por worker muestra el coste).
+
+Uso:
+    python benchmarks/worker_memory.py --workers 2 4
+    python benchmarks/worker_memory.py --backend torchscript --freeze
+    python benchmarks/worker_memory.py --model artifacts/best_model.safetensors --output outputs/worker_memory.json
+"""
+import argparse
+import json
+import multiprocessing as mp
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+MODES = ("copy", "mmap")
+
+
+def memory_kb(pid: int) -> dict:
+    """RSS, PSS y USS en kB (Linux)"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                values[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss": values.get("Rss", 0),
+        "pss": values.get("Pss", 0),
+        "uss": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0),
+    }
+
+
+def worker(mode, model_path, backend, freeze, ready, done):
+    import torch
+    import predict
+
+    torch.set_num_threads(1)
+    if mode == "copy":
+        # Comportamiento anterior: torch.load copia los pesos a memoria privada
+        model = predict.SimpleCNN()
+        model.load_state_dict(torch.load(model_path, map_location="cpu"))
+        model.eval()
+    else:
+        model = predict.load_model(model_path)
+    model = predict.compile_model(model, backend=backend, precision="fp32", freeze=freeze or None)
+    predict.predict_batch(model, torch.zeros(1, 3, predict.IMG_SIZE, predict.IMG_SIZE))
+    ready.set()
+    done.wait()
+
+
+def measure(mode, model_path, n, backend="eager", freeze=False):
+    ctx = mp.get_context("spawn")
+    done = ctx.Event()
+    procs = []
+    for _ in range(n):
+        ready = ctx.Event()
+        p = ctx.Process(target=worker, args=(mode, model_path, backend, freeze, ready, done))
+        p.start()
+        procs.append((p, ready))
+    for _, ready in procs:
+        ready.wait()
+    samples = [memory_kb(p.pid) for p, _ in procs]
+    done.set()
+    for p, _ in procs:
+        p.join()
+    return {
+        "mode": mode,
+        "workers": n,
+        "backend": backend,
+        "freeze": freeze,
+        "rss_mb_per_worker": round(sum(s["rss"] for s in samples) / n / 1024, 1),
+        "pss_mb_per_worker": round(sum(s["pss"] for s in samples) / n / 1024, 1),
+        "uss_mb_per_worker": round(sum(s["uss"] for s in samples) / n / 1024, 1),
+        "pss_mb_total": round(sum(s["pss"] for s in samples) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria por worker: copia privada vs pesos mmap compartidos")
+    parser.add_argument("--model", default="artifacts/best_model.pth", help="Modelo a cargar")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2], help="Número de workers a medir")
+    parser.add_argument("--backend", choices=["eager", "torchscript"], default="eager",
+                        help="Backend de inferencia (ver predict.compile_model)")
+    parser.add_argument("--freeze", action="store_true",
+                        help="Con torchscript, congelar el grafo aunque copie pesos mmap")
+    parser.add_argument("--output", default=None, help="Guardar resultados en JSON")
+    args = parser.parse_args()
+
+    if not Path(args.model).exists():
+        print(f"❌ No se encontró {args.model}")
+        sys.exit(1)
+    if not Path("/proc/self/smaps_rollup").exists():
+        print("❌ Se necesita Linux (/proc/<pid>/smaps_rollup)")
+        sys.exit(1)
+
+    print(f"📦 Modelo: {args.model} ({Path(args.model).stat().st_size / 1e6:.1f} MB)")
+    print(f"\n{'modo':>6} {'workers':>8} {'RSS/worker':>11} {'PSS/worker':>11} {'USS/worker':>11} {'PSS total':>10}")
+    results = []
+    for n in args.workers:
+        for mode in MODES:
+            if mode == "copy" and Path(args.model).suffix == ".safetensors":
+                continue
+            r = measure(mode, args.model, n, args.backend, args.freeze)
+            results.append(r)
+            print(f"{mode:>6} {n:>8} {r['rss_mb_per_worker']:>9.1f}MB {r['pss_mb_per_worker']:>9.1f}MB "
+                  f"{r['uss_mb_per_worker']:>9.1f}MB {r['pss_mb_total']:>8.1f}MB")
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "results": results}, f, indent=2)
+        print(f"💾 Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
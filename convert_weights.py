@@ -0,0 +1,43 @@
+"""
+Convierte un modelo .pth (state_dict o artefacto de distill.py) a .safetensors
+
+safetensors guarda los tensores contiguos y sin pickle, y predict.load_model los lee
+con mmap, igual que los .pth. La arquitectura se guarda en los metadatos del archivo.
+
+Uso:
+    python convert_weights.py artifacts/best_model.pth
+    MODEL_PATH=artifacts/best_model.safetensors uvicorn main:app
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+from predict import read_weights
+
+
+def convert(model_path: Path, output_path: Path = None) -> Path:
+    from safetensors.torch import save_file
+
+    output_path = output_path or model_path.with_suffix(".safetensors")
+    arch, config, state_dict, _ = read_weights(model_path)
+    tmp_path = output_path.with_suffix(".tmp")
+    save_file({k: v.contiguous() for k, v in state_dict.items()}, str(tmp_path),
+              metadata={"arch": arch, "config": json.dumps(config)})
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convierte pesos .pth a .safetensors")
+    parser.add_argument("model", help="Modelo .pth")
+    parser.add_argument("--output", default=None, help="Archivo de salida (default: mismo nombre .safetensors)")
+    args = parser.parse_args()
+
+    try:
+        output = convert(Path(args.model), Path(args.output) if args.output else None)
+    except ImportError:
+        print("❌ safetensors no está instalado. Instala con: pip install safetensors")
+        sys.exit(1)
+    print(f"✅ Pesos guardados en {output} ({output.stat().st_size / 1e6:.2f} MB)")
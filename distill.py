@@ -0,0 +1,249 @@
+"""
+Destilación de conocimiento: entrena un clasificador compacto (StudentCNN) imitando
+al modelo actual (teacher, artifacts/best_model.pth) sobre dataset.csv + feedback
+
+La loss combina la divergencia KL entre las distribuciones suavizadas (temperatura T)
+del teacher y del estudiante con la cross-entropy sobre los labels reales:
+    loss = alpha * T² * KL(teacher_T || student_T) + (1 - alpha) * CE(student, label)
+
+El estudiante se exporta como artefacto autodescriptivo que predict.py carga directamente:
+    MODEL_PATH=artifacts/student_model.pth uvicorn main:app
+
+Uso:
+    python distill.py
+    python distill.py --width 8 --epochs 30 --temperature 4 --alpha 0.7
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torch.optim as optim
+from torch.utils.data import DataLoader
+
+from predict import StudentCNN, IMG_SIZE, MODEL_PATH, load_model, model_artifact, device
+from train_cats_pytorch import CatsDataset, BATCH
+from training_engine import (
+    evaluate, atomic_torch_save, EarlyStopping, TimeBudget, build_scheduler, scheduler_step,
+    current_lr, add_schedule_args, schedule_summary,
+)
+from precision import autocast, resolve_precision, add_precision_arg
+
+STUDENT_PATH = Path("artifacts/student_model.pth")
+REPORT_PATH = Path("outputs/distill_report.json")
+
+
+def load_distill_data(csv_path: str, use_feedback: bool = True) -> pd.DataFrame:
+    """dataset.csv + feedback (label corregido si existe), sin duplicados ni imágenes inexistentes"""
+    frames = []
+    if os.path.exists(csv_path):
+        frames.append(pd.read_csv(csv_path)[['image_path', 'label']])
+    if use_feedback:
+        from feedback_storage import get_training_data
+        feedback_df = get_training_data()
+        if not feedback_df.empty:
+            frames.append(feedback_df[['image_path', 'label']])
+    if not frames:
+        return pd.DataFrame(columns=['image_path', 'label'])
+    df = pd.concat(frames, ignore_index=True).drop_duplicates('image_path', keep='last')
+    df['label'] = df['label'].astype(int)
+    return df[df['image_path'].map(os.path.exists)].reset_index(drop=True)
+
+
+def distillation_loss(student_logits, teacher_logits, labels, temperature: float, alpha: float):
+    soft = F.kl_div(
+        F.log_softmax(student_logits / temperature, dim=1),
+        F.softmax(teacher_logits / temperature, dim=1),
+        reduction="batchmean",
+    ) * temperature ** 2
+    hard = F.cross_entropy(student_logits, labels)
+    return alpha * soft + (1 - alpha) * hard
+
+
+def distill_one_epoch(student, teacher, loader, optimizer, temperature, alpha, precision="fp32"):
+    """Una época de destilación. Devuelve (loss promedio, accuracy del estudiante)"""
+    student.train()
+    running_loss = 0.0; correct = 0; n = 0
+    for xb, yb in loader:
+        xb, yb = xb.to(device), yb.to(device)
+        with torch.no_grad(), autocast(precision, device):
+            teacher_logits = teacher(xb)
+        optimizer.zero_grad()
+        with autocast(precision, device):
+            out = student(xb)
+        out = out.float()
+        loss = distillation_loss(out, teacher_logits.float(), yb, temperature, alpha)
+        loss.backward()
+        optimizer.step()
+        running_loss += loss.item() * xb.size(0)
+        correct += (out.argmax(dim=1) == yb).sum().item()
+        n += xb.size(0)
+    return (running_loss / n if n else 0.0), (correct / n if n else 0.0)
+
+
+def measure_latency(model, batch_size: int, repeats: int = 20) -> float:
+    """Latencia media por batch en milisegundos"""
+    x = torch.randn(batch_size, 3, IMG_SIZE, IMG_SIZE, device=device)
+    with torch.no_grad():
+        model(x)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model(x)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def compare_models(teacher, student, loader) -> dict:
+    """Accuracy de ambos modelos y acuerdo de predicciones sobre el loader"""
+    agree = 0; teacher_ok = 0; student_ok = 0; n = 0
+    with torch.no_grad():
+        for xb, yb in loader:
+            xb, yb = xb.to(device), yb.to(device)
+            t = teacher(xb).argmax(dim=1)
+            s = student(xb).argmax(dim=1)
+            agree += (t == s).sum().item()
+            teacher_ok += (t == yb).sum().item()
+            student_ok += (s == yb).sum().item()
+            n += xb.size(0)
+    return {
+        "images": n,
+        "agreement": round(agree / n, 4) if n else None,
+        "teacher_accuracy": round(teacher_ok / n, 4) if n else None,
+        "student_accuracy": round(student_ok / n, 4) if n else None,
+    }
+
+
+def count_parameters(model) -> int:
+    return sum(p.numel() for p in model.parameters())
+
+
+def build_report(teacher, student, teacher_path, student_path, test_loader, args) -> dict:
+    teacher.eval(); student.eval()
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "teacher": str(teacher_path),
+        "student": str(student_path),
+        "student_config": {"width": args.width, "temperature": args.temperature, "alpha": args.alpha},
+        "size": {
+            "teacher_parameters": count_parameters(teacher),
+            "student_parameters": count_parameters(student),
+            "teacher_file_bytes": Path(teacher_path).stat().st_size,
+            "student_file_bytes": Path(student_path).stat().st_size,
+        },
+        "latency_ms": {},
+        "test": compare_models(teacher, student, test_loader),
+    }
+    for bs in (1, 32):
+        t = measure_latency(teacher, bs)
+        s = measure_latency(student, bs)
+        report["latency_ms"][f"batch_{bs}"] = {"teacher": round(t, 2), "student": round(s, 2),
+                                               "speedup": round(t / s, 2) if s else None}
+    return report
+
+
+def print_report(report: dict):
+    size = report["size"]
+    print(f"\n📊 Reporte de destilación")
+    print(f"   - Parámetros: teacher {size['teacher_parameters']:,}, estudiante {size['student_parameters']:,} "
+          f"({size['teacher_parameters'] / max(size['student_parameters'], 1):.0f}x menos)")
+    print(f"   - Tamaño en disco: teacher {size['teacher_file_bytes'] / 1e6:.2f} MB, "
+          f"estudiante {size['student_file_bytes'] / 1e6:.2f} MB")
+    for name, lat in report["latency_ms"].items():
+        print(f"   - Latencia {name}: teacher {lat['teacher']} ms, estudiante {lat['student']} ms ({lat['speedup']}x)")
+    test = report["test"]
+    print(f"   - Test ({test['images']} imágenes): acuerdo con el teacher {test['agreement']}, "
+          f"accuracy teacher {test['teacher_accuracy']}, estudiante {test['student_accuracy']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Destila best_model.pth en un clasificador compacto")
+    parser.add_argument("--teacher", default=str(MODEL_PATH), help="Modelo teacher")
+    parser.add_argument("--csv", default="dataset.csv", help="Dataset base")
+    parser.add_argument("--no-feedback", action="store_true", help="No incluir el feedback de usuarios")
+    parser.add_argument("--output", default=str(STUDENT_PATH), help="Artefacto del estudiante")
+    parser.add_argument("--report", default=str(REPORT_PATH), help="Reporte JSON (tamaño, latencia, acuerdo)")
+    parser.add_argument("--width", type=int, default=16, help="Canales de la primera capa del estudiante")
+    parser.add_argument("--epochs", type=int, default=30, help="Número de épocas")
+    parser.add_argument("--lr", type=float, default=1e-3, help="Learning rate")
+    parser.add_argument("--temperature", type=float, default=4.0, help="Temperatura de la destilación")
+    parser.add_argument("--alpha", type=float, default=0.7, help="Peso de la loss de destilación frente a la de labels")
+    add_schedule_args(parser, patience=5, scheduler="plateau")
+    add_precision_arg(parser)
+    args = parser.parse_args()
+
+    if not Path(args.teacher).exists():
+        print(f"❌ No se encontró el teacher {args.teacher}. Entrena primero con train_cats_pytorch.py")
+        sys.exit(1)
+
+    df = load_distill_data(args.csv, use_feedback=not args.no_feedback)
+    if len(df) < 3:
+        print(f"❌ No hay suficientes imágenes ({len(df)}) para destilar")
+        sys.exit(1)
+    df = df.sample(frac=1, random_state=42).reset_index(drop=True)
+    n = len(df)
+    train_df, val_df, test_df = df.iloc[:int(0.7*n)], df.iloc[int(0.7*n):int(0.85*n)], df.iloc[int(0.85*n):]
+    print(f"📦 Dataset: {n} imágenes (train {len(train_df)}, val {len(val_df)}, test {len(test_df)})")
+
+    train_loader = DataLoader(CatsDataset(train_df, train=True), batch_size=BATCH, shuffle=True)
+    val_loader = DataLoader(CatsDataset(val_df, train=False), batch_size=BATCH, shuffle=False)
+    test_loader = DataLoader(CatsDataset(test_df, train=False), batch_size=BATCH, shuffle=False)
+
+    precision = resolve_precision(args.precision, device)
+    teacher = load_model(args.teacher)
+    student = StudentCNN(width=args.width).to(device)
+    optimizer = optim.Adam(student.parameters(), lr=args.lr, weight_decay=1e-4)
+    criterion = nn.CrossEntropyLoss()
+    scheduler = build_scheduler(optimizer, args.scheduler, args.epochs, args.patience)
+    stopper = EarlyStopping(patience=args.patience, min_delta=args.min_delta)
+    budget = TimeBudget(args.time_budget)
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    best_val_loss = float("inf")
+    stop_reason = "completado"
+    epochs_run = 0
+    print(f"\n🎓 Destilando {args.teacher} → StudentCNN(width={args.width}) "
+          f"T={args.temperature} alpha={args.alpha} precision={precision}")
+    for epoch in range(1, args.epochs + 1):
+        if budget.exhausted():
+            stop_reason = "presupuesto de tiempo"
+            break
+        budget.start_epoch()
+        train_loss, train_acc = distill_one_epoch(student, teacher, train_loader, optimizer,
+                                                  args.temperature, args.alpha, precision)
+        val_loss, val_acc, _, _ = evaluate(student, val_loader, criterion, device, precision)
+        lr = current_lr(optimizer)
+        scheduler_step(scheduler, val_loss)
+        budget.end_epoch()
+        epochs_run = epoch
+        print(f"Epoch {epoch}/{args.epochs} - distill_loss {train_loss:.4f} train_acc {train_acc:.4f} "
+              f"- val_loss {val_loss:.4f} val_acc {val_acc:.4f} - lr {lr:.2e}")
+        if val_loss < best_val_loss:
+            best_val_loss = val_loss
+            atomic_torch_save(model_artifact(student, "student_cnn", {"width": args.width},
+                                             teacher=str(args.teacher), created_at=datetime.now().isoformat()),
+                              output)
+        if stopper.step(val_loss):
+            stop_reason = f"early stopping ({args.patience} épocas sin mejora)"
+            break
+    print(schedule_summary(epochs_run, args.epochs, stop_reason))
+
+    student = load_model(output)
+    report = build_report(teacher, student, args.teacher, output, test_loader, args)
+    print_report(report)
+    Path(args.report).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Estudiante guardado en {output}")
+    print(f"💾 Reporte guardado en {args.report}")
+    print(f"   Para servirlo: MODEL_PATH={output}")
+
+
+if __name__ == "__main__":
+    main()
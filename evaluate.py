@@ -0,0 +1,333 @@
+"""
+Evaluación offline del modelo sobre cualquier CSV con el formato de dataset.csv
+(image_path, label, timestamp, source).
+
+Ejecuta inferencia por lotes con varios workers de carga, escribe las predicciones
+por imagen y reporta precisión, matriz de confusión e imágenes/segundo. Sirve para
+decidir si un modelo se promueve y para comparar backends de inferencia con datos reales.
+
+Uso:
+    python evaluate.py dataset.csv
+    python evaluate.py holdout.csv --checkpoint artifacts/backups/best_model_backup_X.pth --min-accuracy 0.85
+"""
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import torch
+from torch.utils.data import Dataset, DataLoader
+from PIL import Image
+
+from precision import resolve_precision, add_precision_arg
+from hw_profile import hw_setting
+
+from predict import (
+    IMG_SIZE, MODEL_PATH, LABEL_NAMES, INFERENCE_PRECISION, INFERENCE_THREADS, INFERENCE_BACKEND, device,
+    load_model, compile_model, image_to_tensor, predict_batch, predict_cascade,
+    CASCADE_THRESHOLD, CASCADE_IMG_SIZE,
+)
+
+OUTPUT_DIR = Path("outputs")
+
+
+def resolve_image_path(image_path: str) -> str:
+    """Normaliza la ruta para que funcione en Windows y Linux (igual que CatsDataset)"""
+    img_path = image_path.replace('\\', os.sep).replace('/', os.sep)
+    if not os.path.isabs(img_path):
+        img_path = os.path.join(os.getcwd(), img_path)
+    return img_path
+
+
+def load_rows(csv_path: str, limit: int = None) -> list:
+    """
+    Lee un CSV con el formato de dataset.csv
+
+    Las filas sin label (por ejemplo, CSVs de processed_images_*) se evalúan igual,
+    pero no cuentan para la precisión.
+    """
+    rows = []
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if not row.get('image_path'):
+                continue
+            label = str(row.get('label', '')).strip()
+            try:
+                label = int(float(label))
+            except ValueError:
+                label = -1
+            rows.append({"image_path": row['image_path'], "label": label})
+            if limit and len(rows) >= limit:
+                break
+    return rows
+
+
+class EvalDataset(Dataset):
+    """Dataset de evaluación: sin augmentations, tolera imágenes ilegibles"""
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, idx):
+        try:
+            with Image.open(resolve_image_path(self.rows[idx]['image_path'])) as img:
+                tensor = image_to_tensor(img.convert('RGB'))
+            ok = True
+        except Exception:
+            tensor = torch.zeros(3, IMG_SIZE, IMG_SIZE)
+            ok = False
+        return tensor, idx, ok
+
+
+def run_inference(model, rows, batch_size: int = 64, workers: int = 4, precision: str = None,
+                  cascade_model=None, cascade_threshold: float = None):
+    """
+    Ejecuta inferencia por lotes sobre todas las filas
+
+    Con cascade_model, ese modelo decide primero y solo las imágenes con confianza
+    menor que cascade_threshold pasan a `model` (ver predict.predict_cascade).
+
+    Returns:
+        (predicciones por fila o None si la imagen no se pudo leer, tiempo de inferencia en segundos)
+    """
+    loader = DataLoader(
+        EvalDataset(rows),
+        batch_size=batch_size,
+        shuffle=False,
+        num_workers=workers,
+        persistent_workers=False,
+    )
+    predictions = [None] * len(rows)
+    inference_time = 0.0
+    for batch, idxs, oks in loader:
+        start = time.perf_counter()
+        if cascade_model is not None:
+            results = predict_cascade(model, cascade_model, batch, threshold=cascade_threshold, precision=precision)
+        else:
+            results = predict_batch(model, batch, precision=precision)
+        inference_time += time.perf_counter() - start
+        for idx, ok, result in zip(idxs.tolist(), oks.tolist(), results):
+            if ok:
+                predictions[idx] = result
+    return predictions, inference_time
+
+
+def summarize(rows, predictions, wall_time: float, inference_time: float) -> dict:
+    """Calcula precisión, matriz de confusión y throughput"""
+    confusion = [[0, 0], [0, 0]]  # filas: label real, columnas: predicción
+    unreadable = sum(1 for p in predictions if p is None)
+    for row, pred in zip(rows, predictions):
+        if pred is None or row['label'] not in (0, 1):
+            continue
+        confusion[row['label']][pred['label']] += 1
+
+    labeled = sum(sum(r) for r in confusion)
+    correct = confusion[0][0] + confusion[1][1]
+    per_class = {}
+    for cls, name in LABEL_NAMES.items():
+        tp = confusion[cls][cls]
+        predicted = confusion[0][cls] + confusion[1][cls]
+        actual = sum(confusion[cls])
+        per_class[name] = {
+            "precision": round(tp / predicted, 4) if predicted else 0.0,
+            "recall": round(tp / actual, 4) if actual else 0.0,
+            "support": actual,
+        }
+
+    evaluated = len(rows) - unreadable
+    return {
+        "total_images": len(rows),
+        "evaluated_images": evaluated,
+        "unreadable_images": unreadable,
+        "labeled_images": labeled,
+        "accuracy": round(correct / labeled, 4) if labeled else None,
+        "confusion_matrix": confusion,
+        "per_class": per_class,
+        "wall_time_s": round(wall_time, 3),
+        "inference_time_s": round(inference_time, 3),
+        "images_per_sec": round(evaluated / wall_time, 2) if wall_time > 0 else 0.0,
+        "inference_images_per_sec": round(evaluated / inference_time, 2) if inference_time > 0 else 0.0,
+    }
+
+
+def write_predictions(rows, predictions, output_path: Path):
+    """Escribe las predicciones por imagen en CSV"""
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow([
+            "image_path", "label", "predicted_label", "predicted_label_name",
+            "confidence", "prob_healthy", "prob_sick", "correct"
+        ])
+        for row, pred in zip(rows, predictions):
+            label = row['label'] if row['label'] in (0, 1) else ""
+            if pred is None:
+                writer.writerow([row['image_path'], label, "", "error", "", "", "", ""])
+                continue
+            correct = int(pred['label'] == row['label']) if label != "" else ""
+            writer.writerow([
+                row['image_path'],
+                label,
+                pred['label'],
+                pred['label_name'],
+                round(pred['confidence'], 6),
+                round(pred['probabilities']['healthy'], 6),
+                round(pred['probabilities']['sick'], 6),
+                correct,
+            ])
+
+
+def evaluate_checkpoint(csv_path: str, checkpoint=None, batch_size: int = 64,
+                        workers: int = 4, limit: int = None, predictions_path=None,
+                        precision: str = None, cascade_checkpoint=None, cascade_threshold: float = None,
+                        backend: str = None) -> dict:
+    """
+    Evalúa un checkpoint sobre un CSV y devuelve el reporte
+
+    Args:
+        csv_path: CSV con formato de dataset.csv
+        checkpoint: Ruta al checkpoint (por defecto artifacts/best_model.pth)
+        batch_size: Tamaño de lote para la inferencia
+        workers: Workers del DataLoader para decodificar imágenes
+        limit: Evaluar solo las primeras N filas
+        predictions_path: Si se indica, escribe ahí las predicciones por imagen
+        precision: "fp32" o "bf16" (por defecto INFERENCE_PRECISION)
+        cascade_checkpoint: Modelo barato de primera etapa (evalúa la cascada)
+        cascade_threshold: Confianza mínima para que decida la primera etapa
+        backend: "eager" o "torchscript" (por defecto INFERENCE_BACKEND, ver predict.compile_model)
+    """
+    precision = resolve_precision(precision, device) if precision else INFERENCE_PRECISION
+    rows = load_rows(csv_path, limit=limit)
+    if not rows:
+        raise ValueError(f"El CSV {csv_path} no contiene imágenes")
+
+    backend = backend or INFERENCE_BACKEND
+    model = compile_model(load_model(checkpoint), backend=backend, precision=precision)
+    cascade_model = None
+    if cascade_checkpoint:
+        cascade_model = compile_model(load_model(cascade_checkpoint), backend=backend,
+                                      img_size=CASCADE_IMG_SIZE, precision=precision)
+    cascade_threshold = CASCADE_THRESHOLD if cascade_threshold is None else cascade_threshold
+    start = time.perf_counter()
+    predictions, inference_time = run_inference(model, rows, batch_size=batch_size, workers=workers,
+                                              precision=precision, cascade_model=cascade_model,
+                                              cascade_threshold=cascade_threshold)
+    wall_time = time.perf_counter() - start
+
+    report = summarize(rows, predictions, wall_time, inference_time)
+    report.update({
+        "csv": str(csv_path),
+        "checkpoint": str(checkpoint or MODEL_PATH),
+        "batch_size": batch_size,
+        "workers": workers,
+        "torch_threads": torch.get_num_threads(),
+        "device": str(device),
+        "precision": precision,
+        "backend": backend,
+        "timestamp": datetime.now().isoformat(),
+    })
+    if cascade_model is not None:
+        classified = [p for p in predictions if p is not None]
+        escalated = sum(1 for p in classified if p["stage"] == "full")
+        report["cascade"] = {
+            "checkpoint": str(cascade_checkpoint),
+            "threshold": cascade_threshold,
+            "escalated": escalated,
+            "escalation_rate": round(escalated / len(classified), 4) if classified else None,
+        }
+    if predictions_path:
+        write_predictions(rows, predictions, Path(predictions_path))
+        report["predictions_csv"] = str(predictions_path)
+    return report
+
+
+def print_report(report: dict):
+    """Muestra el reporte en consola"""
+    print(f"📊 Evaluación de {report['checkpoint']} sobre {report['csv']}")
+    print(f"   - Imágenes: {report['total_images']} (ilegibles: {report['unreadable_images']}, con label: {report['labeled_images']})")
+    if report['accuracy'] is not None:
+        print(f"   - Precisión: {report['accuracy']:.4f}")
+        cm = report['confusion_matrix']
+        print("   - Matriz de confusión (filas=real, columnas=predicción):")
+        print(f"                 sano  enfermo")
+        print(f"       sano    {cm[0][0]:6d}  {cm[0][1]:6d}")
+        print(f"       enfermo {cm[1][0]:6d}  {cm[1][1]:6d}")
+        for name, m in report['per_class'].items():
+            print(f"   - {name}: precision {m['precision']:.4f}, recall {m['recall']:.4f}, support {m['support']}")
+    print(f"   - Throughput: {report['images_per_sec']} img/s extremo a extremo, "
+          f"{report['inference_images_per_sec']} img/s solo inferencia")
+    print(f"   - batch_size={report['batch_size']}, workers={report['workers']}, "
+          f"threads={report['torch_threads']}, device={report['device']}, "
+          f"precision={report['precision']}, backend={report['backend']}")
+    if report.get('cascade'):
+        c = report['cascade']
+        print(f"   - Cascada ({c['checkpoint']}, umbral {c['threshold']}): "
+              f"{c['escalated']} escaladas al modelo completo (tasa {c['escalation_rate']})")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Evaluación offline del modelo sobre un CSV")
+    parser.add_argument("csv", help="CSV con formato de dataset.csv (image_path,label,...)")
+    parser.add_argument("--checkpoint", default=None, help=f"Checkpoint a evaluar (default: {MODEL_PATH})")
+    parser.add_argument("--batch-size", type=int, default=hw_setting("inference", "batch_size", 64),
+                        help="Tamaño de lote (por defecto el del perfil de hardware o 64)")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), help="Workers del DataLoader")
+    parser.add_argument("--threads", type=int, default=INFERENCE_THREADS or None,
+                        help="Hilos de torch para la inferencia (por defecto INFERENCE_THREADS o el perfil de hardware)")
+    parser.add_argument("--limit", type=int, default=None, help="Evaluar solo las primeras N imágenes")
+    parser.add_argument("--output", default=None, help="CSV de predicciones (default: outputs/eval_predictions_<timestamp>.csv)")
+    parser.add_argument("--report", default=None, help="Guardar el reporte en JSON")
+    parser.add_argument("--min-accuracy", type=float, default=None,
+                        help="Termina con código 2 si la precisión queda por debajo (gate de promoción)")
+    add_precision_arg(parser, default=INFERENCE_PRECISION)
+    parser.add_argument("--backend", choices=["eager", "torchscript"], default=INFERENCE_BACKEND,
+                        help="Backend de inferencia (default: INFERENCE_BACKEND o el perfil de hardware)")
+    parser.add_argument("--cascade-checkpoint", default=None,
+                        help="Evaluar en cascada con este modelo barato como primera etapa")
+    parser.add_argument("--cascade-threshold", type=float, default=None,
+                        help=f"Confianza mínima de la primera etapa (default: {CASCADE_THRESHOLD})")
+
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    output = args.output or OUTPUT_DIR / f"eval_predictions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+
+    try:
+        report = evaluate_checkpoint(
+            args.csv,
+            checkpoint=args.checkpoint,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            limit=args.limit,
+            predictions_path=output,
+            precision=args.precision,
+            cascade_checkpoint=args.cascade_checkpoint,
+            cascade_threshold=args.cascade_threshold,
+            backend=args.backend,
+        )
+    except Exception as e:
+        print(f"❌ Error durante la evaluación: {e}")
+        sys.exit(1)
+
+    print_report(report)
+    print(f"💾 Predicciones guardadas en {report['predictions_csv']}")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Reporte guardado en {args.report}")
+
+    if args.min_accuracy is not None:
+        if report['accuracy'] is None or report['accuracy'] < args.min_accuracy:
+            print(f"❌ Precisión por debajo del mínimo requerido ({args.min_accuracy})")
+            sys.exit(2)
+        print(f"✅ Precisión por encima del mínimo requerido ({args.min_accuracy})")
@@ -0,0 +1,121 @@
+"""
+Caché de características del backbone convolucional de SimpleCNN
+
+Guarda la salida aplanada de `model.conv` para cada imagen, indexada por el hash del
+contenido de la imagen y el hash de los pesos del backbone. Con el backbone congelado,
+un reentrenamiento solo tiene que entrenar la cabeza `fc` sobre las características
+cacheadas, sin volver a decodificar ni pasar las imágenes por las convoluciones.
+"""
+import hashlib
+import os
+from pathlib import Path
+
+import torch
+from torch.utils.data import DataLoader
+
+from predict import device
+from evaluate import EvalDataset, resolve_image_path
+from metrics import FEATURE_CACHE_LOOKUPS
+
+CACHE_DIR = Path("artifacts/feature_cache")
+
+
+def file_hash(path: str) -> str:
+    """Hash SHA-256 del contenido de un archivo"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def backbone_hash(model) -> str:
+    """Hash de los pesos de model.conv (cambia si el backbone se reentrena)"""
+    h = hashlib.sha256()
+    for name, tensor in sorted(model.conv.state_dict().items()):
+        h.update(name.encode())
+        h.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return h.hexdigest()
+
+
+class FeatureCache:
+    """
+    Caché persistente de características para un backbone concreto
+
+    Se guarda en un único archivo por backbone (artifacts/feature_cache/<hash>.pt) con:
+        - paths: {ruta: (tamaño, mtime_ns, hash)} para no rehashear archivos sin cambios
+        - features: {hash de imagen: tensor float16}
+    """
+    def __init__(self, model, cache_dir: Path = CACHE_DIR):
+        self.model = model
+        self.cache_dir = Path(cache_dir)
+        self.backbone = backbone_hash(model)
+        self.path = self.cache_dir / f"{self.backbone[:16]}.pt"
+        self.paths = {}
+        self.features = {}
+        self.hits = 0
+        self.misses = 0
+        if self.path.exists():
+            try:
+                data = torch.load(self.path, map_location="cpu")
+                self.paths = data.get("paths", {})
+                self.features = data.get("features", {})
+            except Exception as e:
+                print(f"⚠️  Caché de características ilegible ({e}), se regenera")
+
+    def _image_hash(self, image_path: str) -> str:
+        st = os.stat(image_path)
+        cached = self.paths.get(image_path)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        digest = file_hash(image_path)
+        self.paths[image_path] = (st.st_size, st.st_mtime_ns, digest)
+        return digest
+
+    def get_features(self, image_paths, batch_size: int = 64, workers: int = 0):
+        """
+        Devuelve las características de cada imagen, calculando solo las que faltan
+
+        Returns:
+            (tensor float32 (N, feat), índices de las imágenes válidas dentro de image_paths)
+        """
+        hashes = []
+        for p in image_paths:
+            try:
+                hashes.append(self._image_hash(resolve_image_path(p)))
+            except OSError:
+                hashes.append(None)
+
+        missing = [i for i, h in enumerate(hashes) if h is not None and h not in self.features]
+        self.hits = sum(1 for h in hashes if h is not None) - len(missing)
+        self.misses = len(missing)
+        FEATURE_CACHE_LOOKUPS.labels(result="hit").inc(self.hits)
+        FEATURE_CACHE_LOOKUPS.labels(result="miss").inc(self.misses)
+
+        if missing:
+            rows = [{"image_path": image_paths[i], "label": -1} for i in missing]
+            loader = DataLoader(EvalDataset(rows), batch_size=batch_size, shuffle=False, num_workers=workers)
+            self.model.eval()
+            with torch.no_grad():
+                for batch, idxs, oks in loader:
+                    feats = self.model.conv(batch.to(device)).flatten(1).cpu().half()
+                    for idx, ok, feat in zip(idxs.tolist(), oks.tolist(), feats):
+                        if ok:
+                            self.features[hashes[missing[idx]]] = feat.clone()
+                        else:
+                            hashes[missing[idx]] = None
+
+        valid = [i for i, h in enumerate(hashes) if h is not None and h in self.features]
+        if not valid:
+            return torch.empty(0), []
+        return torch.stack([self.features[hashes[i]] for i in valid]).float(), valid
+
+    def save(self):
+        """Guarda la caché de forma atómica y elimina cachés de backbones anteriores"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        torch.save({"backbone": self.backbone, "paths": self.paths, "features": self.features}, tmp_path)
+        os.replace(tmp_path, self.path)
+        for old in self.cache_dir.glob("*.pt"):
+            if old != self.path:
+                old.unlink()
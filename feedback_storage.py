@@ -1,12 +1,26 @@
 """
 Sistema de almacenamiento de feedback y datos para reentrenamiento
+
+El feedback automático de /api/v1/images/process se encola (enqueue_feedback) y un hilo
+lo escribe en lotes al final de feedback.csv cada FEEDBACK_FLUSH_EVERY registros o cada
+FEEDBACK_FLUSH_INTERVAL_MS. FEEDBACK_FSYNC=batch (por defecto) hace fsync tras cada lote;
+FEEDBACK_FSYNC=none deja la escritura en la caché del sistema operativo. La cola se vacía
+antes de cada lectura o escritura de este módulo y al terminar el proceso (atexit).
 """
+import atexit
+import csv
+import fcntl
+import io
 import json
 import os
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
 from typing import List, Dict, Optional
 
+from metrics import FEEDBACK_FLUSH_SECONDS, observe_duration
+
 # Importar pandas - crítico para el funcionamiento
 import sys
 try:
@@ -22,11 +36,217 @@ except ImportError as e:
 FEEDBACK_DIR = Path("feedback_data")
 FEEDBACK_CSV = FEEDBACK_DIR / "feedback.csv"
 IMAGES_DIR = FEEDBACK_DIR / "images"
+RETRAIN_STATE_JSON = FEEDBACK_DIR / "retrain_state.json"
+LOCK_PATH = FEEDBACK_DIR / ".feedback.lock"
+LABEL_NAMES_ES = {0: "sano", 1: "enfermo"}
+FEEDBACK_COLUMNS = [
+    "timestamp", "image_path", "predicted_label", "predicted_label_name", "confidence",
+    "corrected_label", "corrected_label_name", "user_feedback", "needs_review", "phash",
+]
+FEEDBACK_FLUSH_EVERY = int(os.environ.get("FEEDBACK_FLUSH_EVERY", "50"))
+FEEDBACK_FLUSH_INTERVAL_MS = float(os.environ.get("FEEDBACK_FLUSH_INTERVAL_MS", "500"))
+FEEDBACK_FSYNC = os.environ.get("FEEDBACK_FSYNC", "batch")  # batch | none
 
 # Crear directorios si no existen
 FEEDBACK_DIR.mkdir(exist_ok=True)
 IMAGES_DIR.mkdir(exist_ok=True)
 
+_lock = threading.RLock()
+_lock_depth = 0
+
+
+@contextmanager
+def _feedback_lock():
+    """Serializa el acceso a feedback.csv entre hilos y entre workers (reentrante)"""
+    global _lock_depth
+    with _lock:
+        if _lock_depth == 0:
+            lock_file = open(LOCK_PATH, "w")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        _lock_depth += 1
+        try:
+            yield
+        finally:
+            _lock_depth -= 1
+            if _lock_depth == 0:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+
+def _append_rows(rows: List[Dict], fsync: bool) -> None:
+    """Añade filas al final de feedback.csv (respetando el orden de columnas de la cabecera existente)"""
+    columns = FEEDBACK_COLUMNS
+    exists = FEEDBACK_CSV.exists() and FEEDBACK_CSV.stat().st_size > 0
+    if exists:
+        with open(FEEDBACK_CSV, newline="", encoding="utf-8") as f:
+            columns = next(csv.reader(f), None) or FEEDBACK_COLUMNS
+        missing = [c for c in FEEDBACK_COLUMNS if c not in columns]
+        if missing:
+            columns = _add_columns(columns + missing)
+    with open(FEEDBACK_CSV, "a", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        if not exists:
+            writer.writeheader()
+        writer.writerows(rows)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+
+
+def _add_columns(columns: List[str]) -> List[str]:
+    """Reescribe feedback.csv con columnas nuevas (vacías en las filas existentes), una sola vez"""
+    tmp_path = FEEDBACK_CSV.with_suffix(".tmp")
+    with open(FEEDBACK_CSV, newline="", encoding="utf-8") as src, \
+            open(tmp_path, "w", newline="", encoding="utf-8") as dst:
+        writer = csv.DictWriter(dst, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(csv.DictReader(src))
+    os.replace(tmp_path, FEEDBACK_CSV)
+    return columns
+
+
+class FeedbackWriter:
+    """Cola write-behind: los registros se escriben en lotes desde un hilo en segundo plano"""
+
+    def __init__(self, flush_every: int = FEEDBACK_FLUSH_EVERY, flush_interval_ms: float = FEEDBACK_FLUSH_INTERVAL_MS,
+                 fsync: str = FEEDBACK_FSYNC):
+        self.flush_every = max(1, flush_every)
+        self.interval = flush_interval_ms / 1000
+        self.fsync = fsync == "batch"
+        self.pending: List[Dict] = []
+        self.cond = threading.Condition()
+        self.flush_lock = threading.Lock()  # mantiene el orden de los lotes
+        self.thread = None
+
+    def enqueue(self, record: Dict) -> None:
+        with self.cond:
+            self.pending.append(record)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="feedback-writer", daemon=True)
+                self.thread.start()
+            if len(self.pending) >= self.flush_every:
+                self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: len(self.pending) >= self.flush_every, timeout=self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️  Error escribiendo feedback (se reintentará): {e}")
+
+    def flush(self) -> int:
+        """Escribe los registros pendientes; devuelve cuántos se escribieron"""
+        with self.flush_lock:
+            with self.cond:
+                batch, self.pending = self.pending, []
+            if not batch:
+                return 0
+            try:
+                with _feedback_lock(), observe_duration(FEEDBACK_FLUSH_SECONDS):
+                    _append_rows(batch, self.fsync)
+            except Exception:
+                # Devolver el lote a la cola para no perderlo
+                with self.cond:
+                    self.pending[:0] = batch
+                raise
+            return len(batch)
+
+
+_writer = FeedbackWriter()
+
+
+def flush_feedback() -> int:
+    """Escribe en disco el feedback encolado; devuelve el número de registros escritos"""
+    return _writer.flush()
+
+
+def pending_feedback() -> int:
+    """Registros encolados pendientes de escribir"""
+    return len(_writer.pending)
+
+
+_row_count_cache = {"inode": None, "offset": 0, "rows": 0}
+
+
+def _persisted_row_count() -> int:
+    """
+    Filas escritas en feedback.csv, leyendo solo lo añadido desde la última llamada
+
+    feedback.csv solo crece por el final salvo cuando se reescribe con os.replace
+    (correcciones, columnas nuevas), que cambia el inode: entonces se vuelve a contar entero.
+    """
+    cache = _row_count_cache
+    with _feedback_lock():
+        try:
+            st = FEEDBACK_CSV.stat()
+        except FileNotFoundError:
+            return 0
+        if cache["inode"] != st.st_ino or cache["offset"] > st.st_size:
+            cache.update(inode=st.st_ino, offset=0, rows=0)
+        if cache["offset"] < st.st_size:
+            with open(FEEDBACK_CSV, "rb") as f:
+                f.seek(cache["offset"])
+                chunk = f.read(st.st_size - cache["offset"]).decode("utf-8")
+            rows = sum(1 for _ in csv.reader(io.StringIO(chunk, newline="")))
+            if cache["offset"] == 0:
+                rows -= 1  # cabecera
+            cache["offset"] = st.st_size
+            cache["rows"] += rows
+        return max(cache["rows"], 0)
+
+
+def feedback_count() -> int:
+    """
+    Registros de feedback (escritos + encolados en este proceso) sin vaciar la cola
+    ni leer el CSV con pandas: es lo bastante barato para llamarlo en cada petición
+    """
+    with _writer.flush_lock:
+        return _persisted_row_count() + pending_feedback()
+
+
+atexit.register(flush_feedback)
+
+
+def _feedback_record(image_path, predicted_label, predicted_label_name, confidence,
+                     corrected_label=None, corrected_label_name=None, user_feedback=None, phash=None) -> Dict:
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "image_path": str(image_path),
+        "predicted_label": predicted_label,
+        "predicted_label_name": predicted_label_name,
+        "confidence": confidence,
+        "corrected_label": corrected_label,
+        "corrected_label_name": corrected_label_name,
+        "user_feedback": user_feedback,
+        "needs_review": corrected_label is not None,
+        "phash": phash
+    }
+
+
+def enqueue_feedback(
+    image_path: str,
+    predicted_label: int,
+    predicted_label_name: str,
+    confidence: float,
+    phash: Optional[str] = None,
+) -> Dict:
+    """
+    Encola el feedback de una predicción sin esperar a que se escriba en disco
+    
+    Args:
+        phash: Hash perceptual de la imagen (perceptual_hash.dhash_file), para descartar
+            casi duplicados al reentrenar
+    
+    Returns:
+        Dict con información del feedback encolado
+    """
+    feedback_data = _feedback_record(image_path, predicted_label, predicted_label_name, confidence, phash=phash)
+    _writer.enqueue(feedback_data)
+    return feedback_data
+
+
 def save_feedback(
     image_path: str,
     predicted_label: int,
@@ -34,7 +254,8 @@ def save_feedback(
     confidence: float,
     corrected_label: Optional[int] = None,
     corrected_label_name: Optional[str] = None,
-    user_feedback: Optional[str] = None
+    user_feedback: Optional[str] = None,
+    phash: Optional[str] = None
 ) -> Dict:
     """
     Guarda feedback de una imagen procesada
@@ -47,35 +268,87 @@ def save_feedback(
         corrected_label: Label corregido por el usuario (opcional)
         corrected_label_name: Nombre del label corregido (opcional)
         user_feedback: Comentario del usuario (opcional)
+        phash: Hash perceptual de la imagen (opcional)
     
     Returns:
         Dict con información del feedback guardado
     """
-    feedback_data = {
-        "timestamp": datetime.now().isoformat(),
-        "image_path": str(image_path),
-        "predicted_label": predicted_label,
-        "predicted_label_name": predicted_label_name,
-        "confidence": confidence,
-        "corrected_label": corrected_label,
-        "corrected_label_name": corrected_label_name,
-        "user_feedback": user_feedback,
-        "needs_review": corrected_label is not None
-    }
+    feedback_data = _feedback_record(image_path, predicted_label, predicted_label_name, confidence,
+                                     corrected_label, corrected_label_name, user_feedback, phash)
     
-    # Guardar en CSV
-    df = pd.DataFrame([feedback_data])
+    # Escritura inmediata al final del CSV (después del feedback encolado, para mantener el orden)
+    flush_feedback()
+    with _feedback_lock():
+        _append_rows([feedback_data], fsync=FEEDBACK_FSYNC == "batch")
     
-    if FEEDBACK_CSV.exists():
-        existing_df = pd.read_csv(FEEDBACK_CSV)
-        df = pd.concat([existing_df, df], ignore_index=True)
+    return feedback_data
+
+def save_corrections(corrections: List[Dict]) -> List[Dict]:
+    """
+    Aplica varias correcciones en una sola pasada sobre feedback.csv
     
-    df.to_csv(FEEDBACK_CSV, index=False)
+    Lee el CSV una vez, busca la última predicción de cada imagen y añade todas las
+    correcciones en una única escritura atómica (archivo temporal + os.replace): o se
+    guardan todas las correcciones válidas o ninguna.
     
-    return feedback_data
+    Args:
+        corrections: Dicts con image_path, corrected_label y opcionalmente
+            corrected_label_name y user_feedback
+    
+    Returns:
+        Un resultado por corrección, en el mismo orden: {"image_path", "success", "error"}
+    """
+    flush_feedback()
+    with _feedback_lock():
+        return _save_corrections(corrections)
+
+def _save_corrections(corrections: List[Dict]) -> List[Dict]:
+    df = _read_feedback()
+    # Índice de la última entrada de cada imagen
+    last_index = {} if df.empty else {path: i for i, path in enumerate(df['image_path'])}
+    
+    rows = []
+    results = []
+    now = datetime.now().isoformat()
+    for correction in corrections:
+        image_path = str(correction["image_path"])
+        if image_path not in last_index:
+            results.append({"image_path": image_path, "success": False,
+                            "error": "Imagen no encontrada en el historial"})
+            continue
+        last_entry = df.iloc[last_index[image_path]]
+        corrected_label = int(correction["corrected_label"])
+        rows.append({
+            "timestamp": now,
+            "image_path": image_path,
+            "predicted_label": int(last_entry['predicted_label']),
+            "predicted_label_name": last_entry['predicted_label_name'],
+            "confidence": float(last_entry['confidence']),
+            "corrected_label": corrected_label,
+            "corrected_label_name": correction.get("corrected_label_name") or LABEL_NAMES_ES.get(corrected_label, ""),
+            "user_feedback": correction.get("user_feedback"),
+            "needs_review": True,
+            "phash": last_entry.get('phash')
+        })
+        results.append({"image_path": image_path, "success": True, "error": None})
+    
+    if rows:
+        df = pd.concat([df, pd.DataFrame(rows)], ignore_index=True)
+        tmp_path = FEEDBACK_CSV.with_suffix(".tmp")
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, FEEDBACK_CSV)
+    
+    return results
 
 def get_feedback_data() -> pd.DataFrame:
-    """Obtiene todos los datos de feedback"""
+    """Obtiene todos los datos de feedback (incluido el encolado en este proceso)"""
+    try:
+        flush_feedback()
+    except Exception as e:
+        print(f"⚠️  No se pudo escribir el feedback encolado: {e}")
+    return _read_feedback()
+
+def _read_feedback() -> pd.DataFrame:
     if FEEDBACK_CSV.exists():
         try:
             df = pd.read_csv(FEEDBACK_CSV)
@@ -88,27 +361,104 @@ def get_feedback_data() -> pd.DataFrame:
             return pd.DataFrame()
     return pd.DataFrame()
 
-def get_training_data() -> pd.DataFrame:
+def get_training_data(since: Optional[str] = None, since_row: Optional[int] = None,
+                      until_row: Optional[int] = None) -> pd.DataFrame:
     """
     Obtiene datos listos para entrenamiento:
     - Usa labels corregidos si existen
     - Usa labels predichos si no hay corrección
+    
+    Args:
+        since: Si se indica (timestamp ISO), solo devuelve feedback posterior (estado antiguo
+            de retrain_state.json, sin marca de agua por filas)
+        since_row: Si se indica, solo devuelve las filas de feedback.csv desde esta posición
+            (tiene prioridad sobre since)
+        until_row: Si se indica, ignora las filas desde esta posición (las escritas después
+            de tomar la instantánea con feedback_row_count)
+    
+    Returns:
+        DataFrame con image_path, label, timestamp, corrected (bool), phash y feedback_row
+        (posición de la fila en feedback.csv)
     """
     df = get_feedback_data()
     
     if df.empty:
         return pd.DataFrame()
     
+    df['feedback_row'] = range(len(df))
+    if since_row is not None and since_row > len(df):
+        print(f"⚠️  feedback.csv tiene {len(df)} filas y la marca de agua es {since_row}: "
+              "se usa todo el feedback")
+        since_row = 0
+    if until_row is not None:
+        df = df.iloc[:until_row]
+    if since_row is not None:
+        df = df.iloc[since_row:]
+    elif since:
+        df = df[df['timestamp'].astype(str) > since]
+    if df.empty:
+        return pd.DataFrame()
+    
     # Crear columna 'label' que use corrección si existe, sino predicción
     df['label'] = df.apply(
         lambda row: row['corrected_label'] if pd.notna(row['corrected_label']) else row['predicted_label'],
         axis=1
     )
     
+    df['corrected'] = df['corrected_label'].notna()
+    if 'phash' not in df.columns:
+        df['phash'] = None
+    
     # Filtrar solo las que tienen imagen válida
     df = df[df['image_path'].notna()]
     
-    return df[['image_path', 'label', 'timestamp']].copy()
+    return df[['image_path', 'label', 'timestamp', 'corrected', 'phash', 'feedback_row']].copy()
+
+def feedback_row_count() -> int:
+    """
+    Filas escritas en feedback.csv (tras vaciar la cola de este proceso)
+
+    Es la instantánea que delimita un reentrenamiento: feedback.csv solo crece por el final,
+    así que las filas que otros workers escriban después (aunque tengan timestamps
+    anteriores) quedan a partir de esta posición y entran en el siguiente reentrenamiento.
+    """
+    flush_feedback()
+    with _feedback_lock():
+        return len(_read_feedback())
+
+def _read_retrain_state() -> Dict:
+    if not RETRAIN_STATE_JSON.exists():
+        return {}
+    try:
+        with open(RETRAIN_STATE_JSON, encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"⚠️  Error leyendo {RETRAIN_STATE_JSON}: {e}")
+        return {}
+
+def get_last_retrain_row() -> Optional[int]:
+    """Filas de feedback.csv ya usadas en el último reentrenamiento exitoso (marca de agua)"""
+    rows = _read_retrain_state().get("feedback_rows")
+    return int(rows) if rows is not None else None
+
+def get_last_retrain_timestamp() -> Optional[str]:
+    """
+    Timestamp del feedback más reciente usado en el último reentrenamiento exitoso
+
+    Solo para estados anteriores a la marca de agua por filas (ver get_last_retrain_row)
+    """
+    return _read_retrain_state().get("last_feedback_timestamp")
+
+def mark_retrained(feedback_rows: int) -> None:
+    """Registra hasta qué fila de feedback.csv se ha reentrenado el modelo"""
+    state = {
+        "feedback_rows": int(feedback_rows),
+        "retrained_at": datetime.now().isoformat()
+    }
+    tmp_path = RETRAIN_STATE_JSON.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, RETRAIN_STATE_JSON)
 
 def copy_image_to_training(image_path: str, label: int) -> str:
     """
@@ -1,5 +1,6 @@
 import axios from "axios";
 import type { ProcessImagesResponse } from "../types";
+import type { PreparedUpload } from "./resizeImages";
 
 const API_URL = import.meta.env.VITE_API_URL || "http://localhost:8000";
 
@@ -8,13 +9,37 @@ const apiClient = axios.create({
   timeout: 300000, // 5 minutos para procesamiento de imágenes
 });
 
+// Las subidas se reparten en lotes enviados en paralelo (acotado) en vez de un único
+// multipart con todos los archivos; todos los lotes escriben en el mismo CSV (batch_id)
+const UPLOAD_BATCH_SIZE = Math.max(
+  1,
+  Number(import.meta.env.VITE_UPLOAD_BATCH_SIZE ?? 20)
+);
+const UPLOAD_CONCURRENCY = Math.max(
+  1,
+  Number(import.meta.env.VITE_UPLOAD_CONCURRENCY ?? 3)
+);
+
+function newBatchId(): string {
+  if (typeof crypto !== "undefined" && "randomUUID" in crypto) {
+    return crypto.randomUUID();
+  }
+  return `${Date.now()}_${Math.random().toString(36).slice(2)}`;
+}
+
 export async function processImages(
-  files: File[]
+  uploads: PreparedUpload[],
+  batchId?: string
 ): Promise<ProcessImagesResponse> {
   const formData = new FormData();
-  files.forEach((file) => {
+  uploads.forEach(({ file, resized }) => {
     formData.append("files", file);
+    // Un valor por archivo, en el mismo orden (columna source del CSV)
+    formData.append("client_resized", String(resized));
   });
+  if (batchId) {
+    formData.append("batch_id", batchId);
+  }
 
   const response = await apiClient.post<ProcessImagesResponse>(
     "/api/v1/images/process",
@@ -29,6 +54,71 @@ export async function processImages(
   return response.data;
 }
 
+/**
+ * Sube las imágenes en lotes de UPLOAD_BATCH_SIZE con hasta UPLOAD_CONCURRENCY peticiones
+ * a la vez y combina las respuestas. Un lote que falla no cancela los demás: sus
+ * archivos se notifican con onBatch(start, end, false) y el error se añade a errors.
+ */
+export async function processImagesInBatches(
+  uploads: PreparedUpload[],
+  onBatch?: (start: number, end: number, ok: boolean) => void
+): Promise<ProcessImagesResponse> {
+  const batchId = newBatchId();
+  const starts: number[] = [];
+  for (let i = 0; i < uploads.length; i += UPLOAD_BATCH_SIZE) {
+    starts.push(i);
+  }
+  const responses: (ProcessImagesResponse | null)[] = starts.map(() => null);
+  const errors: string[] = [];
+  let lastError: unknown = null;
+
+  let next = 0;
+  const runUploader = async () => {
+    while (next < starts.length) {
+      const index = next++;
+      const start = starts[index];
+      const end = Math.min(start + UPLOAD_BATCH_SIZE, uploads.length);
+      try {
+        responses[index] = await processImages(
+          uploads.slice(start, end),
+          batchId
+        );
+        onBatch?.(start, end, true);
+      } catch (error) {
+        lastError = error;
+        const message =
+          error instanceof Error ? error.message : "Error al procesar";
+        errors.push(`Imágenes ${start + 1}-${end}: ${message}`);
+        onBatch?.(start, end, false);
+      }
+    }
+  };
+
+  await Promise.all(
+    Array.from(
+      { length: Math.min(UPLOAD_CONCURRENCY, starts.length) },
+      runUploader
+    )
+  );
+
+  const succeeded = responses.filter(
+    (r): r is ProcessImagesResponse => r !== null
+  );
+  if (succeeded.length === 0) {
+    throw lastError ?? new Error("Error al procesar las imágenes");
+  }
+  const processedFiles = succeeded.flatMap((r) => r.processed_files);
+  errors.unshift(...succeeded.flatMap((r) => r.errors ?? []));
+  return {
+    success: true,
+    message: `Se procesaron ${processedFiles.length} imágenes`,
+    processed_files: processedFiles,
+    errors: errors.length > 0 ? errors : undefined,
+    csv_url: succeeded[0].csv_url,
+    csv_filename: succeeded[0].csv_filename,
+  };
+}
+
 export async function downloadFile(filename: string): Promise<void> {
   const response = await apiClient.get(`/api/v1/files/download/${filename}`, {
     responseType: "blob",
@@ -52,13 +142,125 @@ export interface CorrectionRequest {
   user_feedback?: string;
 }
 
-export async function correctClassification(
-  correction: CorrectionRequest
-): Promise<{ success: boolean; message: string }> {
-  const response = await apiClient.post("/api/v1/feedback/correct", correction);
+export interface CorrectionResult {
+  image_path: string;
+  success: boolean;
+  error: string | null;
+}
+
+export interface BulkCorrectionResponse {
+  success: boolean;
+  applied: number;
+  failed: number;
+  results: CorrectionResult[];
+}
+
+export async function correctClassifications(
+  corrections: CorrectionRequest[]
+): Promise<BulkCorrectionResponse> {
+  const response = await apiClient.post<BulkCorrectionResponse>(
+    "/api/v1/feedback/correct/bulk",
+    { corrections }
+  );
   return response.data;
 }
 
+// Las correcciones hechas en poco tiempo se agrupan en una sola petición bulk
+const CORRECTION_BATCH_DELAY_MS = 1500;
+const CORRECTION_BATCH_MAX = 100;
+// Al cerrar la pestaña se envían con fetch keepalive, cuyo cuerpo está limitado a 64 KB
+const CORRECTION_KEEPALIVE_MAX = 50;
+
+interface PendingCorrection {
+  correction: CorrectionRequest;
+  resolve: (result: CorrectionResult) => void;
+  reject: (error: unknown) => void;
+}
+
+let pendingCorrections: PendingCorrection[] = [];
+let correctionTimer: ReturnType<typeof setTimeout> | null = null;
+
+function takePendingCorrections(): PendingCorrection[] {
+  if (correctionTimer) {
+    clearTimeout(correctionTimer);
+    correctionTimer = null;
+  }
+  const batch = pendingCorrections;
+  pendingCorrections = [];
+  return batch;
+}
+
+function settleCorrections(
+  batch: PendingCorrection[],
+  results: CorrectionResult[]
+): void {
+  batch.forEach((p, i) => {
+    const result = results[i];
+    if (result?.success) {
+      p.resolve(result);
+    } else {
+      p.reject(new Error(result?.error || "Error al guardar la corrección"));
+    }
+  });
+}
+
+async function flushCorrections(): Promise<void> {
+  const batch = takePendingCorrections();
+  if (batch.length === 0) return;
+
+  try {
+    const { results } = await correctClassifications(
+      batch.map((p) => p.correction)
+    );
+    settleCorrections(batch, results);
+  } catch (error) {
+    batch.forEach((p) => p.reject(error));
+  }
+}
+
+/**
+ * Envía las correcciones pendientes cuando la pestaña se oculta o se cierra: el modal
+ * ya se cerró, así que sin esto se perderían al recargar o cerrar la página. fetch con
+ * keepalive (a diferencia de axios) sigue en curso aunque la página se descargue.
+ */
+function flushCorrectionsOnExit(): void {
+  const batch = takePendingCorrections();
+  for (let i = 0; i < batch.length; i += CORRECTION_KEEPALIVE_MAX) {
+    const chunk = batch.slice(i, i + CORRECTION_KEEPALIVE_MAX);
+    fetch(`${API_URL}/api/v1/feedback/correct/bulk`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ corrections: chunk.map((p) => p.correction) }),
+      keepalive: true,
+    })
+      .then((response) => response.json() as Promise<BulkCorrectionResponse>)
+      .then(({ results }) => settleCorrections(chunk, results))
+      .catch((error) => chunk.forEach((p) => p.reject(error)));
+  }
+}
+
+if (typeof window !== "undefined") {
+  window.addEventListener("pagehide", flushCorrectionsOnExit);
+  document.addEventListener("visibilitychange", () => {
+    if (document.visibilityState === "hidden") flushCorrectionsOnExit();
+  });
+}
+
+export function queueCorrection(
+  correction: CorrectionRequest
+): Promise<CorrectionResult> {
+  return new Promise((resolve, reject) => {
+    pendingCorrections.push({ correction, resolve, reject });
+    if (pendingCorrections.length >= CORRECTION_BATCH_MAX) {
+      void flushCorrections();
+    } else if (!correctionTimer) {
+      correctionTimer = setTimeout(() => {
+        void flushCorrections();
+      }, CORRECTION_BATCH_DELAY_MS);
+    }
+  });
+}
+
 export interface FeedbackStats {
   total_images: number;
   corrections: number;
@@ -93,6 +295,8 @@ export interface RetrainingStatus {
   error: string | null;
   started_at: string | null;
   completed_at: string | null;
+  paused?: boolean; // Pausado mientras la API tiene mucha carga
+  paused_seconds?: number;
 }
 
 export async function getRetrainingStatus(): Promise<RetrainingStatus> {
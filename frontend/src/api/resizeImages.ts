@@ -0,0 +1,89 @@
+import type {
+  ResizeRequest,
+  ResizeResponse,
+} from "../workers/resizeImage.worker";
+
+// El modelo trabaja con 128×128: reducir antes de subir ahorra ancho de banda y
+// decodificación en el servidor. VITE_MAX_UPLOAD_EDGE=0 desactiva la reducción.
+const MAX_UPLOAD_EDGE = Number(import.meta.env.VITE_MAX_UPLOAD_EDGE ?? 512);
+const UPLOAD_QUALITY = Number(import.meta.env.VITE_UPLOAD_QUALITY ?? 0.9);
+const RESIZE_CONCURRENCY = Math.max(
+  1,
+  Number(
+    import.meta.env.VITE_RESIZE_CONCURRENCY ??
+      Math.min(4, navigator.hardwareConcurrency || 2)
+  )
+);
+
+export interface PreparedUpload {
+  file: File;
+  resized: boolean; // true si se redujo en el navegador
+}
+
+function resizeSupported(): boolean {
+  return (
+    MAX_UPLOAD_EDGE > 0 &&
+    typeof Worker !== "undefined" &&
+    typeof OffscreenCanvas !== "undefined" &&
+    typeof createImageBitmap !== "undefined"
+  );
+}
+
+function jpegName(name: string): string {
+  const dot = name.lastIndexOf(".");
+  return `${dot > 0 ? name.slice(0, dot) : name}.jpg`;
+}
+
+/**
+ * Reduce las imágenes a MAX_UPLOAD_EDGE px de lado mayor en un pool de Web Workers
+ * (RESIZE_CONCURRENCY imágenes a la vez). Si el navegador no soporta OffscreenCanvas o
+ * una imagen falla, se sube el archivo original.
+ */
+export async function prepareUploads(files: File[]): Promise<PreparedUpload[]> {
+  const results: PreparedUpload[] = files.map((file) => ({
+    file,
+    resized: false,
+  }));
+  if (!resizeSupported() || files.length === 0) return results;
+
+  let next = 0;
+  const runWorker = async () => {
+    const worker = new Worker(
+      new URL("../workers/resizeImage.worker.ts", import.meta.url),
+      { type: "module" }
+    );
+    try {
+      while (next < files.length) {
+        const id = next++;
+        const response = await new Promise<ResizeResponse>((resolve) => {
+          worker.onmessage = (event: MessageEvent<ResizeResponse>) =>
+            resolve(event.data);
+          worker.onerror = () =>
+            resolve({ id, resized: false, error: "Error en el worker" });
+          const request: ResizeRequest = {
+            id,
+            file: files[id],
+            maxEdge: MAX_UPLOAD_EDGE,
+            quality: UPLOAD_QUALITY,
+          };
+          worker.postMessage(request);
+        });
+        if (response.resized && response.blob) {
+          results[id] = {
+            file: new File([response.blob], jpegName(files[id].name), {
+              type: "image/jpeg",
+            }),
+            resized: true,
+          };
+        }
+      }
+    } finally {
+      worker.terminate();
+    }
+  };
+
+  await Promise.all(
+    Array.from({ length: Math.min(RESIZE_CONCURRENCY, files.length) }, runWorker)
+  );
+  return results;
+}
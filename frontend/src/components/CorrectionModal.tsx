@@ -1,9 +1,6 @@
 import { useState } from "react";
 import { X, AlertCircle } from "lucide-react";
-import {
-  correctClassification,
-  type CorrectionRequest,
-} from "../api/imageProcessor";
+import { queueCorrection, type CorrectionRequest } from "../api/imageProcessor";
 import { toast } from "sonner";
 
 interface CorrectionModalProps {
@@ -27,40 +24,41 @@ export function CorrectionModal({
 }: CorrectionModalProps) {
   const [selectedLabel, setSelectedLabel] = useState<number | null>(null);
   const [feedback, setFeedback] = useState("");
-  const [isSubmitting, setIsSubmitting] = useState(false);
 
   if (!isOpen) return null;
 
-  const handleSubmit = async () => {
+  const handleSubmit = () => {
     if (selectedLabel === null) {
       toast.error("Por favor selecciona la clasificación correcta");
       return;
     }
 
-    setIsSubmitting(true);
-    try {
-      const correction: CorrectionRequest = {
-        image_path: imagePath,
-        corrected_label: selectedLabel,
-        corrected_label_name: selectedLabel === 0 ? "sano" : "enfermo",
-        user_feedback: feedback || undefined,
-      };
+    const correction: CorrectionRequest = {
+      image_path: imagePath,
+      corrected_label: selectedLabel,
+      corrected_label_name: selectedLabel === 0 ? "sano" : "enfermo",
+      user_feedback: feedback || undefined,
+    };
 
-      await correctClassification(correction);
-      toast.success(
-        "Corrección guardada. El modelo se mejorará con este feedback."
-      );
-      onCorrected();
-      onClose();
-      setSelectedLabel(null);
-      setFeedback("");
-    } catch (error: any) {
-      toast.error(
-        error.response?.data?.detail || "Error al guardar la corrección"
-      );
-    } finally {
-      setIsSubmitting(false);
-    }
+    // No se espera la respuesta: las correcciones hechas seguidas se envían juntas
+    // en una sola petición bulk y el resultado se notifica al llegar
+    queueCorrection(correction)
+      .then(() => {
+        toast.success(
+          `Corrección de ${filename} guardada. El modelo se mejorará con este feedback.`
+        );
+        onCorrected();
+      })
+      .catch((error: any) => {
+        toast.error(
+          error.response?.data?.detail ||
+            error.message ||
+            "Error al guardar la corrección"
+        );
+      });
+    onClose();
+    setSelectedLabel(null);
+    setFeedback("");
   };
 
   return (
@@ -150,17 +148,16 @@ export function CorrectionModal({
           <div className="flex gap-3 pt-2">
             <button
               onClick={onClose}
-              className="flex-1 px-4 py-2 border rounded-md hover:bg-gray-50 disabled:opacity-50"
-              disabled={isSubmitting}
+              className="flex-1 px-4 py-2 border rounded-md hover:bg-gray-50"
             >
               Cancelar
             </button>
             <button
               onClick={handleSubmit}
-              disabled={isSubmitting || selectedLabel === null}
+              disabled={selectedLabel === null}
               className="flex-1 px-4 py-2 bg-blue-600 text-white rounded-md hover:bg-blue-700 disabled:opacity-50"
             >
-              {isSubmitting ? "Guardando..." : "Guardar Corrección"}
+              Guardar Corrección
             </button>
           </div>
         </div>
@@ -1,5 +1,9 @@
 import { useState, useCallback } from "react";
-import { processImages, downloadFile } from "../api/imageProcessor";
+import {
+  processImagesInBatches,
+  downloadFile,
+} from "../api/imageProcessor";
+import { prepareUploads } from "../api/resizeImages";
 import type { ImageFile, ProcessImagesResponse } from "../types";
 import { toast } from "sonner";
 
@@ -53,11 +57,20 @@ export function useImageProcessor() {
     );
 
     try {
-      const files = images.map((img) => img.file);
-      const response = await processImages(files);
-
-      setImages((prev) =>
-        prev.map((img) => ({ ...img, status: "processed" as const }))
+      // Reducir en el navegador antes de subir (Web Workers + OffscreenCanvas)
+      const uploads = await prepareUploads(images.map((img) => img.file));
+      const response = await processImagesInBatches(
+        uploads,
+        (start, end, ok) =>
+          setImages((prev) =>
+            prev.map((img, i) =>
+              i >= start && i < end
+                ? ok
+                  ? { ...img, status: "processed" as const }
+                  : { ...img, status: "error" as const, error: "Error al procesar" }
+                : img
+            )
+          )
       );
 
       setResult(response);
@@ -10,6 +10,7 @@ export interface Classification {
   label_name: string; // "healthy" o "sick"
   label_name_es: string; // "sano" o "enfermo"
   confidence: number; // 0-1
+  stage?: "fast" | "full"; // Etapa de la cascada que decidió la clasificación
   error?: string;
 }
 
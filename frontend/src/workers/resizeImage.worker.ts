@@ -0,0 +1,61 @@
+// Reduce una imagen en un Web Worker con OffscreenCanvas y la re-codifica como JPEG,
+// sin bloquear el hilo principal
+
+export interface ResizeRequest {
+  id: number;
+  file: File;
+  maxEdge: number;
+  quality: number;
+}
+
+export interface ResizeResponse {
+  id: number;
+  blob?: Blob;
+  resized: boolean;
+  error?: string;
+}
+
+self.onmessage = async (event: MessageEvent<ResizeRequest>) => {
+  const { id, file, maxEdge, quality } = event.data;
+  const reply = (response: ResizeResponse) => self.postMessage(response);
+
+  try {
+    const bitmap = await createImageBitmap(file);
+    const scale = Math.min(1, maxEdge / Math.max(bitmap.width, bitmap.height));
+    if (scale === 1 && file.type === "image/jpeg") {
+      // Ya es pequeña y JPEG: se envía tal cual
+      bitmap.close();
+      reply({ id, resized: false });
+      return;
+    }
+
+    const width = Math.max(1, Math.round(bitmap.width * scale));
+    const height = Math.max(1, Math.round(bitmap.height * scale));
+    const canvas = new OffscreenCanvas(width, height);
+    const ctx = canvas.getContext("2d");
+    if (!ctx) {
+      bitmap.close();
+      reply({ id, resized: false, error: "OffscreenCanvas 2D no disponible" });
+      return;
+    }
+    // Fondo blanco para imágenes con transparencia (JPEG no tiene canal alfa)
+    ctx.fillStyle = "#fff";
+    ctx.fillRect(0, 0, width, height);
+    ctx.drawImage(bitmap, 0, 0, width, height);
+    bitmap.close();
+
+    const blob = await canvas.convertToBlob({ type: "image/jpeg", quality });
+    if (blob.size >= file.size) {
+      // Re-codificar no ahorra nada: se envía el original
+      reply({ id, resized: false });
+      return;
+    }
+    reply({ id, blob, resized: true });
+  } catch (error) {
+    reply({
+      id,
+      resized: false,
+      error: error instanceof Error ? error.message : String(error),
+    });
+  }
+};
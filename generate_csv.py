@@ -1,50 +1,240 @@
 # build_csv.py
-import os, csv
+"""
+Genera dataset.csv a partir de dataset/healthy y dataset/sick
+
+Valida las imágenes en paralelo (pool de procesos) y mantiene un archivo de estado
+junto al CSV (dataset.manifest.json) con path, tamaño, mtime, hash del contenido y
+dimensiones de cada archivo. En las siguientes ejecuciones solo se revisan los archivos
+nuevos o modificados. También detecta imágenes idénticas (mismo hash) en ambas clases.
+
+Uso:
+    python generate_csv.py
+    python generate_csv.py --workers 8 --full
+"""
+import os, csv, json, hashlib, io
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
 
 root = "dataset"
 out_csv = "dataset.csv"
-rows = []
+CLASSES = [("healthy", 0), ("sick", 1)]
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tiff', '.tif']
+MANIFEST_VERSION = 1
+
+
+def manifest_path_for(csv_path):
+    """Ruta del archivo de estado asociado a un CSV"""
+    return os.path.splitext(csv_path)[0] + ".manifest.json"
+
 
-def is_valid_image(filepath):
-    """Verifica que el archivo sea una imagen válida intentando abrirla con Pillow"""
+def inspect_image(filepath):
+    """
+    Lee el archivo una sola vez, calcula su hash y lo decodifica con Pillow
+
+    Returns:
+        dict con sha256, width, height y valid
+    """
+    info = {"sha256": None, "width": None, "height": None, "valid": False}
+    try:
+        # Dentro del try: un archivo borrado o ilegible tras el escaneo se marca como inválido
+        # en lugar de abortar toda la generación del CSV
+        with open(filepath, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return info
+    info["sha256"] = hashlib.sha256(data).hexdigest()
     try:
-        with Image.open(filepath) as img:
-            # Verificar que sea una imagen válida
-            img.verify()
-        # Intentar abrir y convertir a RGB para asegurar compatibilidad
-        with Image.open(filepath) as img:
-            img.convert('RGB')  # Esto asegura que podemos procesarla
-        return True
+        with Image.open(io.BytesIO(data)) as img:
+            # load() decodifica la imagen completa (detecta archivos truncados)
+            img.load()
+            if img.mode != 'RGB':
+                img.convert('RGB')  # Esto asegura que podemos procesarla
+            info["width"], info["height"] = img.size
+        info["valid"] = True
     except Exception:
-        return False
+        pass
+    return info
+
+
+def load_manifest(path):
+    """Carga el estado de la ejecución anterior (vacío si no existe o es de otra versión)"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("version") != MANIFEST_VERSION:
+            return {}
+        return data.get("files", {})
+    except Exception as e:
+        print(f"Advertencia: no se pudo leer {path} ({e}), se revalidan todos los archivos")
+        return {}
+
+
+def write_atomic(path, write_fn):
+    """Escribe a un archivo temporal y lo reemplaza de forma atómica"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        write_fn(f)
+    os.replace(tmp_path, path)
 
-try:
-    for cls,label in [("healthy",0),("sick",1)]:
-        d = os.path.join(root, cls)
+
+def scan_files(root_dir):
+    """Lista los archivos de cada clase con su tamaño y mtime"""
+    files = []
+    for cls, label in CLASSES:
+        d = os.path.join(root_dir, cls)
         if not os.path.exists(d):
             print(f"Advertencia: El directorio {d} no existe")
             continue
-        for fname in os.listdir(d):
-            filepath = os.path.join(d, fname)
-            # Verificar que sea un archivo (no directorio)
-            if os.path.isfile(filepath):
-                # Intentar validar como imagen (no importa la extensión)
-                if is_valid_image(filepath):
-                    rows.append([os.path.join(d,fname), label, "", cls])
-                else:
-                    # Solo mostrar advertencia si tiene extensión de imagen común
-                    ext = os.path.splitext(fname)[1].lower()
-                    if ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tiff', '.tif']:
-                        print(f"Advertencia: {fname} no es una imagen válida, se omite")
-    
-    with open(out_csv,'w',newline='', encoding='utf-8') as f:
+        with os.scandir(d) as it:
+            for entry in it:
+                # Verificar que sea un archivo (no directorio)
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+                files.append({
+                    "path": os.path.join(d, entry.name),
+                    "class": cls,
+                    "label": label,
+                    "size": st.st_size,
+                    "mtime_ns": st.st_mtime_ns,
+                })
+    return files
+
+
+def find_duplicates(entries):
+    """
+    Agrupa las imágenes válidas por hash
+
+    Returns:
+        (duplicados entre clases, duplicados dentro de la misma clase)
+    """
+    by_hash = {}
+    for e in entries:
+        if e["valid"]:
+            by_hash.setdefault(e["sha256"], []).append(e)
+    cross_class, same_class = [], []
+    for group in by_hash.values():
+        if len(group) < 2:
+            continue
+        if len({e["class"] for e in group}) > 1:
+            cross_class.append(group)
+        else:
+            same_class.append(group)
+    return cross_class, same_class
+
+
+def build_manifest(root_dir=root, csv_path=out_csv, workers=None, full=False, drop_conflicts=False):
+    """
+    Construye dataset.csv revalidando solo los archivos nuevos o modificados
+
+    Args:
+        root_dir: Directorio con las carpetas healthy/ y sick/
+        csv_path: CSV de salida
+        workers: Procesos para validar imágenes (default: número de CPUs)
+        full: Ignorar el estado previo y revalidar todo
+        drop_conflicts: Excluir del CSV las imágenes duplicadas entre clases
+
+    Returns:
+        dict con el resumen de la ejecución
+    """
+    state_path = manifest_path_for(csv_path)
+    previous = {} if full else load_manifest(state_path)
+
+    files = scan_files(root_dir)
+    entries, pending = [], []
+    for f in files:
+        old = previous.get(f["path"])
+        if old and old.get("size") == f["size"] and old.get("mtime_ns") == f["mtime_ns"]:
+            entries.append({**f, **{k: old[k] for k in ("sha256", "width", "height", "valid")}})
+        else:
+            pending.append(f)
+
+    if pending:
+        print(f"Validando {len(pending)} archivos nuevos o modificados ({len(entries)} sin cambios)...")
+        workers = workers or os.cpu_count() or 1
+        if workers > 1 and len(pending) > 1:
+            chunksize = max(1, len(pending) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(inspect_image, [f["path"] for f in pending], chunksize=chunksize))
+        else:
+            results = [inspect_image(f["path"]) for f in pending]
+        for f, info in zip(pending, results):
+            entries.append({**f, **info})
+            if not info["valid"]:
+                # Solo mostrar advertencia si tiene extensión de imagen común
+                if os.path.splitext(f["path"])[1].lower() in IMAGE_EXTENSIONS:
+                    print(f"Advertencia: {os.path.basename(f['path'])} no es una imagen válida, se omite")
+    else:
+        print(f"Sin cambios desde la última ejecución ({len(entries)} archivos)")
+
+    entries.sort(key=lambda e: (e["label"], e["path"]))
+
+    cross_class, same_class = find_duplicates(entries)
+    conflict_paths = set()
+    for group in cross_class:
+        paths = ", ".join(f"{e['path']} ({e['class']})" for e in group)
+        print(f"Advertencia: imagen duplicada en ambas clases: {paths}")
+        conflict_paths.update(e["path"] for e in group)
+    if same_class:
+        n_extra = sum(len(g) - 1 for g in same_class)
+        print(f"Info: {n_extra} copias exactas dentro de la misma clase")
+
+    rows = [
+        [e["path"], e["label"], "", e["class"]]
+        for e in entries
+        if e["valid"] and not (drop_conflicts and e["path"] in conflict_paths)
+    ]
+
+    def write_csv(f):
         writer = csv.writer(f)
         writer.writerow(['image_path','label','timestamp','source'])
         writer.writerows(rows)
-    print(f"CSV creado exitosamente: {out_csv}")
-    print(f"Total de imágenes procesadas: {len(rows)}")
-except Exception as e:
-    print(f"Error al crear el CSV: {e}")
-    import traceback
-    traceback.print_exc()
+
+    def write_state(f):
+        json.dump({
+            "version": MANIFEST_VERSION,
+            "root": root_dir,
+            "files": {
+                e["path"]: {k: e[k] for k in ("size", "mtime_ns", "sha256", "width", "height", "valid", "label")}
+                for e in entries
+            },
+            "cross_class_duplicates": [[e["path"] for e in g] for g in cross_class],
+        }, f, indent=1)
+
+    write_atomic(csv_path, write_csv)
+    write_atomic(state_path, write_state)
+
+    return {
+        "total_files": len(entries),
+        "revalidated": len(pending),
+        "valid_images": sum(1 for e in entries if e["valid"]),
+        "rows": len(rows),
+        "cross_class_duplicates": len(cross_class),
+        "same_class_duplicates": len(same_class),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Genera dataset.csv a partir de dataset/")
+    parser.add_argument("--root", default=root, help="Directorio con healthy/ y sick/")
+    parser.add_argument("--out", default=out_csv, help="CSV de salida")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos para validar imágenes")
+    parser.add_argument("--full", action="store_true", help="Ignorar el estado previo y revalidar todo")
+    parser.add_argument("--drop-conflicts", action="store_true",
+                        help="Excluir imágenes idénticas que aparecen en ambas clases")
+    args = parser.parse_args()
+
+    try:
+        summary = build_manifest(args.root, args.out, workers=args.workers,
+                                 full=args.full, drop_conflicts=args.drop_conflicts)
+        print(f"CSV creado exitosamente: {args.out}")
+        print(f"Total de imágenes procesadas: {summary['rows']}")
+        print(f"Estado guardado en: {manifest_path_for(args.out)}")
+    except Exception as e:
+        print(f"Error al crear el CSV: {e}")
+        import traceback
+        traceback.print_exc()
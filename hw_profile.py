@@ -0,0 +1,106 @@
+"""
+Perfil de hardware generado por autotune.py (artifacts/hw_profile.json)
+
+Guarda la mejor configuración medida en esta máquina para la inferencia (hilos de torch,
+backend, precisión, tamaño de batch) y el entrenamiento (hilos, batch, workers del
+DataLoader, precisión). predict.py, la API, evaluate.py, train_cats_pytorch.py e
+incremental_train.py la leen al arrancar; las variables de entorno y los argumentos de
+línea de comandos explícitos siempre tienen prioridad sobre el perfil.
+
+El perfil solo se aplica en la máquina donde se midió: si cambia el número de CPUs de la
+máquina (os.cpu_count) o la arquitectura se ignora con un aviso (hay que volver a ejecutar
+autotune.py). La afinidad del proceso (taskset, cpuset, RETRAIN_CPUS) no invalida el perfil:
+solo limita en tiempo de ejecución los hilos que se toman de él.
+Sin perfil se usan los valores por defecto de siempre.
+
+No importa torch: se puede usar desde main.py sin coste de arranque.
+"""
+import json
+import os
+import platform
+from pathlib import Path
+
+PROFILE_PATH = Path(os.environ.get("HW_PROFILE_PATH", "artifacts/hw_profile.json"))
+
+_profile = None
+
+
+def available_cpus() -> int:
+    """CPUs que puede usar este proceso (respeta la afinidad, p. ej. taskset o cpuset)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def host_info() -> dict:
+    """Identifica la máquina para la que se midió el perfil"""
+    return {
+        "cpus": os.cpu_count() or 1,
+        "affinity_cpus": available_cpus(),  # informativo: no se compara
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "hostname": platform.node(),
+    }
+
+
+def _matches_host(profile: dict) -> bool:
+    host, current = profile.get("host", {}), host_info()
+    return host.get("cpus") == current["cpus"] and host.get("machine") == current["machine"]
+
+
+def load_hw_profile(path=None, reload: bool = False) -> dict:
+    """
+    Carga el perfil (una vez por proceso)
+
+    Returns:
+        dict con "inference" y "training", o {} si no existe, es inválido o se midió
+        en otra máquina
+    """
+    global _profile
+    if path is None and _profile is not None and not reload:
+        return _profile
+    profile_path = Path(path) if path else PROFILE_PATH
+    profile = {}
+    if profile_path.exists():
+        try:
+            with open(profile_path, encoding="utf-8") as f:
+                profile = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Perfil de hardware inválido en {profile_path}: {e}")
+            profile = {}
+        if profile and not _matches_host(profile):
+            print(f"⚠️  {profile_path} se midió en otra máquina ({profile.get('host', {}).get('cpus')} CPUs, "
+                  f"{profile.get('host', {}).get('machine')}); se ignora. Ejecuta python autotune.py")
+            profile = {}
+    if path is None:
+        _profile = profile
+    return profile
+
+
+def hw_setting(section: str, key: str, default=None):
+    """
+    Valor del perfil (section = "inference" o "training") o default si no está
+
+    Los hilos se limitan a las CPUs que puede usar este proceso (p. ej. un reentrenamiento
+    fijado a 2 núcleos con RETRAIN_CPUS no usa los 8 hilos medidos para toda la máquina).
+    """
+    value = load_hw_profile().get(section, {}).get(key)
+    if value is None:
+        return default
+    if key == "threads":
+        return max(1, min(int(value), available_cpus()))
+    return value
+
+
+def save_hw_profile(profile: dict, path=None) -> Path:
+    """Escribe el perfil de forma atómica (los procesos que arrancan nunca leen un JSON a medias)"""
+    global _profile
+    profile_path = Path(path) if path else PROFILE_PATH
+    profile_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = profile_path.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({**profile, "host": host_info()}, f, indent=2)
+    os.replace(tmp_path, profile_path)
+    _profile = None
+    return profile_path
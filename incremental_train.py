@@ -2,11 +2,16 @@
 Script para reentrenamiento incremental del modelo con nuevos datos
 Este script se puede ejecutar periódicamente para mejorar el modelo con feedback de usuarios
 """
+import json
 import os
 import sys
+from datetime import datetime
 import pandas as pd
 from pathlib import Path
-from feedback_storage import get_training_data, copy_image_to_training, get_statistics
+from feedback_storage import (
+    get_training_data, copy_image_to_training, get_statistics,
+    get_last_retrain_row, get_last_retrain_timestamp, feedback_row_count, mark_retrained,
+)
 # Importar SimpleCNN y CatsDataset desde train_cats_pytorch
 # Usamos import directo ya que están en el mismo directorio
 from train_cats_pytorch import SimpleCNN
@@ -17,12 +22,27 @@ import torch
 import torch.nn as nn
 from torch.utils.data import DataLoader, ConcatDataset
 import shutil
+from training_engine import (
+    train_one_epoch, evaluate, save_checkpoint, read_checkpoint, load_checkpoint, atomic_torch_save,
+    EarlyStopping, TimeBudget, build_scheduler, scheduler_step, current_lr, add_schedule_args, schedule_summary,
+    check_precision,
+)
+from precision import resolve_precision, add_precision_arg
+from profiling import start_training_profiler
+from hw_profile import hw_setting
+from replay_buffer import ReplayBuffer, DEFAULT_CAPACITY
+from perceptual_hash import BKTree, dhash_file, DEFAULT_MAX_DISTANCE
 
 # Configuración
 ORIGINAL_DATASET = "dataset.csv"
 FEEDBACK_DATASET = "feedback_data/feedback.csv"
 ARTIFACTS_DIR = Path("artifacts")
 BACKUP_DIR = Path("artifacts/backups")
+DEDUP_REPORT = Path("outputs/dedup_report.json")
+RETRAIN_CHECKPOINT = ARTIFACTS_DIR / "retrain_checkpoint.pt"  # checkpoint completo por época (--resume)
+# Early stopping y scheduler por defecto (fine-tuning: menos paciencia que el entrenamiento completo)
+DEFAULT_SCHEDULE = {"patience": 3, "min_delta": 1e-4, "scheduler": "plateau", "time_budget": None, "precision": "fp32",
+                    "profile_steps": 0}
 BACKUP_DIR.mkdir(exist_ok=True)
 
 def load_original_dataset():
@@ -31,37 +51,150 @@ def load_original_dataset():
         return pd.read_csv(ORIGINAL_DATASET)
     return pd.DataFrame()
 
-def prepare_incremental_dataset():
+def feedback_training_rows(feedback_df: pd.DataFrame, copy: bool = False) -> pd.DataFrame:
+    """
+    Filas de entrenamiento del feedback (solo las imágenes que siguen en disco)
+
+    Args:
+        copy: Copiar las imágenes a feedback_data/images/<clase>/. Lo usa el replay: el
+            buffer guarda esas copias, que sobreviven a la limpieza de uploads/. El
+            reentrenamiento completo lee las imágenes en su sitio (uploads/): copiarlas en
+            cada reentrenamiento duplicaba todo el feedback en disco
+
+    Returns:
+        DataFrame (image_path, label, timestamp, source, feedback_row)
+    """
+    if copy:
+        print(f"📦 Copiando {len(feedback_df)} imágenes de feedback al dataset...")
+    rows = []
+    for idx, row in feedback_df.iterrows():
+        if os.path.exists(row['image_path']):
+            image_path = row['image_path']
+            if copy:
+                image_path = copy_image_to_training(image_path, int(row['label']))
+            rows.append({
+                'image_path': image_path,
+                'label': int(row['label']),
+                'timestamp': row['timestamp'],
+                'source': 'feedback',
+                'feedback_row': row.get('feedback_row')
+            })
+        else:
+            print(f"⚠️  Imagen no encontrada: {row['image_path']}")
+    return pd.DataFrame(rows, columns=['image_path', 'label', 'timestamp', 'source', 'feedback_row'])
+
+def feedback_window() -> dict:
+    """
+    Feedback de este reentrenamiento: desde la marca de agua del último reentrenamiento
+    hasta las filas escritas en feedback.csv ahora (instantánea)
+
+    La marca de agua es una posición en feedback.csv y no un timestamp: el feedback que
+    otros workers escriban más tarde desde su cola (con timestamps anteriores) queda
+    después de la instantánea y se usa en el siguiente reentrenamiento.
+
+    Returns:
+        {"since_row", "since", "until_row"} (since solo con un retrain_state.json antiguo)
+    """
+    since_row = get_last_retrain_row()
+    return {
+        "since_row": since_row,
+        "since": get_last_retrain_timestamp() if since_row is None else None,
+        "until_row": feedback_row_count(),
+    }
+
+def is_new_feedback(df: pd.DataFrame, window: dict) -> pd.Series:
+    """Filas de df (con feedback_row y timestamp) posteriores al último reentrenamiento"""
+    if window["since_row"] is not None:
+        return df['feedback_row'] >= window["since_row"]
+    if window["since"]:
+        return df['timestamp'].astype(str) > window["since"]
+    return pd.Series(True, index=df.index)
+
+def dedup_feedback(feedback_df: pd.DataFrame, max_distance: int = DEFAULT_MAX_DISTANCE):
+    """
+    Colapsa imágenes casi duplicadas del feedback (ráfagas, re-codificaciones, copias redimensionadas)
+
+    Dos imágenes son casi duplicadas si la distancia de Hamming entre sus dHash es <= max_distance.
+    De cada grupo se conserva una sola fila: primero las corregidas por un usuario y, entre
+    ellas, la más reciente. También se colapsan las filas repetidas de una misma imagen
+    (predicción + corrección). El feedback sin phash (anterior a guardarlo) se hashea al vuelo.
+
+    Args:
+        feedback_df: DataFrame de get_training_data
+        max_distance: Distancia máxima de Hamming (negativa desactiva el filtrado)
+
+    Returns:
+        (DataFrame filtrado, reporte) o (feedback_df, None) si está desactivado
+    """
+    if feedback_df.empty or max_distance < 0:
+        return feedback_df, None
+
+    df = feedback_df.copy()
+    missing = df['phash'].isna()
+    if missing.any():
+        df.loc[missing, 'phash'] = df.loc[missing, 'image_path'].map(dhash_file)
+
+    tree = BKTree()
+    seen_paths = set()
+    keep = []
+    same_image = near_duplicates = 0
+    for idx in df.sort_values(['corrected', 'timestamp'], ascending=[False, False]).index:
+        image_path, phash = df.at[idx, 'image_path'], df.at[idx, 'phash']
+        if image_path in seen_paths:
+            same_image += 1
+            continue
+        seen_paths.add(image_path)
+        if isinstance(phash, str):
+            value = int(phash, 16)
+            if tree.search(value, max_distance):
+                near_duplicates += 1
+                continue
+            tree.add(value, idx)
+        keep.append(idx)
+
+    result = df.loc[sorted(keep)]
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "max_distance": max_distance,
+        "before": len(df),
+        "after": len(result),
+        "removed_same_image": same_image,
+        "removed_near_duplicates": near_duplicates,
+        "shrink": round(1 - len(result) / len(df), 4),
+    }
+    print(f"🧬 Casi duplicados (dHash, distancia <= {max_distance}): {report['before']} → {report['after']} "
+          f"imágenes de feedback (-{report['shrink']:.1%}; {near_duplicates} casi duplicadas, "
+          f"{same_image} filas repetidas de la misma imagen)")
+    DEDUP_REPORT.parent.mkdir(parents=True, exist_ok=True)
+    with open(DEDUP_REPORT, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return result, report
+
+def prepare_incremental_dataset(window: dict, dedup_distance: int = DEFAULT_MAX_DISTANCE):
     """
     Prepara un dataset combinado con datos originales y feedback
+    
+    Args:
+        window: Resultado de feedback_window() (se usa el feedback hasta la instantánea)
+        dedup_distance: Distancia de Hamming para colapsar casi duplicados (ver dedup_feedback)
+
+    Returns:
+        (ruta del CSV, DataFrame con el feedback nuevo) o (None, None)
     """
     # Cargar dataset original
     original_df = load_original_dataset()
     
     # Cargar datos de feedback
-    feedback_df = get_training_data()
+    feedback_df = get_training_data(until_row=window["until_row"])
     
     if feedback_df.empty:
         print("⚠️  No hay datos de feedback para reentrenar")
-        return None
+        return None, None
+    feedback_df, _ = dedup_feedback(feedback_df, dedup_distance)
     
-    # Copiar imágenes de feedback al directorio de entrenamiento organizado
-    print(f"📦 Copiando {len(feedback_df)} imágenes de feedback al dataset...")
-    new_paths = []
-    for idx, row in feedback_df.iterrows():
-        if os.path.exists(row['image_path']):
-            new_path = copy_image_to_training(row['image_path'], int(row['label']))
-            new_paths.append(new_path)
-        else:
-            print(f"⚠️  Imagen no encontrada: {row['image_path']}")
-    
-    # Crear nuevo CSV combinado
-    combined_df = pd.DataFrame({
-        'image_path': new_paths,
-        'label': feedback_df['label'].values,
-        'timestamp': feedback_df['timestamp'].values,
-        'source': ['feedback'] * len(feedback_df)
-    })
+    # Las imágenes de feedback se leen en su sitio (sin copiarlas)
+    combined_df = feedback_training_rows(feedback_df)
+    new_df = combined_df[is_new_feedback(combined_df, window)]
     
     # Agregar datos originales si existen
     if not original_df.empty:
@@ -76,7 +209,124 @@ def prepare_incremental_dataset():
     print(f"   - Imágenes de feedback: {len(feedback_df)}")
     print(f"   - Total: {len(combined_df)}")
     
-    return combined_csv
+    return combined_csv, new_df
+
+def prepare_replay_dataset(buffer: ReplayBuffer, window: dict, exclude_paths=None,
+                           dedup_distance: int = DEFAULT_MAX_DISTANCE):
+    """
+    Prepara un dataset con el feedback nuevo (desde el último reentrenamiento) más una
+    muestra balanceada de datos anteriores tomada del replay buffer
+
+    Args:
+        buffer: Replay buffer cargado
+        window: Resultado de feedback_window()
+        exclude_paths: Rutas que no deben usarse para entrenar (p. ej. el holdout)
+        dedup_distance: Distancia de Hamming para colapsar casi duplicados del feedback nuevo
+
+    Returns:
+        (ruta del CSV, DataFrame con el feedback nuevo ya copiado) o (None, None)
+    """
+    feedback_df = get_training_data(since=window["since"], since_row=window["since_row"],
+                                    until_row=window["until_row"])
+    if feedback_df.empty:
+        print(f"⚠️  No hay feedback nuevo desde el último reentrenamiento "
+              f"(fila {window['since_row']} de feedback.csv)")
+        return None, None
+
+    # Primer uso: sembrar el buffer con el dataset original y el feedback anterior. Un buffer
+    # sin la marca seeded (p. ej. de una versión anterior, que añadía el feedback de los
+    # reentrenamientos completos sin sembrar) se vacía: el feedback anterior ya entra aquí
+    if not buffer.seeded:
+        buffer.reset()
+        seed_rows = []
+        original_df = load_original_dataset()
+        if not original_df.empty:
+            seed_rows.extend(original_df[['image_path', 'label', 'timestamp']].to_dict('records'))
+        if window["since_row"] or window["since"]:
+            old_feedback = get_training_data(until_row=window["until_row"])
+            old_feedback = old_feedback[~is_new_feedback(old_feedback, window)]
+            seed_rows.extend(old_feedback[['image_path', 'label', 'timestamp']].to_dict('records'))
+        buffer.add(seed_rows)
+        buffer.seeded = True
+        print(f"🌱 Replay buffer inicializado con {len(buffer)} de {len(seed_rows)} imágenes anteriores")
+
+    feedback_df, _ = dedup_feedback(feedback_df, dedup_distance)
+    new_df = feedback_training_rows(feedback_df, copy=True)
+    replay_df = pd.DataFrame(buffer.sample(), columns=['image_path', 'label', 'timestamp'])
+    replay_df['source'] = 'replay'
+    combined_df = pd.concat([new_df, replay_df], ignore_index=True)
+
+    if exclude_paths:
+        before = len(combined_df)
+        combined_df = combined_df[~combined_df['image_path'].isin(exclude_paths)]
+        if len(combined_df) < before:
+            print(f"   - Excluidas {before - len(combined_df)} imágenes del holdout")
+
+    combined_csv = "dataset_incremental.csv"
+    combined_df.to_csv(combined_csv, index=False)
+    print(f"✅ Dataset de replay guardado en {combined_csv}")
+    print(f"   - Feedback nuevo: {len(new_df)}")
+    print(f"   - Muestra del replay buffer: {len(replay_df)} "
+          f"(sanas: {(replay_df['label'] == 0).sum()}, enfermas: {(replay_df['label'] == 1).sum()})")
+    print(f"   - Total: {len(combined_df)}")
+
+    return combined_csv, new_df
+
+def record_retrain(new_feedback_df: pd.DataFrame, buffer: ReplayBuffer, feedback_rows: int = None):
+    """
+    Tras un reentrenamiento exitoso: agrega el feedback nuevo al replay buffer y
+    marca hasta qué fila de feedback.csv se ha entrenado
+
+    Mientras el buffer no esté sembrado no se le agrega nada: el primer reentrenamiento con
+    replay lo siembra con el dataset original y todo el feedback anterior a la marca de agua.
+
+    Args:
+        feedback_rows: Instantánea de feedback_window()["until_row"] (la marca de agua no se
+            deriva de los timestamps de las filas usadas, que pueden estar filtradas)
+    """
+    if buffer.seeded and new_feedback_df is not None and not new_feedback_df.empty:
+        buffer.add(new_feedback_df.to_dict('records'))
+        buffer.save()
+        print(f"💾 Replay buffer actualizado ({len(buffer)} imágenes)")
+    if feedback_rows is not None:
+        mark_retrained(feedback_rows)
+
+def check_holdout(holdout_csv: str, backup_path, max_regression: float = 0.01) -> bool:
+    """
+    Compara el modelo reentrenado con el anterior sobre un holdout congelado
+
+    Returns:
+        True si el modelo nuevo no empeora más de max_regression
+    """
+    from evaluate import evaluate_checkpoint
+
+    model_path = ARTIFACTS_DIR / "best_model.pth"
+    new_report = evaluate_checkpoint(holdout_csv, checkpoint=model_path, workers=0)
+    print(f"🧪 Holdout {holdout_csv}: precisión del modelo nuevo {new_report['accuracy']}")
+    if not backup_path or not Path(backup_path).exists():
+        return True
+    old_report = evaluate_checkpoint(holdout_csv, checkpoint=backup_path, workers=0)
+    print(f"   Precisión del modelo anterior: {old_report['accuracy']}")
+    if new_report['accuracy'] is None or old_report['accuracy'] is None:
+        return True
+    return new_report['accuracy'] >= old_report['accuracy'] - max_regression
+
+def finish_retrain(new_feedback_df, buffer: ReplayBuffer, holdout_csv, backup_path, max_regression: float,
+                   feedback_rows: int = None) -> bool:
+    """
+    Verifica el holdout (si existe) y registra el reentrenamiento
+
+    Returns:
+        False si hubo regresión y se restauró el modelo anterior
+    """
+    if holdout_csv:
+        if not check_holdout(holdout_csv, backup_path, max_regression=max_regression):
+            print(f"❌ Regresión en el holdout mayor a {max_regression}, se restaura el modelo anterior")
+            shutil.copy2(backup_path, ARTIFACTS_DIR / "best_model.pth")
+            return False
+        print("✅ Sin regresión en el holdout")
+    record_retrain(new_feedback_df, buffer, feedback_rows)
+    return True
 
 def backup_current_model():
     """Hace backup del modelo actual antes de reentrenar"""
@@ -90,51 +340,64 @@ def backup_current_model():
         return backup_path
     return None
 
-def retrain_model(incremental_csv: str, epochs: int = 10):
+def retrain_model(incremental_csv: str, epochs: int = 10, resume: bool = False, extra_state: dict = None,
+                  schedule: dict = None):
     """
     Reentrena el modelo con el dataset incremental
     
+    Guarda un checkpoint completo al final de cada época (RETRAIN_CHECKPOINT) para que un
+    reentrenamiento interrumpido o que excedió el tiempo límite pueda continuar con --resume.
+    
     Args:
         incremental_csv: Ruta al CSV con datos combinados
         epochs: Número de épocas para reentrenar
+        resume: Reanudar desde RETRAIN_CHECKPOINT si existe
+        extra_state: Estado adicional que se guarda en el checkpoint (p. ej. feedback nuevo)
+        schedule: patience, min_delta, scheduler, time_budget, precision y profile_steps (ver DEFAULT_SCHEDULE)
+    
+    Returns:
+        (True si el reentrenamiento terminó correctamente, backup del modelo anterior o None)
     """
     print(f"\n🔄 Iniciando reentrenamiento incremental...")
     print(f"   CSV: {incremental_csv}")
     print(f"   Épocas: {epochs}")
     
-    # Hacer backup del modelo actual
-    backup_path = backup_current_model()
+    model_path = ARTIFACTS_DIR / "best_model.pth"
+    ckpt = read_checkpoint(RETRAIN_CHECKPOINT) if resume and RETRAIN_CHECKPOINT.exists() else None
+    
+    # Hacer backup del modelo actual (al reanudar se conserva el backup original)
+    if ckpt:
+        backup_path = Path(ckpt['backup_path']) if ckpt.get('backup_path') else None
+    else:
+        backup_path = backup_current_model()
     
     try:
-        # Modificar train_cats_pytorch.py para usar el CSV incremental
-        # Por ahora, vamos a crear una versión simplificada aquí
-        
-        import train_cats_pytorch as train_module
-        
         # Cargar el modelo actual
-        model_path = ARTIFACTS_DIR / "best_model.pth"
-        if not model_path.exists():
+        if not model_path.exists() and not ckpt:
             print("❌ No se encontró el modelo actual. Entrenando desde cero...")
             # Ejecutar entrenamiento normal
-            os.system(f"python train_cats_pytorch.py")
-            return
+            return os.system(f"python train_cats_pytorch.py") == 0, backup_path
         
-        # Cargar modelo existente
         device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         model = SimpleCNN().to(device)
-        model.load_state_dict(torch.load(model_path, map_location=device))
-        print(f"✅ Modelo actual cargado desde {model_path}")
-        
-        # Cargar datos incrementales
-        df = pd.read_csv(incremental_csv)
-        print(f"📊 Dataset: {len(df)} imágenes")
+        if not ckpt:
+            model.load_state_dict(torch.load(model_path, map_location=device))
+            print(f"✅ Modelo actual cargado desde {model_path}")
         
-        # Dividir en train/val/test
-        df = df.sample(frac=1, random_state=42).reset_index(drop=True)
-        n = len(df)
-        train_df = df.iloc[:int(0.7*n)]
-        val_df = df.iloc[int(0.7*n):int(0.85*n)]
-        test_df = df.iloc[int(0.85*n):]
+        if ckpt:
+            # Reusar exactamente los mismos splits del reentrenamiento interrumpido
+            train_df, val_df, test_df = train_module.splits_from_state(ckpt['splits'])
+        else:
+            # Cargar datos incrementales
+            df = pd.read_csv(incremental_csv)
+            print(f"📊 Dataset: {len(df)} imágenes")
+            
+            # Dividir en train/val/test
+            df = df.sample(frac=1, random_state=42).reset_index(drop=True)
+            n = len(df)
+            train_df = df.iloc[:int(0.7*n)]
+            val_df = df.iloc[int(0.7*n):int(0.85*n)]
+            test_df = df.iloc[int(0.85*n):]
         
         print(f"   Train: {len(train_df)}, Val: {len(val_df)}, Test: {len(test_df)}")
         
@@ -143,80 +406,86 @@ def retrain_model(incremental_csv: str, epochs: int = 10):
         val_dataset = CatsDataset(val_df, train=False)
         test_dataset = CatsDataset(test_df, train=False)
         
-        train_loader = DataLoader(train_dataset, batch_size=16, shuffle=True)
-        val_loader = DataLoader(val_dataset, batch_size=16, shuffle=False)
-        test_loader = DataLoader(test_dataset, batch_size=16, shuffle=False)
+        # Batch y workers del perfil de hardware (python autotune.py), 16 y 0 sin perfil
+        batch_size, workers = train_module.BATCH, train_module.NUM_WORKERS
+        train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, num_workers=workers)
+        val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, num_workers=workers)
+        test_loader = DataLoader(test_dataset, batch_size=batch_size, shuffle=False, num_workers=workers)
         
         # Reentrenar (fine-tuning)
         import torch.optim as optim
         optimizer = optim.Adam(model.parameters(), lr=0.0001, weight_decay=1e-4)  # Learning rate más bajo para fine-tuning
         criterion = nn.CrossEntropyLoss()
         
+        schedule = {**DEFAULT_SCHEDULE, **(schedule or {})}
+        scheduler = build_scheduler(optimizer, schedule['scheduler'], epochs, schedule['patience'])
+        stopper = EarlyStopping(patience=schedule['patience'], min_delta=schedule['min_delta'])
+        budget = TimeBudget(schedule['time_budget'])
+        precision = resolve_precision(schedule['precision'], device)
+        
         best_val_acc = 0.0
+        start_epoch = 0
+        if ckpt:
+            load_checkpoint(ckpt, model, optimizer, scheduler)
+            start_epoch = ckpt['epoch']
+            best_val_acc = ckpt['best_val_acc']
+            stopper.load_state_dict(ckpt['early_stopping'])
+            budget.load_state_dict(ckpt.get('time_budget') or {'elapsed': ckpt.get('elapsed', 0.0)})
+            print(f"⏯️  Reanudando desde {RETRAIN_CHECKPOINT}: época {start_epoch} completada")
         
-        for epoch in range(epochs):
-            # Training
-            model.train()
-            train_loss = 0.0
-            train_correct = 0
-            train_total = 0
-            for images, labels in train_loader:
-                images, labels = images.to(device), labels.to(device)
-                optimizer.zero_grad()
-                outputs = model(images)
-                loss = criterion(outputs, labels)
-                loss.backward()
-                optimizer.step()
-                train_loss += loss.item()
-                _, predicted = torch.max(outputs.data, 1)
-                train_total += labels.size(0)
-                train_correct += (predicted == labels).sum().item()
-            
-            train_acc = train_correct / train_total if train_total > 0 else 0.0
+        print(f"   Early stopping: patience={schedule['patience']}, min_delta={schedule['min_delta']}, "
+              f"scheduler={schedule['scheduler']}, time_budget={schedule['time_budget']}, precision={precision}")
+        stop_reason = "completado"
+        epochs_run = start_epoch
+        profiler = start_training_profiler(schedule['profile_steps'], "incremental_train")
+        for epoch in range(start_epoch, epochs):
+            if budget.exhausted():
+                stop_reason = "presupuesto de tiempo"
+                break
+            budget.start_epoch()
+            train_loss, train_acc = train_one_epoch(model, train_loader, criterion, optimizer, device, precision,
+                                                    profiler=profiler)
+            val_loss, val_acc, _, _ = evaluate(model, val_loader, criterion, device, precision)
+            lr = current_lr(optimizer)
+            scheduler_step(scheduler, val_loss)
+            budget.end_epoch()
+            epochs_run = epoch + 1
             
-            # Validation
-            model.eval()
-            val_correct = 0
-            val_total = 0
-            val_loss = 0.0
-            with torch.no_grad():
-                for images, labels in val_loader:
-                    images, labels = images.to(device), labels.to(device)
-                    outputs = model(images)
-                    loss = criterion(outputs, labels)
-                    val_loss += loss.item()
-                    _, predicted = torch.max(outputs.data, 1)
-                    val_total += labels.size(0)
-                    val_correct += (predicted == labels).sum().item()
-            
-            val_acc = val_correct / val_total if val_total > 0 else 0.0
-            avg_train_loss = train_loss / len(train_loader) if len(train_loader) > 0 else 0.0
-            avg_val_loss = val_loss / len(val_loader) if len(val_loader) > 0 else 0.0
-            
-            print(f"Epoch {epoch+1}/{epochs} - Train Loss: {avg_train_loss:.4f}, Train Acc: {train_acc:.4f}, Val Loss: {avg_val_loss:.4f}, Val Acc: {val_acc:.4f}")
+            print(f"Epoch {epoch+1}/{epochs} - Train Loss: {train_loss:.4f}, Train Acc: {train_acc:.4f}, Val Loss: {val_loss:.4f}, Val Acc: {val_acc:.4f}, LR: {lr:.2e}")
             
             # Guardar mejor modelo
             if val_acc > best_val_acc:
                 best_val_acc = val_acc
-                torch.save(model.state_dict(), model_path)
+                atomic_torch_save(model.state_dict(), model_path)
                 print(f"   ✅ Nuevo mejor modelo guardado (Val Acc: {val_acc:.4f})")
+            
+            should_stop = stopper.step(val_loss)
+            save_checkpoint(RETRAIN_CHECKPOINT, model, optimizer, epoch + 1, scheduler=scheduler,
+                            best_val_acc=best_val_acc,
+                            early_stopping=stopper.state_dict(), time_budget=budget.state_dict(),
+                            splits=train_module.splits_to_state(train_df, val_df, test_df),
+                            incremental_csv=incremental_csv,
+                            backup_path=str(backup_path) if backup_path else None,
+                            extra_state=extra_state or {})
+            if should_stop:
+                stop_reason = f"early stopping ({schedule['patience']} épocas sin mejora)"
+                break
+        if profiler is not None:
+            profiler.close()
         
-        # Test final
-        model.eval()
-        test_correct = 0
-        test_total = 0
-        with torch.no_grad():
-            for images, labels in test_loader:
-                images, labels = images.to(device), labels.to(device)
-                outputs = model(images)
-                _, predicted = torch.max(outputs.data, 1)
-                test_total += labels.size(0)
-                test_correct += (predicted == labels).sum().item()
+        print(f"   {schedule_summary(epochs_run, epochs, stop_reason)}, tiempo: {budget.elapsed:.1f}s")
         
-        test_acc = test_correct / test_total
+        # Test final (en fp32 y, si se entrenó en bf16, comparado con bf16)
+        check = check_precision(model, test_loader, criterion, device, precision)
+        test_acc = check['fp32_acc']
+        if precision != "fp32":
+            print(f"   Precisión en test {precision}: {check['acc']:.4f} (delta {check['delta']:+.4f})")
+        if RETRAIN_CHECKPOINT.exists():
+            RETRAIN_CHECKPOINT.unlink()
         print(f"\n✅ Reentrenamiento completado!")
         print(f"   Precisión en test: {test_acc:.4f}")
         print(f"   Modelo guardado en: {model_path}")
+        return True, backup_path
         
     except Exception as e:
         print(f"❌ Error durante el reentrenamiento: {e}")
@@ -228,6 +497,150 @@ def retrain_model(incremental_csv: str, epochs: int = 10):
             print(f"🔄 Restaurando modelo desde backup...")
             shutil.copy2(backup_path, model_path)
             print(f"✅ Modelo restaurado")
+        return False, backup_path
+
+def resume_retrain(resume_ckpt: dict, epochs: int, schedule: dict = None):
+    """
+    Continúa un reentrenamiento interrumpido desde RETRAIN_CHECKPOINT
+
+    El extra_state (feedback nuevo y marca de agua) se vuelve a guardar en cada checkpoint,
+    así que se conserva aunque el reentrenamiento se interrumpa más de una vez.
+
+    Returns:
+        (éxito, backup del modelo anterior al reentrenamiento original, DataFrame con el
+        feedback nuevo, marca de agua feedback_rows o None)
+    """
+    extra_state = resume_ckpt.get('extra_state') or {}
+    success, backup_path = retrain_model(resume_ckpt['incremental_csv'], epochs=epochs, resume=True,
+                            extra_state=extra_state, schedule=schedule)
+    return success, backup_path, pd.DataFrame(extra_state.get('new_feedback', [])), extra_state.get('feedback_rows')
+
+def retrain_head(incremental_csv: str, epochs: int = 10, schedule: dict = None):
+    """
+    Reentrenamiento rápido: congela el backbone (model.conv) y entrena solo la cabeza fc
+    sobre características cacheadas (ver feature_cache.py)
+
+    Las características de cada imagen se calculan una sola vez por backbone, así que un
+    reentrenamiento disparado por feedback solo procesa las imágenes nuevas.
+    No se aplican augmentations porque las características son fijas.
+    
+    Args:
+        incremental_csv: Ruta al CSV con datos combinados
+        epochs: Número de épocas para entrenar la cabeza
+        schedule: patience, min_delta, scheduler, time_budget, precision y profile_steps (ver DEFAULT_SCHEDULE)
+    
+    Returns:
+        (True si el reentrenamiento terminó correctamente, backup del modelo anterior o None)
+    """
+    from feature_cache import FeatureCache
+    from torch.utils.data import TensorDataset
+    import torch.optim as optim
+    import time
+
+    print(f"\n⚡ Iniciando reentrenamiento rápido (backbone congelado)...")
+    print(f"   CSV: {incremental_csv}")
+    print(f"   Épocas: {epochs}")
+
+    model_path = ARTIFACTS_DIR / "best_model.pth"
+    if not model_path.exists():
+        print("❌ No se encontró el modelo actual. El modo rápido necesita un backbone entrenado")
+        return False, None
+
+    backup_path = backup_current_model()
+
+    try:
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        model = SimpleCNN().to(device)
+        model.load_state_dict(torch.load(model_path, map_location=device))
+        for param in model.conv.parameters():
+            param.requires_grad = False
+        print(f"✅ Modelo actual cargado desde {model_path}")
+
+        df = pd.read_csv(incremental_csv)
+        df = df.sample(frac=1, random_state=42).reset_index(drop=True)
+
+        # Extraer (o leer de la caché) las características del backbone
+        start = time.perf_counter()
+        cache = FeatureCache(model)
+        features, valid = cache.get_features(df['image_path'].tolist())
+        cache.save()
+        print(f"📦 Características: {len(valid)} imágenes "
+              f"({cache.hits} en caché, {cache.misses} calculadas) en {time.perf_counter() - start:.1f}s")
+        if not valid:
+            print("❌ No hay imágenes válidas para reentrenar")
+            return False, backup_path
+
+        labels = torch.tensor(df['label'].iloc[valid].astype(int).values)
+        n = len(valid)
+        train_idx = slice(0, int(0.7*n))
+        val_idx = slice(int(0.7*n), int(0.85*n))
+        test_idx = slice(int(0.85*n), n)
+        print(f"   Train: {int(0.7*n)}, Val: {int(0.85*n) - int(0.7*n)}, Test: {n - int(0.85*n)}")
+
+        train_loader = DataLoader(TensorDataset(features[train_idx], labels[train_idx]), batch_size=64, shuffle=True)
+        val_loader = DataLoader(TensorDataset(features[val_idx], labels[val_idx]), batch_size=256, shuffle=False)
+        test_loader = DataLoader(TensorDataset(features[test_idx], labels[test_idx]), batch_size=256, shuffle=False)
+
+        optimizer = optim.Adam(model.fc.parameters(), lr=1e-3, weight_decay=1e-4)
+        criterion = nn.CrossEntropyLoss()
+
+        schedule = {**DEFAULT_SCHEDULE, **(schedule or {})}
+        scheduler = build_scheduler(optimizer, schedule['scheduler'], epochs, schedule['patience'])
+        stopper = EarlyStopping(patience=schedule['patience'], min_delta=schedule['min_delta'])
+        budget = TimeBudget(schedule['time_budget'])
+        precision = resolve_precision(schedule['precision'], device)
+
+        # La cabeza fc recibe directamente las características cacheadas
+        head = model.fc
+        best_val_acc = 0.0
+        stop_reason = "completado"
+        epochs_run = 0
+        start = time.perf_counter()
+        profiler = start_training_profiler(schedule['profile_steps'], "incremental_train_head")
+        for epoch in range(epochs):
+            if budget.exhausted():
+                stop_reason = "presupuesto de tiempo"
+                break
+            budget.start_epoch()
+            train_loss, train_acc = train_one_epoch(head, train_loader, criterion, optimizer, device, precision,
+                                                    profiler=profiler)
+            val_loss, val_acc, _, _ = evaluate(head, val_loader, criterion, device, precision)
+            lr = current_lr(optimizer)
+            scheduler_step(scheduler, val_loss)
+            budget.end_epoch()
+            epochs_run = epoch + 1
+            print(f"Epoch {epoch+1}/{epochs} - Train Loss: {train_loss:.4f}, Train Acc: {train_acc:.4f}, "
+                  f"Val Loss: {val_loss:.4f}, Val Acc: {val_acc:.4f}, LR: {lr:.2e}")
+
+            if val_acc > best_val_acc:
+                best_val_acc = val_acc
+                atomic_torch_save(model.state_dict(), model_path)
+                print(f"   ✅ Nuevo mejor modelo guardado (Val Acc: {val_acc:.4f})")
+
+            if stopper.step(val_loss):
+                stop_reason = f"early stopping ({schedule['patience']} épocas sin mejora)"
+                break
+        if profiler is not None:
+            profiler.close()
+
+        print(f"   {schedule_summary(epochs_run, epochs, stop_reason)}")
+        _, test_acc, _, _ = evaluate(head, test_loader, criterion, device)
+        print(f"\n✅ Reentrenamiento rápido completado en {time.perf_counter() - start:.1f}s!")
+        print(f"   Precisión en test: {test_acc:.4f}")
+        print(f"   Modelo guardado en: {model_path}")
+        return True, backup_path
+
+    except Exception as e:
+        print(f"❌ Error durante el reentrenamiento: {e}")
+        import traceback
+        traceback.print_exc()
+
+        # Restaurar backup si hay error
+        if backup_path and backup_path.exists():
+            print(f"🔄 Restaurando modelo desde backup...")
+            shutil.copy2(backup_path, model_path)
+            print(f"✅ Modelo restaurado")
+        return False, backup_path
 
 if __name__ == "__main__":
     import argparse
@@ -235,8 +648,57 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Reentrenamiento incremental del modelo")
     parser.add_argument("--epochs", type=int, default=10, help="Número de épocas")
     parser.add_argument("--min-feedback", type=int, default=10, help="Mínimo de imágenes de feedback requeridas")
+    parser.add_argument("--mode", choices=["full", "head"], default="full",
+                        help="full: fine-tuning de todo el modelo; head: backbone congelado + caché de características")
+    parser.add_argument("--replay", action="store_true",
+                        help="Entrenar solo con el feedback nuevo más una muestra del replay buffer")
+    parser.add_argument("--replay-size", type=int, default=DEFAULT_CAPACITY,
+                        help="Tamaño total del replay buffer (balanceado por clase)")
+    parser.add_argument("--holdout-csv", default="holdout.csv",
+                        help="Holdout congelado para detectar regresiones (se ignora si no existe)")
+    parser.add_argument("--max-regression", type=float, default=0.01,
+                        help="Caída máxima de precisión en el holdout antes de revertir el modelo")
+    parser.add_argument("--resume", action="store_true",
+                        help=f"Continuar un reentrenamiento interrumpido desde {RETRAIN_CHECKPOINT} (modo full)")
+    add_schedule_args(parser, patience=DEFAULT_SCHEDULE["patience"], scheduler=DEFAULT_SCHEDULE["scheduler"])
+    add_precision_arg(parser, default=os.environ.get("PRECISION") or hw_setting("training", "precision"))
+    parser.add_argument("--dedup-distance", type=int, default=DEFAULT_MAX_DISTANCE,
+                        help="Distancia de Hamming (dHash) para colapsar imágenes casi duplicadas del feedback (-1 desactiva)")
+    parser.add_argument("--profile", type=int, nargs="?", const=10, default=0, metavar="PASOS",
+                        help="Perfilar PASOS pasos de entrenamiento con torch.profiler (outputs/profiles/)")
     
     args = parser.parse_args()
+    if train_module.TRAIN_THREADS and "OMP_NUM_THREADS" not in os.environ:
+        # Hilos del perfil de hardware; el reentrenamiento lanzado por la API ya fija OMP_NUM_THREADS
+        torch.set_num_threads(train_module.TRAIN_THREADS)
+    schedule = {
+        "patience": args.patience,
+        "min_delta": args.min_delta,
+        "scheduler": args.scheduler,
+        "time_budget": args.time_budget,
+        "precision": args.precision,
+        "profile_steps": args.profile,
+    }
+    
+    holdout_csv = args.holdout_csv if args.holdout_csv and os.path.exists(args.holdout_csv) else None
+    buffer = ReplayBuffer.load(capacity=args.replay_size)
+    
+    resume_ckpt = None
+    if args.resume and args.mode == "full":
+        if RETRAIN_CHECKPOINT.exists():
+            resume_ckpt = read_checkpoint(RETRAIN_CHECKPOINT)
+        else:
+            print(f"⚠️  No existe {RETRAIN_CHECKPOINT}, se inicia un reentrenamiento nuevo")
+    
+    if resume_ckpt:
+        # El dataset y los splits ya están definidos en el checkpoint
+        success, backup_path, new_feedback_df, feedback_rows = resume_retrain(resume_ckpt, args.epochs, schedule)
+        if not success:
+            sys.exit(1)
+        if not finish_retrain(new_feedback_df, buffer, holdout_csv, backup_path, args.max_regression,
+                              feedback_rows):
+            sys.exit(1)
+        sys.exit(0)
     
     # Verificar estadísticas
     stats = get_statistics()
@@ -250,12 +712,32 @@ if __name__ == "__main__":
         print(f"   Actualmente hay: {stats['total_images']}")
         sys.exit(0)
     
-    # Preparar dataset incremental
-    incremental_csv = prepare_incremental_dataset()
-    
-    if incremental_csv:
-        # Reentrenar
-        retrain_model(incremental_csv, epochs=args.epochs)
+    # Preparar dataset incremental (hasta la instantánea de feedback.csv tomada ahora)
+    window = feedback_window()
+    if args.replay:
+        holdout_paths = set(pd.read_csv(holdout_csv)['image_path']) if holdout_csv else None
+        incremental_csv, new_feedback_df = prepare_replay_dataset(buffer, window, exclude_paths=holdout_paths,
+                                                                  dedup_distance=args.dedup_distance)
+        if not incremental_csv:
+            sys.exit(0)
     else:
+        incremental_csv, new_feedback_df = prepare_incremental_dataset(window, dedup_distance=args.dedup_distance)
+    
+    if not incremental_csv:
         print("❌ No se pudo preparar el dataset incremental")
         sys.exit(1)
+    
+    # Reentrenar
+    if args.mode == "head":
+        success, backup_path = retrain_head(incremental_csv, epochs=args.epochs, schedule=schedule)
+    else:
+        extra_state = {'new_feedback': new_feedback_df.to_dict('records') if new_feedback_df is not None else [],
+                       'feedback_rows': window["until_row"]}
+        success, backup_path = retrain_model(incremental_csv, epochs=args.epochs, extra_state=extra_state, schedule=schedule)
+    if not success:
+        sys.exit(1)
+    
+    # Verificar que no haya regresión en el holdout congelado contra el backup de este reentrenamiento
+    if not finish_retrain(new_feedback_df, buffer, holdout_csv, backup_path, args.max_regression,
+                          window["until_row"]):
+        sys.exit(1)
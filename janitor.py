@@ -0,0 +1,255 @@
+"""
+Limpieza periódica de uploads/, outputs/, artifacts/backups/ y feedback_data/images/
+
+- uploads/: imágenes subidas más antiguas que UPLOADS_TTL_DAYS o que exceden UPLOADS_QUOTA_MB
+  (se borran primero las más antiguas)
+- outputs/: CSV processed_images_*.csv según OUTPUTS_TTL_DAYS / OUTPUTS_QUOTA_MB
+- artifacts/backups/: se conservan los últimos BACKUPS_KEEP backups del modelo
+- feedback_data/images/: copias que ya no referencia el replay buffer, el holdout ni el
+  dataset del reentrenamiento en curso (expulsadas del buffer, reentrenamientos fallidos y
+  las que hacían los reentrenamientos completos de versiones anteriores)
+
+Nunca se borran imágenes referenciadas por el feedback, por el replay buffer, por el
+holdout o por dataset_incremental.csv, ni archivos con menos de JANITOR_MIN_AGE_MINUTES
+(subidas en curso). El reentrenamiento completo por defecto (sin --replay) lee todo el
+feedback en su sitio desde uploads/, así que se protege todo el feedback; con
+JANITOR_REPLAY_ONLY=1 (todos los reentrenamientos usan --replay) solo se protege el feedback
+aún no usado en un reentrenamiento (posterior a la marca de agua de
+feedback_data/retrain_state.json): la muestra que se conserva está copiada en
+feedback_data/images/ y la referencia el replay buffer. Con varios workers solo uno ejecuta la limpieza a la vez (lock de
+archivo). Los bytes recuperados se reportan en /metrics (janitor_reclaimed_bytes_total).
+
+Uso:
+    python janitor.py --dry-run
+    python janitor.py --uploads-ttl-days 7 --backups-keep 3
+    python janitor.py --replay-only
+"""
+import argparse
+import csv
+import fcntl
+import json
+import os
+import time
+from pathlib import Path
+
+import metrics
+
+UPLOAD_DIR = Path("uploads")
+OUTPUT_DIR = Path("outputs")
+BACKUP_DIR = Path("artifacts/backups")
+LOCK_PATH = OUTPUT_DIR / ".janitor.lock"
+FEEDBACK_IMAGES_DIR = Path("feedback_data/images")
+HOLDOUT_CSV = Path("holdout.csv")
+TRAINING_CSV = Path("dataset_incremental.csv")  # dataset del reentrenamiento en curso (o el último)
+
+DAY = 24 * 3600
+MB = 1024 * 1024
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+def default_config() -> dict:
+    """Configuración desde variables de entorno (0 desactiva el TTL o la cuota)"""
+    return {
+        "uploads_ttl_days": _env_float("UPLOADS_TTL_DAYS", 30),
+        "uploads_quota_mb": _env_float("UPLOADS_QUOTA_MB", 2048),
+        "outputs_ttl_days": _env_float("OUTPUTS_TTL_DAYS", 7),
+        "outputs_quota_mb": _env_float("OUTPUTS_QUOTA_MB", 512),
+        "backups_keep": max(1, int(_env_float("BACKUPS_KEEP", 5))),
+        "min_age_minutes": _env_float("JANITOR_MIN_AGE_MINUTES", 60),
+        "replay_only": os.environ.get("JANITOR_REPLAY_ONLY", "0").lower() in ("1", "true", "yes"),
+    }
+
+
+def protected_paths(replay_only: bool = False) -> set:
+    """
+    Rutas (resueltas) que no se pueden borrar: imágenes del feedback, del replay buffer,
+    del holdout y de dataset_incremental.csv
+
+    Args:
+        replay_only: Los reentrenamientos usan --replay: solo se protege el feedback
+            posterior al último reentrenamiento (el anterior ya está en el replay buffer)
+    """
+    from feedback_storage import get_feedback_data, get_last_retrain_row, get_last_retrain_timestamp
+    from replay_buffer import BUFFER_PATH
+
+    paths = []
+    df = get_feedback_data()
+    if not df.empty and "image_path" in df.columns:
+        since_row = get_last_retrain_row() if replay_only else None
+        since = get_last_retrain_timestamp() if replay_only else None
+        if since_row is not None:
+            df = df.iloc[since_row:] if since_row <= len(df) else df
+        elif since:
+            df = df[df["timestamp"].astype(str) > since]
+        paths.extend(df["image_path"].dropna().astype(str))
+    if BUFFER_PATH.exists():
+        with open(BUFFER_PATH, encoding="utf-8") as f:
+            items = json.load(f).get("items", {})
+        paths.extend(item["image_path"] for rows in items.values() for item in rows)
+    for csv_path in (HOLDOUT_CSV, TRAINING_CSV):
+        if csv_path.exists():
+            with open(csv_path, newline="", encoding="utf-8") as f:
+                paths.extend(row["image_path"] for row in csv.DictReader(f) if row.get("image_path"))
+    return {os.path.realpath(p) for p in paths}
+
+
+def _list_files(directory: Path, pattern: str):
+    """[(mtime, size, path)] ordenados del más antiguo al más reciente"""
+    if not directory.exists():
+        return []
+    files = []
+    for path in directory.glob(pattern):
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        if path.is_file():
+            files.append((st.st_mtime, st.st_size, path))
+    return sorted(files)
+
+
+def clean_directory(directory: Path, pattern: str, ttl_days: float, quota_mb: float, protected: set,
+                    min_age_minutes: float, dry_run: bool = False) -> dict:
+    """
+    Borra archivos expirados (TTL) y después los más antiguos hasta respetar la cuota
+
+    Returns:
+        {"directory", "deleted", "reclaimed_bytes", "remaining_bytes", "protected"}
+    """
+    now = time.time()
+    files = _list_files(directory, pattern)
+    total = sum(size for _, size, _ in files)
+    deleted = 0
+    reclaimed = 0
+    skipped = 0
+    for mtime, size, path in files:
+        age = now - mtime
+        expired = ttl_days > 0 and age > ttl_days * DAY
+        over_quota = quota_mb > 0 and total - reclaimed > quota_mb * MB
+        if not (expired or over_quota):
+            continue
+        if age < min_age_minutes * 60 or os.path.realpath(path) in protected:
+            skipped += 1
+            continue
+        if not dry_run:
+            try:
+                path.unlink()
+            except OSError as e:
+                print(f"⚠️  No se pudo borrar {path}: {e}")
+                continue
+        deleted += 1
+        reclaimed += size
+    return {"directory": str(directory), "deleted": deleted, "reclaimed_bytes": reclaimed,
+            "remaining_bytes": total - reclaimed, "protected": skipped}
+
+
+def clean_backups(keep: int, dry_run: bool = False) -> dict:
+    """Conserva solo los últimos keep backups del modelo"""
+    files = _list_files(BACKUP_DIR, "best_model_backup_*.pth")
+    old = files[:-keep] if keep > 0 else files
+    reclaimed = 0
+    for _, size, path in old:
+        if not dry_run:
+            path.unlink(missing_ok=True)
+        reclaimed += size
+    return {"directory": str(BACKUP_DIR), "deleted": len(old), "reclaimed_bytes": reclaimed,
+            "remaining_bytes": sum(size for _, size, _ in files) - reclaimed, "protected": 0}
+
+
+def clean_unreferenced(directory: Path, protected: set, min_age_minutes: float, dry_run: bool = False) -> dict:
+    """Borra los archivos de directory (y sus subdirectorios) que no están en protected"""
+    now = time.time()
+    files = _list_files(directory, "**/*")
+    total = sum(size for _, size, _ in files)
+    deleted = 0
+    reclaimed = 0
+    skipped = 0
+    for mtime, size, path in files:
+        if now - mtime < min_age_minutes * 60 or os.path.realpath(path) in protected:
+            skipped += 1
+            continue
+        if not dry_run:
+            try:
+                path.unlink()
+            except OSError as e:
+                print(f"⚠️  No se pudo borrar {path}: {e}")
+                continue
+        deleted += 1
+        reclaimed += size
+    return {"directory": str(directory), "deleted": deleted, "reclaimed_bytes": reclaimed,
+            "remaining_bytes": total - reclaimed, "protected": skipped}
+
+
+def run_janitor(config: dict = None, dry_run: bool = False):
+    """
+    Ejecuta una pasada de limpieza si ningún otro proceso la está ejecutando
+
+    Returns:
+        Lista de resultados por directorio, o None si otro proceso tiene el lock
+    """
+    config = {**default_config(), **(config or {})}
+    LOCK_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(LOCK_PATH, "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        protected = protected_paths(config["replay_only"])
+        results = [
+            clean_directory(UPLOAD_DIR, "*", config["uploads_ttl_days"], config["uploads_quota_mb"],
+                            protected, config["min_age_minutes"], dry_run),
+            clean_directory(OUTPUT_DIR, "processed_images_*.csv", config["outputs_ttl_days"],
+                            config["outputs_quota_mb"], protected, config["min_age_minutes"], dry_run),
+            clean_backups(config["backups_keep"], dry_run),
+            clean_unreferenced(FEEDBACK_IMAGES_DIR, protected, config["min_age_minutes"], dry_run),
+        ]
+    if not dry_run:
+        for r in results:
+            metrics.JANITOR_RECLAIMED_BYTES.labels(directory=r["directory"]).inc(r["reclaimed_bytes"])
+            metrics.JANITOR_DELETED_FILES.labels(directory=r["directory"]).inc(r["deleted"])
+    return results
+
+
+def janitor_loop(interval_minutes: float):
+    """Bucle del hilo de limpieza de la API"""
+    while True:
+        time.sleep(interval_minutes * 60)
+        try:
+            results = run_janitor()
+        except Exception as e:
+            print(f"⚠️  Error en la limpieza periódica: {e}")
+            continue
+        if results and any(r["deleted"] for r in results):
+            print("🧹 Limpieza: " + ", ".join(
+                f"{r['directory']} -{r['deleted']} ({r['reclaimed_bytes'] / MB:.1f} MB)" for r in results))
+
+
+def main():
+    config = default_config()
+    parser = argparse.ArgumentParser(description="Limpia uploads/, outputs/, backups y copias de feedback sin referencias")
+    parser.add_argument("--uploads-ttl-days", type=float, default=config["uploads_ttl_days"])
+    parser.add_argument("--uploads-quota-mb", type=float, default=config["uploads_quota_mb"])
+    parser.add_argument("--outputs-ttl-days", type=float, default=config["outputs_ttl_days"])
+    parser.add_argument("--outputs-quota-mb", type=float, default=config["outputs_quota_mb"])
+    parser.add_argument("--backups-keep", type=int, default=config["backups_keep"])
+    parser.add_argument("--min-age-minutes", type=float, default=config["min_age_minutes"])
+    parser.add_argument("--replay-only", action="store_true", default=config["replay_only"],
+                        help="Los reentrenamientos usan --replay: permitir borrar feedback ya reentrenado")
+    parser.add_argument("--dry-run", action="store_true", help="Solo mostrar qué se borraría")
+    args = parser.parse_args()
+
+    results = run_janitor({k: v for k, v in vars(args).items() if k != "dry_run"}, dry_run=args.dry_run)
+    if results is None:
+        print("⚠️  Otra limpieza está en curso")
+        return
+    verb = "se borrarían" if args.dry_run else "borrados"
+    for r in results:
+        print(f"🧹 {r['directory']}: {r['deleted']} archivos {verb} ({r['reclaimed_bytes'] / MB:.1f} MB), "
+              f"{r['protected']} protegidos, quedan {r['remaining_bytes'] / MB:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,43 +2,43 @@
 Backend API para procesamiento de imágenes con IA
 FastAPI - Servicio web para procesar imágenes y generar CSV
 """
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, Response
 from typing import List
 import os
+import re
 import tempfile
-import shutil
 import uuid
+import subprocess
+import threading
+import importlib.util
+import time
 from pathlib import Path
-import uvicorn
 from PIL import Image
 from datetime import datetime
 
-# Importar pandas al inicio para asegurar que esté disponible
+import metrics
+import profiling
+from metrics import observe_stage
+from perceptual_hash import dhash_file
+from hw_profile import hw_setting, PROFILE_PATH
+
+# Las dependencias pesadas (pandas, torch) no se importan aquí: el worker arranca y
+# responde a /health de inmediato. pandas se importa en feedback_storage al primer uso
+# y predict (torch) en el hilo de precarga del modelo (ver preload_model).
 import sys
-try:
-    import pandas as pd
-    PANDAS_AVAILABLE = True
-    print(f"✅ pandas cargado al inicio desde: {pd.__file__}")
-except ImportError as e:
-    PANDAS_AVAILABLE = False
+PANDAS_AVAILABLE = importlib.util.find_spec("pandas") is not None
+if not PANDAS_AVAILABLE:
     print(f"❌ ERROR CRÍTICO: pandas no está instalado")
     print(f"   Python usado: {sys.executable}")
     print(f"   Instala con: {sys.executable} -m pip install pandas")
-    print(f"   Error: {e}")
-
-# Importar módulo de predicción
-try:
-    from predict import get_model, predict_image
-    MODEL_AVAILABLE = True
-except ImportError:
-    MODEL_AVAILABLE = False
-    print("⚠️  Advertencia: No se pudo importar el módulo de predicción. "
+
+MODEL_AVAILABLE = importlib.util.find_spec("torch") is not None
+if not MODEL_AVAILABLE:
+    print("⚠️  Advertencia: torch no está instalado. "
           "Las imágenes se procesarán sin clasificación.")
-except Exception as e:
-    MODEL_AVAILABLE = False
-    print(f"⚠️  Advertencia: Error al cargar el modelo: {e}")
 
 app = FastAPI(
     title="Image Processor API",
@@ -63,12 +63,131 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def track_in_flight(request, call_next):
+    """Gauge de peticiones en curso (agregado entre workers)"""
+    if request.url.path == "/metrics":
+        return await call_next(request)
+    with metrics.track_in_flight():
+        return await call_next(request)
+
+
 # Directorio para almacenar archivos temporales
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 OUTPUT_DIR = Path("outputs")
 OUTPUT_DIR.mkdir(exist_ok=True)
 
+# Las subidas se escriben por bloques en un thread pool: uploads/ puede estar en un disco de red
+# (start.sh lo enlaza a /app/data) y una escritura bloqueante congelaría el event loop
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_FILE_BYTES = int(float(os.environ.get("MAX_UPLOAD_FILE_MB", "10")) * 1024 * 1024)
+MAX_UPLOAD_REQUEST_BYTES = int(float(os.environ.get("MAX_UPLOAD_REQUEST_MB", "200")) * 1024 * 1024)
+# El frontend sube por lotes en paralelo y comparte un batch_id (nombre del CSV común)
+BATCH_ID_RE = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+# Margen para las cabeceras multipart y los campos del formulario (client_resized, batch_id)
+UPLOAD_FORM_OVERHEAD_BYTES = 1024 * 1024
+UPLOAD_PATHS = {"/api/v1/images/process"}
+
+
+class UploadTooLarge(Exception):
+    """El archivo superó el límite disponible mientras se escribía"""
+
+
+class RequestBodyTooLarge(Exception):
+    """El cuerpo de la petición superó MAX_UPLOAD_REQUEST_BYTES mientras se recibía"""
+
+
+class UploadSizeLimit:
+    """
+    Rechaza con 413 las subidas más grandes que MAX_UPLOAD_REQUEST_BYTES antes de parsear el formulario
+
+    Starlette recibe todo el multipart (y lo vuelca a archivos temporales) antes de llamar al
+    endpoint: sin esto una petición de 5 GB se leería entera antes del 413. Se rechaza por
+    Content-Length y, si no viene (chunked), al superar el límite mientras se recibe.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in UPLOAD_PATHS:
+            return await self.app(scope, receive, send)
+        limit = MAX_UPLOAD_REQUEST_BYTES + UPLOAD_FORM_OVERHEAD_BYTES
+        too_large = JSONResponse(
+            status_code=413,
+            content={"detail": f"La petición supera el límite de {MAX_UPLOAD_REQUEST_BYTES // (1024 * 1024)} MB"}
+        )
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            return await too_large(scope, receive, send)
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise RequestBodyTooLarge()
+            return message
+
+        async def tracked_send(message):
+            nonlocal response_started
+            if exceeded:
+                # FastAPI convierte el error de lectura en un 400: se sustituye por el 413
+                if not response_started:
+                    response_started = True
+                    await too_large(scope, receive, send)
+                return
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except RequestBodyTooLarge:
+            if not response_started:
+                await too_large(scope, receive, send)
+
+
+app.add_middleware(UploadSizeLimit)
+
+
+async def save_upload(file: UploadFile, path: Path, limit: int) -> int:
+    """
+    Escribe la subida en path por bloques sin bloquear el event loop
+
+    Args:
+        file: Archivo subido
+        path: Destino
+        limit: Bytes máximos permitidos para este archivo
+
+    Returns:
+        Bytes escritos
+
+    Raises:
+        UploadTooLarge: si el archivo supera limit (el archivo parcial se elimina)
+    """
+    written = 0
+    buffer = await run_in_threadpool(open, path, "wb")
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            written += len(chunk)
+            if written > limit:
+                raise UploadTooLarge()
+            await run_in_threadpool(buffer.write, chunk)
+    except BaseException:
+        await run_in_threadpool(buffer.close)
+        await run_in_threadpool(path.unlink, missing_ok=True)
+        raise
+    await run_in_threadpool(buffer.close)
+    return written
+
 
 @app.get("/")
 async def root():
@@ -78,27 +197,151 @@ async def root():
 
 @app.get("/health")
 async def health():
-    """Health check endpoint"""
+    """Health check endpoint (liveness: el proceso responde)"""
     return {"status": "healthy"}
 
 
+# Estado de preparación del worker: el modelo se carga y calienta al arrancar
+readiness_state = {
+    "ready": False,
+    "model": "loading",  # loading, loaded, unavailable, error
+    "warmup_seconds": None,
+    "error": None
+}
+# Tamaños de batch con los que se calienta el modelo (los de servicio; el segundo sale del
+# perfil de hardware de autotune.py si existe)
+WARMUP_BATCH_SIZES = [int(b) for b in os.environ.get(
+    "WARMUP_BATCH_SIZES", f"1,{hw_setting('inference', 'batch_size', 8)}").split(",") if b.strip()]
+
+def preload_model():
+    """Carga el modelo y ejecuta forwards de calentamiento; al terminar marca el worker como listo"""
+    global MODEL_AVAILABLE
+    try:
+        if MODEL_AVAILABLE:
+            try:
+                from predict import warm_up
+            except ImportError as e:
+                MODEL_AVAILABLE = False
+                raise ImportError(f"No se pudo importar el módulo de predicción: {e}")
+            info = warm_up(WARMUP_BATCH_SIZES)
+            from predict import MODEL_PATH, INFERENCE_BACKEND, INFERENCE_PRECISION
+            import torch
+            if hw_setting("inference", "threads") is not None:
+                print(f"📊 Perfil de hardware {PROFILE_PATH}: {torch.get_num_threads()} hilos, "
+                      f"backend {INFERENCE_BACKEND}, {INFERENCE_PRECISION}")
+            metrics.MODEL_VERSION.set(os.path.getmtime(MODEL_PATH))
+            readiness_state["model"] = "loaded"
+            readiness_state["warmup_seconds"] = info["seconds"]
+            print(f"✅ Modelo cargado y calentado en {info['seconds']}s (batch sizes: {info['batch_sizes']})")
+        else:
+            readiness_state["model"] = "unavailable"
+    except (FileNotFoundError, ImportError) as e:
+        # Sin modelo entrenado (o sin torch) la API sigue funcionando (imágenes "no clasificado")
+        readiness_state["model"] = "unavailable"
+        readiness_state["error"] = str(e)
+        print(f"⚠️  {e}")
+    except Exception as e:
+        readiness_state["model"] = "error"
+        readiness_state["error"] = str(e)
+        print(f"⚠️  Error al precargar el modelo: {e}")
+    # Un worker cuyo modelo falló al cargar no está listo (/ready responde 503)
+    readiness_state["ready"] = readiness_state["model"] in ("loaded", "unavailable")
+
+
+@app.on_event("startup")
+async def start_preload():
+    # En un hilo para que el worker acepte conexiones (/health) mientras carga
+    threading.Thread(target=preload_model, daemon=True).start()
+
+
+# Limpieza periódica de uploads/, outputs/ y backups (0 la desactiva; ver janitor.py)
+JANITOR_INTERVAL_MINUTES = float(os.environ.get("JANITOR_INTERVAL_MINUTES", "60"))
+
+
+@app.on_event("startup")
+async def start_janitor():
+    if JANITOR_INTERVAL_MINUTES > 0:
+        from janitor import janitor_loop
+        threading.Thread(target=janitor_loop, args=(JANITOR_INTERVAL_MINUTES,), daemon=True).start()
+
+
+@app.on_event("shutdown")
+async def cleanup_metrics():
+    metrics.mark_process_dead()
+
+
+@app.on_event("shutdown")
+async def flush_feedback_queue():
+    # Escribir el feedback encolado antes de que el worker termine
+    if PANDAS_AVAILABLE and "feedback_storage" in sys.modules:
+        from feedback_storage import flush_feedback
+        flush_feedback()
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Métricas en formato Prometheus (agregadas entre workers con PROMETHEUS_MULTIPROC_DIR)"""
+    try:
+        body, content_type = metrics.render_metrics()
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 503 hasta que el modelo está cargado y calentado, y si falló al cargar
+
+    Usado por el HEALTHCHECK de Docker y los balanceadores para no enviar tráfico
+    a un worker que aún pagaría el arranque en frío o que no puede clasificar
+    """
+    if readiness_state["model"] == "error":
+        return JSONResponse(status_code=503, content={"status": "error", **readiness_state})
+    if not readiness_state["ready"]:
+        return JSONResponse(status_code=503, content={"status": "starting", **readiness_state})
+    return {"status": "ready", **readiness_state}
+
+
 @app.post("/api/v1/images/process")
 async def process_images(
+    request: Request,
     files: List[UploadFile] = File(...),
+    client_resized: List[bool] = Form(None),
+    batch_id: str = Form(None),
     options: dict = None
 ):
     """
     Procesa múltiples imágenes y genera un CSV con los resultados
     
+    Con la cabecera X-Profile-Token (o ?profile=) igual a ADMIN_TOKEN la petición se perfila
+    y la ruta del reporte se devuelve en la cabecera X-Profile-Path.
+    
     Args:
         files: Lista de archivos de imagen a procesar
+        client_resized: Un valor por archivo: true si el frontend lo redujo antes de subirlo
+            (se registra como source "api_upload_resized" en el CSV)
+        batch_id: Identificador de la subida cuando el frontend la reparte en varias
+            peticiones; todas añaden sus filas al mismo CSV (processed_images_<batch_id>.csv)
         options: Opciones adicionales para el procesamiento
     
     Returns:
         JSON con información del procesamiento y URL para descargar el CSV
     """
+    if not profiling.profile_requested(request):
+        return await _process_images(files, client_resized, options, batch_id)
+    with profiling.profile_block("process_images") as report:
+        response = await _process_images(files, client_resized, options, batch_id)
+    response.headers["X-Profile-Path"] = report["path"]
+    return response
+
+
+async def _process_images(files: List[UploadFile], client_resized: List[bool] = None, options: dict = None,
+                          batch_id: str = None):
     if not files:
         raise HTTPException(status_code=400, detail="No se proporcionaron archivos")
+    if batch_id is not None and not BATCH_ID_RE.fullmatch(batch_id):
+        raise HTTPException(status_code=400, detail="batch_id inválido (letras, números, - y _; máx. 64)")
     
     # Validar tipos de archivo - soporta todos los formatos que Pillow puede leer
     # No limitamos por extensión, validamos intentando abrir la imagen con Pillow
@@ -118,22 +361,37 @@ async def process_images(
         except Exception:
             return False
     
+    temp_files = []
+    request_bytes = 0
     try:
         # Guardar archivos temporalmente
-        temp_files = []
-        for file in files:
+        for index, file in enumerate(files):
             # Guardar archivo temporal primero para validarlo
             # Usamos un nombre único para evitar conflictos
             file_ext = Path(file.filename).suffix
             unique_filename = f"{uuid.uuid4()}{file_ext}"
             temp_path = UPLOAD_DIR / unique_filename
             
-            # Guardar el archivo
-            with open(temp_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            # Guardar el archivo (límite por archivo y por petición aplicado mientras se escribe)
+            remaining = MAX_UPLOAD_REQUEST_BYTES - request_bytes
+            try:
+                with observe_stage("upload_write"):
+                    size = await save_upload(file, temp_path, min(MAX_UPLOAD_FILE_BYTES, remaining))
+            except UploadTooLarge:
+                if remaining < MAX_UPLOAD_FILE_BYTES:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"La petición supera el límite de {MAX_UPLOAD_REQUEST_BYTES // (1024 * 1024)} MB"
+                    )
+                errors.append(f"Archivo {file.filename}: supera el límite de {MAX_UPLOAD_FILE_BYTES // (1024 * 1024)} MB")
+                continue
+            request_bytes += size
             
             # Validar que realmente sea una imagen válida
-            if not is_valid_image_file(temp_path):
+            with observe_stage("validation"):
+                valid = await run_in_threadpool(is_valid_image_file, temp_path)
+            if not valid:
+                metrics.INVALID_FILES.inc()
                 errors.append(f"Archivo {file.filename}: no es una imagen válida o formato no soportado")
                 if temp_path.exists():
                     temp_path.unlink()  # Eliminar archivo inválido
@@ -145,24 +403,39 @@ async def process_images(
             classification = None
             if MODEL_AVAILABLE:
                 try:
-                    model = get_model()
-                    prediction = predict_image(model, str(temp_path))
+                    from predict import preprocess_image, classify_batch
+                    with observe_stage("preprocess"):
+                        tensor = preprocess_image(str(temp_path))
+                    # Con CASCADE_MODEL_PATH, un modelo barato decide y solo escala las dudosas
+                    start = time.perf_counter()
+                    prediction = classify_batch(tensor)[0]
+                    elapsed = time.perf_counter() - start
+                    metrics.STAGE_SECONDS.labels(stage="inference").observe(elapsed)
+                    metrics.INFERENCE_SECONDS.labels(batch_size=str(tensor.shape[0])).observe(elapsed)
+                    metrics.CASCADE_DECISIONS.labels(stage=prediction["stage"]).inc()
                     classification = {
                         "label": prediction["label"],
                         "label_name": prediction["label_name"],
                         "label_name_es": prediction["label_name_es"],
-                        "confidence": round(prediction["confidence"], 4)
+                        "confidence": round(prediction["confidence"], 4),
+                        "stage": prediction["stage"]  # "fast" (primera etapa) o "full" (modelo completo)
                     }
                     
                     # Guardar feedback automáticamente para aprendizaje continuo
                     try:
-                        from feedback_storage import save_feedback
-                        save_feedback(
-                            image_path=str(temp_path),
-                            predicted_label=prediction["label"],
-                            predicted_label_name=prediction["label_name"],
-                            confidence=prediction["confidence"]
-                        )
+                        # Se encola: la escritura en disco se hace en lotes fuera de la petición
+                        from feedback_storage import enqueue_feedback
+                        # Hash perceptual para descartar casi duplicados al reentrenar
+                        with observe_stage("phash"):
+                            phash = await run_in_threadpool(dhash_file, temp_path)
+                        with observe_stage("feedback_enqueue"):
+                            enqueue_feedback(
+                                image_path=str(temp_path),
+                                predicted_label=prediction["label"],
+                                predicted_label_name=prediction["label_name"],
+                                confidence=prediction["confidence"],
+                                phash=phash
+                            )
                     except ImportError as e:
                         print(f"⚠️  No se pudo importar feedback_storage (pandas no disponible): {e}")
                     except Exception as e:
@@ -172,23 +445,32 @@ async def process_images(
                     print(f"Error al clasificar {file.filename}: {e}")
                     classification = {"error": str(e)}
             
+            if classification is None:
+                metrics.IMAGES_PROCESSED.labels(result="unclassified").inc()
+            elif "error" in classification:
+                metrics.IMAGES_PROCESSED.labels(result="error").inc()
+            else:
+                metrics.IMAGES_PROCESSED.labels(result="classified").inc()
+            
             processed_files.append({
                 "filename": file.filename,  # Nombre original del archivo
                 "path": str(temp_path),      # Ruta donde se guardó
-                "size": temp_path.stat().st_size,
+                "size": size,
                 "status": "processed",
-                "classification": classification
+                "classification": classification,
+                "resized": bool(client_resized and index < len(client_resized) and client_resized[index])
             })
         
         # Generar CSV usando la función de generate_csv.py
-        csv_path = await generate_csv(processed_files, options)
+        with observe_stage("csv"):
+            csv_path = await generate_csv(processed_files, options, batch_id)
         
         # Obtener estadísticas actualizadas después de procesar
         total_images_after = 0
         try:
-            from feedback_storage import get_statistics
-            stats = get_statistics()
-            total_images_after = stats['total_images']
+            # Sin vaciar la cola ni leer el CSV entero: cuenta escritos + encolados
+            from feedback_storage import feedback_count
+            total_images_after = await run_in_threadpool(feedback_count)
         except:
             pass
         
@@ -217,6 +499,8 @@ async def process_images(
             if temp_file.exists():
                 temp_file.unlink()
         
+        if isinstance(e, HTTPException):
+            raise
         raise HTTPException(status_code=500, detail=f"Error procesando imágenes: {str(e)}")
 
 
@@ -243,7 +527,7 @@ async def download_file(filename: str):
     )
 
 
-async def generate_csv(processed_files: List[dict], options: dict = None) -> str:
+async def generate_csv(processed_files: List[dict], options: dict = None, batch_id: str = None) -> str:
     """
     Genera un archivo CSV con los resultados del procesamiento
     Adapta la lógica de generate_csv.py para trabajar con archivos subidos
@@ -251,23 +535,33 @@ async def generate_csv(processed_files: List[dict], options: dict = None) -> str
     Args:
         processed_files: Lista de archivos procesados con sus rutas
         options: Opciones adicionales
+        batch_id: Si se indica, las filas se añaden a processed_images_<batch_id>.csv
+            (una subida repartida en varias peticiones paralelas genera un solo CSV)
     
     Returns:
         Ruta del archivo CSV generado
     """
     import csv
+    import fcntl
     from datetime import datetime
     
     # Generar nombre único para el CSV
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    csv_filename = f"processed_images_{timestamp}.csv"
+    if batch_id:
+        csv_filename = f"processed_images_{batch_id}.csv"
+    else:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        csv_filename = f"processed_images_{timestamp}.csv"
     csv_path = OUTPUT_DIR / csv_filename
     
     # Escribir CSV siguiendo el formato de generate_csv.py
     # Formato: image_path, label, timestamp, source, label_name
-    with open(csv_path, "w", newline="", encoding="utf-8") as csvfile:
+    with open(csv_path, "a" if batch_id else "w", newline="", encoding="utf-8") as csvfile:
+        # Las peticiones de un mismo batch_id pueden llegar a la vez (y a workers distintos)
+        fcntl.flock(csvfile, fcntl.LOCK_EX)
+        csvfile.seek(0, os.SEEK_END)
         writer = csv.writer(csvfile)
-        writer.writerow(["image_path", "label", "timestamp", "source", "label_name"])
+        if csvfile.tell() == 0:
+            writer.writerow(["image_path", "label", "timestamp", "source", "label_name"])
         
         for file_info in processed_files:
             # Usar la clasificación del modelo si está disponible
@@ -280,7 +574,8 @@ async def generate_csv(processed_files: List[dict], options: dict = None) -> str
                 label_name = "no clasificado"
             
             timestamp_str = datetime.now().isoformat()
-            source = "api_upload"
+            # Subidas reducidas en el navegador (lado mayor VITE_MAX_UPLOAD_EDGE)
+            source = "api_upload_resized" if file_info.get("resized") else "api_upload"
             
             writer.writerow([
                 file_info["path"],
@@ -353,8 +648,10 @@ async def correct_classification(correction: CorrectionRequest):
             confidence=float(last_entry['confidence']),
             corrected_label=correction.corrected_label,
             corrected_label_name=correction.corrected_label_name or label_names_es.get(correction.corrected_label, ""),
-            user_feedback=correction.user_feedback
+            user_feedback=correction.user_feedback,
+            phash=last_entry['phash'] if isinstance(last_entry.get('phash'), str) else None
         )
+        metrics.CORRECTIONS.inc()
         
         return {
             "success": True,
@@ -366,6 +663,55 @@ async def correct_classification(correction: CorrectionRequest):
         raise HTTPException(status_code=500, detail=f"Error guardando corrección: {str(e)}")
 
 
+MAX_BULK_CORRECTIONS = 1000
+
+
+class BulkCorrectionRequest(BaseModel):
+    corrections: List[CorrectionRequest]
+
+
+@app.post("/api/v1/feedback/correct/bulk")
+async def correct_classifications_bulk(request: BulkCorrectionRequest):
+    """
+    Aplica varias correcciones en una sola pasada sobre el almacenamiento de feedback
+    
+    Args:
+        request: Objeto con la lista de correcciones (mismo formato que /api/v1/feedback/correct)
+    
+    Returns:
+        Resultado por corrección (success y error) en el mismo orden
+    """
+    if not request.corrections:
+        raise HTTPException(status_code=400, detail="No se proporcionaron correcciones")
+    if len(request.corrections) > MAX_BULK_CORRECTIONS:
+        raise HTTPException(status_code=413, detail=f"Máximo {MAX_BULK_CORRECTIONS} correcciones por petición")
+    try:
+        from feedback_storage import save_corrections
+        results = await run_in_threadpool(save_corrections, [c.model_dump() for c in request.corrections])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error guardando correcciones: {str(e)}")
+    
+    applied = sum(1 for r in results if r["success"])
+    metrics.CORRECTIONS.inc(applied)
+    return {
+        "success": applied == len(results),
+        "applied": applied,
+        "failed": len(results) - applied,
+        "results": results
+    }
+
+
+@app.post("/api/v1/feedback/flush")
+async def flush_feedback_endpoint():
+    """Escribe en disco el feedback encolado en este worker (útil en tests y antes de reentrenar)"""
+    try:
+        from feedback_storage import flush_feedback
+        flushed = await run_in_threadpool(flush_feedback)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error escribiendo feedback: {str(e)}")
+    return {"success": True, "flushed": flushed}
+
+
 @app.get("/api/v1/feedback/stats")
 async def get_feedback_stats():
     """Obtiene estadísticas del feedback para aprendizaje continuo"""
@@ -419,14 +765,19 @@ retraining_state = {
     "message": "",
     "error": None,
     "started_at": None,
-    "completed_at": None
+    "completed_at": None,
+    "paused": False,  # True mientras el entrenamiento está pausado por carga de la API
+    "paused_seconds": 0
 }
 
-import threading
+RETRAIN_TIMEOUT = 3600  # 1 hora máximo
+RETRAIN_LOG = OUTPUT_DIR / "retrain.log"
 
-def run_retraining_background(epochs: int, min_feedback: int):
+def run_retraining_background(epochs: int, min_feedback: int, mode: str = "full", replay: bool = False,
+                              resume: bool = False):
     """Ejecuta el reentrenamiento en background"""
     global retraining_state
+    metrics.RETRAINING.set(1)
     try:
         retraining_state["status"] = "running"
         retraining_state["progress"] = 0
@@ -434,10 +785,16 @@ def run_retraining_background(epochs: int, min_feedback: int):
         retraining_state["error"] = None
         retraining_state["started_at"] = datetime.now().isoformat()
         retraining_state["completed_at"] = None
+        retraining_state["paused_seconds"] = 0
         
-        import subprocess
-        from feedback_storage import get_statistics
+        from retrain_isolation import limits_from_env, run_isolated, log_tail
         
+        # El subproceso lee feedback.csv: escribir antes el feedback encolado en este worker
+        if PANDAS_AVAILABLE:
+            from feedback_storage import flush_feedback
+            flush_feedback()
+        
+        from feedback_storage import get_statistics
         stats = get_statistics()
         if stats['total_images'] < min_feedback:
             retraining_state["status"] = "error"
@@ -449,14 +806,26 @@ def run_retraining_background(epochs: int, min_feedback: int):
         retraining_state["message"] = "Ejecutando script de reentrenamiento..."
         
         # Ejecutar reentrenamiento
-        result = subprocess.run(
-            ["python", "incremental_train.py", "--epochs", str(epochs), "--min-feedback", str(min_feedback)],
-            capture_output=True,
-            text=True,
-            timeout=3600  # 1 hora máximo
+        cmd = ["python", "incremental_train.py", "--epochs", str(epochs), "--min-feedback", str(min_feedback),
+               "--mode", mode]
+        if replay:
+            cmd.append("--replay")
+        if resume:
+            cmd.append("--resume")
+        # Terminar de forma ordenada antes del timeout (queda margen para el test y el holdout)
+        cmd += ["--time-budget", str(int(RETRAIN_TIMEOUT * 0.9))]
+        # nice/ionice, hilos acotados, afinidad, cgroup y pausa cuando la API está cargada
+        returncode, paused_seconds, _ = run_isolated(
+            cmd,
+            limits_from_env(),
+            timeout=RETRAIN_TIMEOUT,
+            log_path=RETRAIN_LOG,
+            queue_depth=metrics.serving_queue_depth,
+            on_state=lambda paused: retraining_state.update(paused=paused)
         )
+        retraining_state["paused_seconds"] = paused_seconds
         
-        if result.returncode == 0:
+        if returncode == 0:
             retraining_state["status"] = "completed"
             retraining_state["progress"] = 100
             retraining_state["message"] = "Reentrenamiento completado exitosamente"
@@ -464,34 +833,44 @@ def run_retraining_background(epochs: int, min_feedback: int):
         else:
             retraining_state["status"] = "error"
             retraining_state["message"] = "Error durante el reentrenamiento"
-            retraining_state["error"] = result.stderr[:500]  # Limitar tamaño del error
+            retraining_state["error"] = log_tail(RETRAIN_LOG)  # Limitar tamaño del error
             retraining_state["completed_at"] = datetime.now().isoformat()
             
     except subprocess.TimeoutExpired:
         retraining_state["status"] = "error"
         retraining_state["message"] = "El reentrenamiento excedió el tiempo límite"
-        retraining_state["error"] = "Timeout después de 1 hora"
+        retraining_state["error"] = "Timeout después de 1 hora (reintenta con resume=true para continuar desde el último checkpoint)"
         retraining_state["completed_at"] = datetime.now().isoformat()
     except Exception as e:
         retraining_state["status"] = "error"
         retraining_state["message"] = f"Error ejecutando reentrenamiento: {str(e)}"
         retraining_state["error"] = str(e)
         retraining_state["completed_at"] = datetime.now().isoformat()
+    finally:
+        retraining_state["paused"] = False
+        metrics.RETRAINING.set(0)
 
 @app.post("/api/v1/model/retrain")
-async def trigger_retraining(epochs: int = 10, min_feedback: int = 10):
+async def trigger_retraining(epochs: int = 10, min_feedback: int = 10, mode: str = "full", replay: bool = False,
+                             resume: bool = False):
     """
     Dispara el reentrenamiento incremental del modelo (en background)
     
     Args:
         epochs: Número de épocas para reentrenar (default: 10)
         min_feedback: Mínimo de imágenes de feedback requeridas (default: 10)
+        mode: "full" (fine-tuning completo) o "head" (backbone congelado, solo la cabeza fc)
+        replay: Entrenar solo con feedback nuevo + muestra del replay buffer (coste constante)
+        resume: Continuar un reentrenamiento interrumpido desde su último checkpoint
     
     Returns:
         Estado del reentrenamiento iniciado
     """
     global retraining_state
     
+    if mode not in ("full", "head"):
+        raise HTTPException(status_code=400, detail="mode debe ser 'full' o 'head'")
+    
     # Si ya hay un reentrenamiento en curso, no iniciar otro
     if retraining_state["status"] == "running":
         return {
@@ -513,7 +892,7 @@ async def trigger_retraining(epochs: int = 10, min_feedback: int = 10):
     # Iniciar reentrenamiento en background
     thread = threading.Thread(
         target=run_retraining_background,
-        args=(epochs, min_feedback),
+        args=(epochs, min_feedback, mode, replay, resume),
         daemon=True
     )
     thread.start()
@@ -524,6 +903,19 @@ async def trigger_retraining(epochs: int = 10, min_feedback: int = 10):
         "state": retraining_state
     }
 
+@app.get("/api/v1/model/cascade/stats")
+async def get_cascade_statistics():
+    """
+    Estadísticas de la inferencia en cascada de este worker
+
+    Returns:
+        Imágenes clasificadas, escaladas al modelo completo y tasa de escalado
+    """
+    if not MODEL_AVAILABLE:
+        raise HTTPException(status_code=503, detail="El módulo de predicción no está disponible")
+    from predict import get_cascade_stats
+    return get_cascade_stats()
+
 @app.get("/api/v1/model/retrain/status")
 async def get_retraining_status():
     """
@@ -552,6 +944,7 @@ if __name__ == "__main__":
     print(f"   Python: {sys.executable}")
     print(f"   Pandas disponible: {PANDAS_AVAILABLE}")
     
+    import uvicorn
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
@@ -0,0 +1,148 @@
+"""
+Métricas Prometheus de la API (endpoint /metrics)
+
+- Histogramas por etapa de process_images (escritura, validación, preprocesado,
+  inferencia con el tamaño de batch como label, encolado del feedback y CSV) y de la
+  escritura en lotes del feedback
+- Contadores de imágenes procesadas, archivos inválidos, correcciones, decisiones
+  de la cascada y aciertos de la caché de características
+- Gauges de peticiones en curso, versión del modelo y reentrenamiento en curso
+- Bytes y archivos liberados por la limpieza periódica (janitor.py)
+
+Con varios workers de uvicorn, PROMETHEUS_MULTIPROC_DIR debe apuntar a un directorio vacío
+al arrancar (start.sh y el Dockerfile lo limpian): cada proceso escribe ahí sus valores y
+/metrics los agrega. Los reentrenamientos (subprocesos) heredan la variable y también reportan.
+
+prometheus_client es opcional: sin él las métricas son no-ops y /metrics responde 503.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    from prometheus_client import (
+        CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest, multiprocess,
+    )
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+# Buckets en segundos: de operaciones de E/S (ms) a inferencias lentas en CPU
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _NoopMetric:
+    """Sustituto cuando prometheus_client no está instalado"""
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+def _metric(kind: str, name: str, documentation: str, labelnames=(), **kwargs):
+    """Crea un Counter/Gauge/Histogram (o un no-op si prometheus_client no está instalado)"""
+    if not PROMETHEUS_AVAILABLE:
+        return _NoopMetric()
+    cls = {"counter": Counter, "gauge": Gauge, "histogram": Histogram}[kind]
+    return cls(name, documentation, labelnames, **kwargs)
+
+
+STAGE_SECONDS = _metric("histogram", "process_stage_seconds", "Duración de cada etapa de /api/v1/images/process",
+                        ["stage"], buckets=STAGE_BUCKETS)
+INFERENCE_SECONDS = _metric("histogram", "inference_seconds", "Duración de la inferencia del modelo",
+                            ["batch_size"], buckets=STAGE_BUCKETS)
+FEEDBACK_FLUSH_SECONDS = _metric("histogram", "feedback_flush_seconds",
+                                 "Duración de cada escritura en lote de feedback", buckets=STAGE_BUCKETS)
+IMAGES_PROCESSED = _metric("counter", "images_processed", "Imágenes procesadas por la API", ["result"])
+INVALID_FILES = _metric("counter", "invalid_files", "Archivos subidos que no son imágenes válidas")
+CORRECTIONS = _metric("counter", "corrections", "Correcciones de clasificación recibidas")
+CASCADE_DECISIONS = _metric("counter", "cascade_decisions",
+                            "Imágenes decididas por cada etapa de la cascada (full = escalada)", ["stage"])
+FEATURE_CACHE_LOOKUPS = _metric("counter", "feature_cache_lookups",
+                                "Búsquedas en la caché de características del backbone", ["result"])
+IN_FLIGHT = _metric("gauge", "http_requests_in_flight", "Peticiones HTTP en curso", multiprocess_mode="livesum")
+MODEL_VERSION = _metric("gauge", "model_version_timestamp_seconds",
+                        "mtime del modelo cargado (identifica la versión servida)", multiprocess_mode="livemax")
+RETRAINING = _metric("gauge", "retraining_running", "1 mientras hay un reentrenamiento en curso",
+                     multiprocess_mode="livemax")
+JANITOR_RECLAIMED_BYTES = _metric("counter", "janitor_reclaimed_bytes",
+                                  "Bytes liberados por la limpieza periódica", ["directory"])
+JANITOR_DELETED_FILES = _metric("counter", "janitor_deleted_files",
+                                "Archivos borrados por la limpieza periódica", ["directory"])
+
+
+@contextmanager
+def observe_duration(histogram):
+    """Mide la duración de un bloque en el histograma dado"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start)
+
+
+def observe_stage(stage: str):
+    """Mide la duración de un bloque en process_stage_seconds{stage}"""
+    return observe_duration(STAGE_SECONDS.labels(stage=stage))
+
+
+_local_in_flight = 0
+
+
+@contextmanager
+def track_in_flight():
+    """Cuenta una petición en curso (gauge agregado entre workers y contador local)"""
+    global _local_in_flight
+    IN_FLIGHT.inc()
+    _local_in_flight += 1
+    try:
+        yield
+    finally:
+        IN_FLIGHT.dec()
+        _local_in_flight -= 1
+
+
+def serving_queue_depth() -> int:
+    """Peticiones en curso en todos los workers (solo las de este proceso sin modo multiproceso)"""
+    if PROMETHEUS_AVAILABLE and MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        for family in registry.collect():
+            if family.name == "http_requests_in_flight":
+                return int(sum(sample.value for sample in family.samples))
+        return 0
+    return _local_in_flight
+
+
+def render_metrics():
+    """
+    Devuelve (cuerpo, content type) para /metrics, agregando todos los procesos en modo multiproceso
+
+    Raises:
+        RuntimeError: si prometheus_client no está instalado
+    """
+    if not PROMETHEUS_AVAILABLE:
+        raise RuntimeError("prometheus_client no está instalado. Instala con: pip install prometheus-client")
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead():
+    """Limpia los gauges "live" de este proceso al apagar el worker"""
+    if PROMETHEUS_AVAILABLE and MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
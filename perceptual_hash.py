@@ -0,0 +1,94 @@
+"""
+Hash perceptual (dHash) e índice BK-tree para detectar imágenes casi duplicadas
+
+dHash reduce la imagen a 9x8 en escala de grises y compara cada píxel con su vecino de
+la derecha: 64 bits que cambian poco con re-codificaciones, redimensionados o pequeños
+ajustes de brillo. Dos imágenes son casi duplicadas si la distancia de Hamming entre sus
+hashes es pequeña (<= 4 de 64 bits por defecto).
+
+El BK-tree indexa los hashes por distancia de Hamming: buscar los vecinos a distancia <= d
+solo recorre las ramas cuya distancia al nodo está en [dist - d, dist + d], en lugar de
+comparar contra todos los hashes.
+"""
+from typing import List, Optional, Tuple
+
+from PIL import Image
+
+HASH_SIZE = 8
+DEFAULT_MAX_DISTANCE = 4
+
+
+def dhash(img: Image.Image, hash_size: int = HASH_SIZE) -> int:
+    """dHash de una imagen PIL como entero de hash_size * hash_size bits"""
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def dhash_file(path, hash_size: int = HASH_SIZE) -> Optional[str]:
+    """
+    dHash de un archivo en hexadecimal (lo que se guarda en feedback.csv)
+
+    Returns:
+        Hash en hexadecimal, o None si la imagen no se puede leer
+    """
+    try:
+        with Image.open(path) as img:
+            # JPEG: decodificar directamente a baja resolución (mucho más rápido)
+            img.draft("L", (hash_size * 8, hash_size * 8))
+            return f"{dhash(img, hash_size):0{hash_size * hash_size // 4}x}"
+    except Exception:
+        return None
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """Índice de hashes por distancia de Hamming (cada nodo guarda un hash y sus elementos)"""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value: int, item=None):
+        self.size += 1
+        if self.root is None:
+            self.root = (value, [item], {})
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, [item], {})
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, object]]:
+        """Elementos a distancia <= max_distance, como (distancia, elemento)"""
+        if self.root is None:
+            return []
+        found = []
+        stack = [self.root]
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= max_distance:
+                found.extend((distance, item) for item in items)
+            for d, child in children.items():
+                if distance - max_distance <= d <= distance + max_distance:
+                    stack.append(child)
+        return found
+
+    def __len__(self):
+        return self.size
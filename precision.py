@@ -0,0 +1,82 @@
+"""
+Precisión numérica para entrenamiento e inferencia (fp32 o bf16 con autocast)
+
+bf16 conserva el rango de exponentes de fp32, así que no necesita loss scaling
+(GradScaler solo es necesario con fp16). Si la CPU no soporta bf16 de forma nativa
+(AVX512-BF16 / AMX), se vuelve a fp32 automáticamente: emularlo sería más lento.
+"""
+import contextlib
+import os
+
+import torch
+
+PRECISIONS = ("fp32", "bf16")
+
+
+def _cpu_flags():
+    """Flags de la CPU según /proc/cpuinfo ("flags" en x86, "Features" en ARM), o None si no existe"""
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    flags = set()
+    for line in lines:
+        key, _, value = line.partition(":")
+        if key.strip() in ("flags", "Features"):
+            flags.update(value.split())
+    return flags
+
+
+def cpu_supports_bf16() -> bool:
+    """
+    True si la CPU tiene instrucciones bf16 nativas (AVX512-BF16, AMX-BF16 o BF16 en ARM)
+
+    No basta con torch.ops.mkldnn._is_mkldnn_bf16_supported(): también es True en CPUs
+    AVX512 sin bf16 nativo, donde oneDNN lo emula y es más lento que fp32.
+    """
+    flags = _cpu_flags()
+    if flags is not None:
+        return bool(flags & {"avx512_bf16", "amx_bf16", "bf16"})
+    # Sin /proc/cpuinfo (macOS, Windows): capacidad detectada por torch
+    try:
+        capability = torch.backends.cpu.get_cpu_capability()
+    except Exception:
+        return False
+    return "BF16" in capability or "AMX" in capability
+
+
+def resolve_precision(requested: str, device) -> str:
+    """
+    Devuelve la precisión efectiva para el dispositivo
+
+    Args:
+        requested: "fp32" o "bf16"
+        device: torch.device donde se ejecuta el modelo
+    """
+    requested = (requested or "fp32").lower()
+    if requested not in PRECISIONS:
+        raise ValueError(f"Precisión no soportada: {requested} (opciones: {', '.join(PRECISIONS)})")
+    if requested == "fp32":
+        return "fp32"
+    if device.type == "cuda":
+        supported = torch.cuda.is_bf16_supported()
+    else:
+        supported = cpu_supports_bf16()
+    if not supported:
+        print(f"⚠️  bf16 no está soportado de forma nativa en {device.type}, se usa fp32")
+        return "fp32"
+    return "bf16"
+
+
+def autocast(precision: str, device):
+    """Context manager de autocast para la precisión indicada (no-op en fp32)"""
+    if precision == "bf16":
+        return torch.autocast(device.type, dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def add_precision_arg(parser, default: str = None):
+    """Agrega --precision al parser (por defecto la variable de entorno PRECISION o fp32)"""
+    parser.add_argument("--precision", choices=PRECISIONS, default=default or os.environ.get("PRECISION", "fp32"),
+                        help="fp32 o bf16 (autocast; vuelve a fp32 si la CPU no soporta bf16)")
@@ -1,17 +1,49 @@
 """
 Módulo para cargar el modelo entrenado y hacer predicciones sobre imágenes
 """
+import json
 import os
+import pickle
+import threading
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import numpy as np
 from PIL import Image, ImageOps
 from pathlib import Path
 
+from precision import resolve_precision, autocast
+from hw_profile import hw_setting
+
 # Configuración (debe coincidir con train_cats_pytorch.py)
 IMG_SIZE = 128
-MODEL_PATH = Path("artifacts/best_model.pth")
+# MODEL_PATH permite servir otro artefacto (p. ej. el estudiante destilado artifacts/student_model.pth)
+MODEL_PATH = Path(os.environ.get("MODEL_PATH", "artifacts/best_model.pth"))
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+# Los valores por defecto salen del perfil de hardware (python autotune.py) si existe;
+# las variables de entorno tienen prioridad
+# Precisión de inferencia: "fp32" (por defecto) o "bf16" (autocast; fp32 si la CPU no lo soporta)
+INFERENCE_PRECISION = resolve_precision(
+    os.environ.get("INFERENCE_PRECISION") or hw_setting("inference", "precision", "fp32"), device)
+# Backend: "eager" (por defecto) o "torchscript" (trace + freeze al cargar el modelo global)
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND") or hw_setting("inference", "backend", "eager")
+# Hilos de torch por proceso (cada worker de uvicorn tiene los suyos). Se aplican al cargar el
+# modelo global (get_model), no al importar: feature_cache.py y evaluate.py importan este
+# módulo dentro del entrenamiento, que tiene sus propios hilos (RETRAIN_THREADS, OMP_NUM_THREADS)
+INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS") or hw_setting("inference", "threads", 0))
+
+# Inferencia en cascada: un modelo barato (p. ej. el estudiante de distill.py) clasifica
+# todas las imágenes y solo las de confianza < CASCADE_THRESHOLD pasan al modelo completo.
+# Sin CASCADE_MODEL_PATH la cascada está desactivada.
+CASCADE_MODEL_PATH = os.environ.get("CASCADE_MODEL_PATH")
+CASCADE_THRESHOLD = float(os.environ.get("CASCADE_THRESHOLD", "0.9"))
+# Resolución de entrada de la primera etapa (menor que IMG_SIZE = más barata; requiere un
+# modelo con global average pooling como StudentCNN)
+CASCADE_IMG_SIZE = int(os.environ.get("CASCADE_IMG_SIZE", str(IMG_SIZE)))
+
+# Mapeo de clases
+LABEL_NAMES = {0: "healthy", 1: "sick"}
+LABEL_NAMES_ES = {0: "sano", 1: "enfermo"}
 
 # Arquitectura del modelo (debe coincidir con train_cats_pytorch.py)
 class SimpleCNN(nn.Module):
@@ -35,33 +67,166 @@ class SimpleCNN(nn.Module):
         return self.fc(self.conv(x))
 
 
-def load_model():
-    """Carga el modelo entrenado"""
-    if not MODEL_PATH.exists():
+class StudentCNN(nn.Module):
+    """
+    Clasificador compacto entrenado por destilación (ver distill.py)
+
+    Global average pooling en lugar del Linear de 32768 entradas de SimpleCNN,
+    y menos canales (width, 2*width, 4*width).
+    """
+    def __init__(self, width: int = 16):
+        super().__init__()
+        self.conv = nn.Sequential(
+            nn.Conv2d(3, width, 3, padding=1), nn.ReLU(), nn.MaxPool2d(2),
+            nn.Conv2d(width, width * 2, 3, padding=1), nn.ReLU(), nn.MaxPool2d(2),
+            nn.Conv2d(width * 2, width * 4, 3, padding=1), nn.ReLU(), nn.MaxPool2d(2),
+        )
+        self.fc = nn.Sequential(
+            nn.AdaptiveAvgPool2d(1),
+            nn.Flatten(),
+            nn.Linear(width * 4, 2)
+        )
+
+    def forward(self, x):
+        return self.fc(self.conv(x))
+
+
+# Arquitecturas que se pueden guardar como artefacto {"arch", "config", "state_dict"}
+ARCHITECTURES = {"simple_cnn": SimpleCNN, "student_cnn": StudentCNN}
+
+
+def model_artifact(model, arch: str, config: dict = None, **metadata) -> dict:
+    """Artefacto autodescriptivo que load_model sabe reconstruir"""
+    return {"arch": arch, "config": config or {}, "state_dict": model.state_dict(), **metadata}
+
+
+def read_weights(model_path: Path):
+    """
+    Lee los pesos con mmap: los tensores quedan respaldados por el archivo en el page cache,
+    así que todos los procesos que cargan el mismo archivo (workers de uvicorn, pools de
+    inferencia) comparten las mismas páginas de solo lectura en lugar de una copia cada uno.
+
+    Soporta .pth (state_dict o artefacto de model_artifact) y .safetensors (ver convert_weights.py).
+
+    Returns:
+        (arquitectura, config, state_dict, mapped): mapped es False si hubo que cargar una copia completa
+    """
+    if model_path.suffix == ".safetensors":
+        from safetensors import safe_open  # opcional: pip install safetensors
+        from safetensors.torch import load_file
+        with safe_open(str(model_path), framework="pt") as f:
+            metadata = f.metadata() or {}
+        return (metadata.get("arch", "simple_cnn"), json.loads(metadata.get("config", "{}")),
+                load_file(str(model_path), device="cpu"), True)
+    mapped = True
+    try:
+        checkpoint = torch.load(model_path, map_location="cpu", mmap=True, weights_only=True)
+    except (RuntimeError, pickle.UnpicklingError) as e:
+        # Formato legacy (no zip, no se puede mapear) o pickle completo con objetos que no son
+        # tensores: copia privada por worker. weights_only=False ejecuta el pickle, así que
+        # solo debe usarse con artefactos propios.
+        print(f"⚠️  {model_path} no se puede cargar con mmap ({type(e).__name__}); se carga una copia completa")
+        checkpoint = torch.load(model_path, map_location="cpu", weights_only=False)
+        mapped = False
+    if "arch" in checkpoint and "state_dict" in checkpoint:
+        return checkpoint["arch"], checkpoint.get("config", {}), checkpoint["state_dict"], mapped
+    return "simple_cnn", {}, checkpoint, mapped
+
+
+def load_model(model_path=None):
+    """
+    Carga el modelo entrenado
+
+    Acepta un state_dict de SimpleCNN (best_model.pth), un artefacto con
+    arquitectura (ver model_artifact), como el estudiante generado por distill.py,
+    o un archivo .safetensors. Los pesos se cargan con mmap (ver read_weights); el modelo
+    devuelto tiene shared_weights=True si siguen respaldados por el archivo.
+
+    Args:
+        model_path: Checkpoint a cargar (por defecto MODEL_PATH)
+    """
+    model_path = Path(model_path) if model_path else MODEL_PATH
+    if not model_path.exists():
         raise FileNotFoundError(
-            f"Modelo no encontrado en {MODEL_PATH}. "
+            f"Modelo no encontrado en {model_path}. "
             "Primero debes entrenar el modelo ejecutando train_cats_pytorch.py"
         )
     
-    model = SimpleCNN().to(device)
-    model.load_state_dict(torch.load(MODEL_PATH, map_location=device))
+    arch, config, state_dict, mapped = read_weights(model_path)
+    # Crear el modelo sin memoria (meta) y adoptar los tensores mapeados con assign=True:
+    # en CPU los pesos nunca se copian a memoria privada del worker
+    with torch.device("meta"):
+        model = ARCHITECTURES[arch](**config)
+    model.load_state_dict(state_dict, assign=True)
+    model.to(device)
     model.eval()
+    # En GPU .to() copia los pesos: solo se comparten en CPU
+    model.shared_weights = mapped and device.type == "cpu"
     return model
 
 
-def preprocess_image(image_path: str):
+def _private_constant_bytes(frozen, model) -> int:
+    """Bytes de las constantes del grafo congelado que no comparten memoria con los pesos del modelo"""
+    shared = {t.untyped_storage().data_ptr() for t in model.state_dict().values()}
+    total = 0
+    for node in frozen.graph.nodes():
+        if node.kind() == "prim::Constant" and node.output().type().kind() == "TensorType":
+            value = node.output().toIValue()
+            if value.untyped_storage().data_ptr() not in shared:
+                total += value.untyped_storage().nbytes()
+    return total
+
+
+def compile_model(model, backend: str = None, img_size: int = IMG_SIZE, precision: str = None,
+                  freeze: bool = None):
     """
-    Preprocesa una imagen para que sea compatible con el modelo
-    
+    Prepara el modelo para el backend de inferencia
+
+    "torchscript" traza el modelo con un batch de ejemplo y lo congela (pesos como constantes,
+    fusiones de operadores); el grafo admite cualquier tamaño de batch. Con bf16 se mantiene
+    eager: el autocast no se aplica de forma fiable a un grafo congelado.
+
+    Congelar no copia los pesos mientras las constantes sean los mismos tensores, pero las
+    fusiones que reescriben pesos (p. ej. conv + BatchNorm) crean tensores nuevos: con pesos
+    mmap (load_model, shared_weights=True) serían memoria privada de cada worker de uvicorn.
+    En ese caso, por defecto, se usa el grafo trazado sin congelar, que sigue usando los pesos
+    mapeados (un poco más lento, sin copia por worker). Ver benchmarks/worker_memory.py
+    --backend torchscript.
+
     Args:
-        image_path: Ruta a la imagen
-    
-    Returns:
-        Tensor preprocesado
+        model: Modelo en modo eval
+        backend: "eager" o "torchscript" (por defecto INFERENCE_BACKEND)
+        img_size: Resolución de entrada del modelo
+        precision: Precisión con la que se va a ejecutar (por defecto INFERENCE_PRECISION)
+        freeze: True congela siempre, False nunca; None congela salvo que copie pesos compartidos
+    """
+    backend = backend or INFERENCE_BACKEND
+    if backend == "eager":
+        return model
+    if backend != "torchscript":
+        raise ValueError(f"Backend de inferencia no soportado: {backend} (opciones: eager, torchscript)")
+    if (precision or INFERENCE_PRECISION) != "fp32":
+        print("⚠️  El backend torchscript solo se usa con fp32; se mantiene eager")
+        return model
+    example = torch.zeros(1, 3, img_size, img_size, device=device)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+        if freeze is False:
+            return traced
+        frozen = torch.jit.freeze(traced)
+    if freeze is None and getattr(model, "shared_weights", False):
+        private = _private_constant_bytes(frozen, model)
+        if private:
+            print(f"⚠️  Congelar el grafo copiaría {private / 1e6:.1f} MB de pesos mmap por worker; "
+                  "se usa el grafo trazado sin congelar")
+            return traced
+    return frozen
+
+
+def image_to_tensor(img):
+    """
+    Convierte una imagen PIL en RGB a un tensor CHW normalizado (sin dimensión de batch)
     """
-    # Cargar y convertir a RGB
-    img = Image.open(image_path).convert('RGB')
-    
     # Redimensionar
     img = img.resize((IMG_SIZE, IMG_SIZE))
     
@@ -76,8 +241,24 @@ def preprocess_image(image_path: str):
     # Transponer de HWC a CHW
     arr = np.transpose(arr, (2, 0, 1))
     
+    return torch.from_numpy(arr).float()
+
+
+def preprocess_image(image_path: str):
+    """
+    Preprocesa una imagen para que sea compatible con el modelo
+    
+    Args:
+        image_path: Ruta a la imagen
+    
+    Returns:
+        Tensor preprocesado
+    """
+    # Cargar y convertir a RGB
+    img = Image.open(image_path).convert('RGB')
+    
     # Convertir a tensor y agregar dimensión de batch
-    tensor = torch.from_numpy(arr).float().unsqueeze(0)
+    tensor = image_to_tensor(img).unsqueeze(0)
     
     return tensor.to(device)
 
@@ -101,34 +282,159 @@ def predict_image(model, image_path: str):
     tensor = preprocess_image(image_path)
     
     # Hacer predicción
-    with torch.no_grad():
-        output = model(tensor)
-        probabilities = torch.softmax(output, dim=1)
-        predicted_class = output.argmax(dim=1).item()
-        confidence = probabilities[0][predicted_class].item()
-    
-    # Mapear a nombres
-    label_names = {0: "healthy", 1: "sick"}
-    label_names_es = {0: "sano", 1: "enfermo"}
+    return predict_batch(model, tensor)[0]
+
+
+def predict_batch(model, batch, precision=None):
+    """
+    Predice un lote de imágenes ya preprocesadas
+
+    Args:
+        model: Modelo cargado
+        batch: Tensor (N, 3, IMG_SIZE, IMG_SIZE)
+        precision: "fp32" o "bf16" (por defecto INFERENCE_PRECISION)
+
+    Returns:
+        Lista con un dict por imagen (mismo formato que predict_image)
+    """
+    precision = precision or INFERENCE_PRECISION
+    with torch.no_grad(), autocast(precision, device):
+        output = model(batch.to(device))
+    probabilities = torch.softmax(output.float(), dim=1).cpu()
     
+    results = []
+    for probs in probabilities.tolist():
+        predicted_class = 0 if probs[0] >= probs[1] else 1
+        results.append({
+            "label": predicted_class,
+            "label_name": LABEL_NAMES[predicted_class],
+            "label_name_es": LABEL_NAMES_ES[predicted_class],
+            "confidence": probs[predicted_class],
+            "probabilities": {
+                "healthy": probs[0],
+                "sick": probs[1]
+            }
+        })
+    return results
+
+
+def predict_cascade(full_model, fast_model, batch, threshold: float = None, fast_img_size: int = None,
+                    precision=None):
+    """
+    Predicción en cascada: fast_model decide las imágenes con confianza >= threshold
+    y el resto se reevalúa con full_model
+
+    Returns:
+        Lista de dicts (formato de predict_batch) con "stage": "fast" o "full"
+    """
+    threshold = CASCADE_THRESHOLD if threshold is None else threshold
+    fast_img_size = fast_img_size or CASCADE_IMG_SIZE
+    fast_batch = batch
+    if fast_img_size != batch.shape[-1]:
+        fast_batch = F.interpolate(batch, size=(fast_img_size, fast_img_size), mode="area")
+    results = predict_batch(fast_model, fast_batch, precision=precision)
+    for r in results:
+        r["stage"] = "fast"
+
+    doubtful = [i for i, r in enumerate(results) if r["confidence"] < threshold]
+    if doubtful:
+        full_results = predict_batch(full_model, batch[doubtful], precision=precision)
+        for i, r in zip(doubtful, full_results):
+            r["stage"] = "full"
+            results[i] = r
+    _record_cascade(len(results), len(doubtful))
+    return results
+
+
+# Estadísticas de la cascada en este proceso (cada worker de uvicorn lleva las suyas)
+_cascade_lock = threading.Lock()
+_cascade_stats = {"images": 0, "escalated": 0}
+
+def _record_cascade(images: int, escalated: int):
+    with _cascade_lock:
+        _cascade_stats["images"] += images
+        _cascade_stats["escalated"] += escalated
+
+def get_cascade_stats() -> dict:
+    """Imágenes clasificadas, escaladas al modelo completo y tasa de escalado"""
+    with _cascade_lock:
+        images, escalated = _cascade_stats["images"], _cascade_stats["escalated"]
     return {
-        "label": predicted_class,
-        "label_name": label_names[predicted_class],
-        "label_name_es": label_names_es[predicted_class],
-        "confidence": confidence,
-        "probabilities": {
-            "healthy": probabilities[0][0].item(),
-            "sick": probabilities[0][1].item()
-        }
+        "enabled": bool(CASCADE_MODEL_PATH),
+        "threshold": CASCADE_THRESHOLD,
+        "fast_img_size": CASCADE_IMG_SIZE,
+        "images": images,
+        "escalated": escalated,
+        "fast_decided": images - escalated,
+        "escalation_rate": round(escalated / images, 4) if images else None,
     }
 
 
 # Modelo global (se carga una vez al importar)
 _model = None
+_cascade_model = None
+
+def apply_inference_threads():
+    """Fija INFERENCE_THREADS hilos de torch en este proceso (solo al servir)"""
+    if INFERENCE_THREADS > 0:
+        torch.set_num_threads(INFERENCE_THREADS)
 
 def get_model():
     """Obtiene el modelo (lo carga si es necesario)"""
     global _model
     if _model is None:
-        _model = load_model()
+        apply_inference_threads()
+        _model = compile_model(load_model())
     return _model
+
+def get_cascade_model():
+    """Modelo de la primera etapa de la cascada (None si está desactivada)"""
+    global _cascade_model
+    if _cascade_model is None and CASCADE_MODEL_PATH:
+        apply_inference_threads()
+        _cascade_model = compile_model(load_model(CASCADE_MODEL_PATH), img_size=CASCADE_IMG_SIZE)
+    return _cascade_model
+
+
+def classify_batch(batch):
+    """
+    Clasifica un lote preprocesado con el modelo global, en cascada si CASCADE_MODEL_PATH está definido
+
+    Returns:
+        Lista de dicts (formato de predict_batch) con "stage"
+    """
+    fast_model = get_cascade_model()
+    if fast_model is None:
+        results = predict_batch(get_model(), batch)
+        for r in results:
+            r["stage"] = "full"
+        return results
+    return predict_cascade(get_model(), fast_model, batch)
+
+
+def classify_image(image_path: str):
+    """Como predict_image pero con el modelo global y la cascada (si está activa)"""
+    return classify_batch(preprocess_image(image_path))[0]
+
+
+def warm_up(batch_sizes=(1,), iterations: int = 2) -> dict:
+    """
+    Carga el modelo global (y el de la cascada) y ejecuta forwards de prueba con los
+    tamaños de batch de servicio, para que la primera petición real no pague la carga
+    de pesos ni la inicialización de kernels
+
+    Returns:
+        dict con batch_sizes y segundos empleados
+    """
+    import time
+
+    start = time.perf_counter()
+    models = [(get_model(), IMG_SIZE)]
+    if get_cascade_model() is not None:
+        models.append((get_cascade_model(), CASCADE_IMG_SIZE))
+    for model, size in models:
+        for bs in batch_sizes:
+            batch = torch.zeros(bs, 3, size, size)
+            for _ in range(iterations):
+                predict_batch(model, batch)
+    return {"batch_sizes": list(batch_sizes), "seconds": round(time.perf_counter() - start, 3)}
@@ -0,0 +1,114 @@
+"""
+Perfilado opcional de peticiones y de entrenamientos
+
+- API: una petición a /api/v1/images/process con la cabecera X-Profile-Token (o ?profile=)
+  igual a ADMIN_TOKEN se perfila con pyinstrument (muestreo, reporte HTML tipo flamegraph);
+  sin pyinstrument se usa cProfile (.pstats). Sin ADMIN_TOKEN configurado el perfilado está
+  deshabilitado.
+- Entrenamiento: --profile N en train_cats_pytorch.py / incremental_train.py ejecuta
+  torch.profiler sobre N pasos de entrenamiento y guarda la traza (chrome://tracing o
+  https://ui.perfetto.dev) y la tabla de operadores más costosos.
+
+Los reportes se guardan en outputs/profiles/. Con el perfilado apagado no se crea ningún
+profiler: el coste es una comparación por petición o por paso.
+"""
+import hmac
+import importlib.util
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+PROFILE_DIR = Path("outputs/profiles")
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+PROFILE_HEADER = "x-profile-token"
+
+
+def profile_requested(request) -> bool:
+    """True si la petición pide perfilado con el token de administrador válido"""
+    if not ADMIN_TOKEN:
+        return False
+    token = request.headers.get(PROFILE_HEADER) or request.query_params.get("profile")
+    return bool(token) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def _report_path(name: str, suffix: str) -> Path:
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    return PROFILE_DIR / f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}{suffix}"
+
+
+@contextmanager
+def profile_block(name: str):
+    """
+    Perfila el bloque (incluye los await) y guarda el reporte en PROFILE_DIR
+
+    Yields:
+        dict que al salir contiene {"profiler", "path"}
+    """
+    report = {}
+    if importlib.util.find_spec("pyinstrument") is not None:
+        from pyinstrument import Profiler
+
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        try:
+            yield report
+        finally:
+            profiler.stop()
+            path = _report_path(name, ".html")
+            path.write_text(profiler.output_html(), encoding="utf-8")
+            report.update(profiler="pyinstrument", path=str(path))
+    else:
+        # cProfile es determinista (más overhead que el muestreo), pero siempre está disponible
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield report
+        finally:
+            profiler.disable()
+            path = _report_path(name, ".pstats")
+            profiler.dump_stats(path)
+            report.update(profiler="cProfile", path=str(path))
+    print(f"📊 Perfil de {name} guardado en {report['path']}")
+
+
+class TrainingProfiler:
+    """torch.profiler sobre unos pocos pasos de entrenamiento (1 de espera + 1 de calentamiento + N activos)"""
+
+    def __init__(self, steps: int, name: str):
+        import torch
+        from torch.profiler import ProfilerActivity, profile, schedule
+
+        self.name = name
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        self.profiler = profile(
+            activities=activities,
+            schedule=schedule(wait=1, warmup=1, active=steps, repeat=1),
+            on_trace_ready=self._save,
+            record_shapes=True,
+            profile_memory=True,
+        )
+        self.profiler.start()
+
+    def _save(self, prof):
+        trace = _report_path(self.name, ".trace.json")
+        prof.export_chrome_trace(str(trace))
+        table = prof.key_averages().table(sort_by="self_cpu_time_total", row_limit=25)
+        trace.with_suffix("").with_suffix(".txt").write_text(table, encoding="utf-8")
+        print(f"📊 Traza de torch.profiler guardada en {trace}")
+        print(table)
+
+    def step(self):
+        self.profiler.step()
+
+    def close(self):
+        self.profiler.stop()
+
+
+def start_training_profiler(steps: int, name: str):
+    """TrainingProfiler si steps > 0, None si el perfilado está apagado"""
+    return TrainingProfiler(steps, name) if steps and steps > 0 else None
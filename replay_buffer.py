@@ -0,0 +1,104 @@
+"""
+Buffer de repetición (replay buffer) para reentrenamiento incremental
+
+Mantiene una muestra de tamaño fijo y balanceada por clase de los datos ya vistos
+(dataset original + feedback de reentrenamientos anteriores) usando reservoir sampling.
+Cada reentrenamiento incremental usa solo el feedback nuevo más esta muestra, así el
+coste por reentrenamiento se mantiene aproximadamente constante.
+"""
+import json
+import os
+import random
+from pathlib import Path
+from typing import Dict, List
+
+BUFFER_PATH = Path("feedback_data/replay_buffer.json")
+DEFAULT_CAPACITY = 500
+CLASSES = (0, 1)
+
+
+class ReplayBuffer:
+    """
+    Reservoir por clase con capacidad total fija (capacity // 2 por clase)
+
+    Cada elemento es un dict con image_path, label y timestamp. seeded indica si ya se
+    sembró con el dataset original y el feedback anterior (primer reentrenamiento con replay).
+    """
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, path: Path = BUFFER_PATH, seed: int = 42):
+        self.capacity = capacity
+        self.path = Path(path)
+        self.items: Dict[int, List[dict]] = {c: [] for c in CLASSES}
+        self.seen: Dict[int, int] = {c: 0 for c in CLASSES}
+        self.rng = random.Random(seed)
+        self.seeded = False
+
+    @property
+    def per_class(self) -> int:
+        return max(1, self.capacity // len(CLASSES))
+
+    @classmethod
+    def load(cls, capacity: int = DEFAULT_CAPACITY, path: Path = BUFFER_PATH) -> "ReplayBuffer":
+        """Carga el buffer persistido (o uno vacío si no existe)"""
+        buffer = cls(capacity=capacity, path=path)
+        if buffer.path.exists():
+            with open(buffer.path, encoding="utf-8") as f:
+                data = json.load(f)
+            for c in CLASSES:
+                buffer.items[c] = data.get("items", {}).get(str(c), [])
+                buffer.seen[c] = data.get("seen", {}).get(str(c), len(buffer.items[c]))
+            buffer.seeded = bool(data.get("seeded", False))
+            if data.get("rng_state"):
+                state = data["rng_state"]
+                buffer.rng.setstate((state[0], tuple(state[1]), state[2]))
+            # Si se reduce la capacidad, recortar manteniendo una muestra uniforme
+            for c in CLASSES:
+                if len(buffer.items[c]) > buffer.per_class:
+                    buffer.items[c] = buffer.rng.sample(buffer.items[c], buffer.per_class)
+        return buffer
+
+    def __len__(self):
+        return sum(len(v) for v in self.items.values())
+
+    def reset(self):
+        """Vacía el buffer (antes de sembrarlo con todos los datos anteriores)"""
+        self.items = {c: [] for c in CLASSES}
+        self.seen = {c: 0 for c in CLASSES}
+
+    def add(self, rows: List[dict]):
+        """
+        Agrega filas con reservoir sampling (algoritmo R) por clase
+
+        Args:
+            rows: dicts con image_path, label y timestamp
+        """
+        for row in rows:
+            label = int(row["label"])
+            if label not in self.items:
+                continue
+            item = {"image_path": str(row["image_path"]), "label": label, "timestamp": str(row.get("timestamp") or "")}
+            self.seen[label] += 1
+            reservoir = self.items[label]
+            if len(reservoir) < self.per_class:
+                reservoir.append(item)
+            else:
+                j = self.rng.randrange(self.seen[label])
+                if j < self.per_class:
+                    reservoir[j] = item
+
+    def sample(self) -> List[dict]:
+        """Devuelve el contenido del buffer cuyos archivos siguen existiendo"""
+        return [item for c in CLASSES for item in self.items[c] if os.path.exists(item["image_path"])]
+
+    def save(self):
+        """Guarda el buffer de forma atómica"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "capacity": self.capacity,
+                "items": {str(c): self.items[c] for c in CLASSES},
+                "seen": {str(c): self.seen[c] for c in CLASSES},
+                "rng_state": self.rng.getstate(),
+                "seeded": self.seeded,
+            }, f)
+        os.replace(tmp_path, self.path)
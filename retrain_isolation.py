@@ -0,0 +1,170 @@
+"""
+Ejecución del reentrenamiento con recursos limitados, para no degradar la latencia de la API
+
+El reentrenamiento corre en el mismo host que los workers de uvicorn. Controles (variables
+de entorno, todas opcionales):
+
+- RETRAIN_NICE (10): prioridad de CPU del proceso de entrenamiento
+- RETRAIN_IONICE (idle): clase de E/S (idle, best-effort o none) vía `ionice`
+- RETRAIN_THREADS (mitad de los núcleos): hilos de torch/OpenMP/MKL
+- RETRAIN_CPUS: núcleos reservados para el entrenamiento (p. ej. "2-3" o "2,3")
+- RETRAIN_MEMORY_MB + RETRAIN_CGROUP: límite de memoria con un cgroup v2 (el directorio
+  del cgroup debe ser escribible; p. ej. /sys/fs/cgroup/retrain con delegación)
+- RETRAIN_PAUSE_DEPTH: si hay al menos tantas peticiones en curso en la API, el
+  entrenamiento se pausa (SIGSTOP) y se reanuda (SIGCONT) al bajar la carga; una pausa
+  dura como máximo RETRAIN_MAX_PAUSE_SECONDS (60) para no bloquearlo indefinidamente
+
+Los límites se aplican desde el proceso padre justo después de lanzar el subproceso (sin
+preexec_fn, que no es seguro con los hilos de la API); los procesos hijos del
+entrenamiento (DataLoader) los heredan.
+"""
+import os
+import shutil
+import signal
+import subprocess
+import time
+from pathlib import Path
+
+POLL_SECONDS = 0.5
+IONICE_CLASSES = {"idle": "3", "best-effort": "2"}
+
+
+def parse_cpus(text: str) -> set:
+    """"0-3,6" -> {0, 1, 2, 3, 6}"""
+    cpus = set()
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        start, _, end = part.partition("-")
+        cpus.update(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+def limits_from_env() -> dict:
+    cpus = os.environ.get("RETRAIN_CPUS")
+    memory_mb = os.environ.get("RETRAIN_MEMORY_MB")
+    return {
+        "nice": int(os.environ.get("RETRAIN_NICE", "10")),
+        "ionice": os.environ.get("RETRAIN_IONICE", "idle"),
+        "threads": int(os.environ.get("RETRAIN_THREADS", max(1, (os.cpu_count() or 2) // 2))),
+        "cpus": parse_cpus(cpus) if cpus else None,
+        "memory_mb": int(memory_mb) if memory_mb else None,
+        "cgroup": os.environ.get("RETRAIN_CGROUP"),
+        "pause_depth": int(os.environ.get("RETRAIN_PAUSE_DEPTH", "0")),
+        "max_pause_seconds": float(os.environ.get("RETRAIN_MAX_PAUSE_SECONDS", "60")),
+    }
+
+
+def child_env(limits: dict) -> dict:
+    """Entorno del subproceso con el número de hilos acotado"""
+    threads = str(limits["threads"])
+    return {**os.environ, "OMP_NUM_THREADS": threads, "MKL_NUM_THREADS": threads,
+            "OPENBLAS_NUM_THREADS": threads, "PYTHONUNBUFFERED": "1"}
+
+
+def apply_limits(pid: int, limits: dict) -> list:
+    """
+    Aplica prioridad, clase de E/S, afinidad y cgroup a un proceso ya lanzado
+
+    Returns:
+        Avisos de los límites que no se pudieron aplicar
+    """
+    warnings = []
+    try:
+        os.setpriority(os.PRIO_PROCESS, pid, limits["nice"])
+    except (OSError, AttributeError) as e:
+        warnings.append(f"nice: {e}")
+
+    io_class = IONICE_CLASSES.get(limits["ionice"])
+    if io_class and shutil.which("ionice"):
+        result = subprocess.run(["ionice", "-c", io_class, "-p", str(pid)], capture_output=True, text=True)
+        if result.returncode != 0:
+            warnings.append(f"ionice: {result.stderr.strip()}")
+
+    if limits["cpus"]:
+        try:
+            os.sched_setaffinity(pid, limits["cpus"])
+        except (OSError, AttributeError) as e:
+            warnings.append(f"afinidad de CPU: {e}")
+
+    if limits["memory_mb"]:
+        if not limits["cgroup"]:
+            warnings.append("RETRAIN_MEMORY_MB requiere RETRAIN_CGROUP (cgroup v2 escribible)")
+        else:
+            try:
+                cgroup = Path(limits["cgroup"])
+                cgroup.mkdir(parents=True, exist_ok=True)
+                (cgroup / "memory.max").write_text(str(limits["memory_mb"] * 1024 * 1024))
+                (cgroup / "cgroup.procs").write_text(str(pid))
+            except OSError as e:
+                warnings.append(f"cgroup {limits['cgroup']}: {e}")
+    return warnings
+
+
+def run_isolated(cmd, limits: dict, timeout: float, log_path: Path, queue_depth=None, on_state=None):
+    """
+    Ejecuta cmd con los límites y, si pause_depth > 0, lo pausa mientras la API está cargada
+
+    Args:
+        cmd: Comando del reentrenamiento
+        limits: Resultado de limits_from_env()
+        timeout: Segundos máximos (incluidas las pausas)
+        log_path: Archivo donde se guarda la salida (stdout + stderr)
+        queue_depth: Función que devuelve las peticiones en curso en la API
+        on_state: Callback opcional on_state(paused: bool) al pausar o reanudar
+
+    Returns:
+        (código de salida, segundos en pausa, avisos)
+
+    Raises:
+        subprocess.TimeoutExpired: si se supera timeout (el proceso se termina)
+    """
+    log_path = Path(log_path)
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, "w", encoding="utf-8") as log:
+        # Sesión propia: las señales llegan también a los procesos hijos del entrenamiento
+        proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, env=child_env(limits),
+                                start_new_session=True)
+        warnings = apply_limits(proc.pid, limits)
+        for w in warnings:
+            print(f"⚠️  Límite de reentrenamiento no aplicado: {w}")
+
+        start = time.monotonic()
+        paused_since = None
+        paused_total = 0.0
+        cooldown_until = 0.0
+        try:
+            while proc.poll() is None:
+                now = time.monotonic()
+                if now - start > timeout:
+                    raise subprocess.TimeoutExpired(cmd, timeout)
+                if limits["pause_depth"] > 0 and queue_depth is not None:
+                    busy = queue_depth() >= limits["pause_depth"]
+                    if paused_since is None and busy and now >= cooldown_until:
+                        os.killpg(proc.pid, signal.SIGSTOP)
+                        paused_since = now
+                        if on_state:
+                            on_state(True)
+                    elif paused_since is not None and (not busy or now - paused_since > limits["max_pause_seconds"]):
+                        os.killpg(proc.pid, signal.SIGCONT)
+                        paused_total += now - paused_since
+                        # Tras una pausa máxima, dejar avanzar el entrenamiento un tiempo antes de volver a pausar
+                        if busy:
+                            cooldown_until = now + limits["max_pause_seconds"] / 4
+                        paused_since = None
+                        if on_state:
+                            on_state(False)
+                time.sleep(POLL_SECONDS)
+        except BaseException:
+            if proc.poll() is None:
+                os.killpg(proc.pid, signal.SIGCONT)
+                os.killpg(proc.pid, signal.SIGKILL)
+                proc.wait()
+            raise
+    return proc.returncode, round(paused_total, 1), warnings
+
+
+def log_tail(log_path: Path, chars: int = 500) -> str:
+    """Últimos caracteres del log del reentrenamiento (para el mensaje de error)"""
+    try:
+        return Path(log_path).read_text(encoding="utf-8", errors="replace")[-chars:]
+    except OSError:
+        return ""
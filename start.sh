@@ -51,6 +51,11 @@ fi
 echo "📁 Verificando estructura de directorios..."
 ls -la | grep -E "feedback_data|artifacts|uploads|outputs"
 
+# Métricas Prometheus multiproceso: el directorio debe estar vacío al arrancar los workers
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_multiproc}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 # Iniciar la aplicación
 echo "🚀 Iniciando aplicación..."
 exec uvicorn main:app --host 0.0.0.0 --port ${PORT:-8000} --workers 2
@@ -0,0 +1,30 @@
+"""
+Configuración común de los tests
+
+Los módulos del proyecto usan rutas relativas (feedback_data/, uploads/, outputs/,
+artifacts/): el fixture workdir ejecuta cada test en un directorio temporal vacío.
+Los tests que dependen de paquetes pesados (torch, pandas, PIL, fastapi) se omiten con
+pytest.importorskip si no están instalados.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+def pytest_configure(config):
+    # Algunos módulos crean directorios al importarse (feedback_data/, artifacts/): la
+    # sesión arranca en un directorio temporal para no tocar los datos del proyecto
+    os.chdir(tempfile.mkdtemp(prefix="algoritmo_ia_tests_"))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Directorio de trabajo temporal (aislado del proyecto)"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
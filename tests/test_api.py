@@ -0,0 +1,271 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+pytest.importorskip("torch")
+pytest.importorskip("pandas")
+
+from fastapi.testclient import TestClient
+
+import main
+import predict
+
+
+@pytest.fixture
+def client(workdir, monkeypatch):
+    monkeypatch.setattr(main, "readiness_state", {"ready": False, "model": "loading",
+                                                  "warmup_seconds": None, "error": None})
+    return TestClient(main.app)
+
+
+def test_ready_is_503_while_loading(client):
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "starting"
+
+
+def test_ready_is_503_when_model_fails_to_load(client, monkeypatch):
+    def broken(batch_sizes):
+        raise RuntimeError("pesos corruptos")
+
+    monkeypatch.setattr(predict, "warm_up", broken)
+    main.preload_model()
+    assert main.readiness_state["model"] == "error"
+    assert not main.readiness_state["ready"]
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "error"
+
+
+def test_ready_without_trained_model(client, monkeypatch):
+    def missing(batch_sizes):
+        raise FileNotFoundError("Modelo no encontrado")
+
+    monkeypatch.setattr(predict, "warm_up", missing)
+    main.preload_model()
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["model"] == "unavailable"
+
+
+def test_retrain_error_when_flush_fails(workdir, monkeypatch):
+    import feedback_storage
+
+    def broken():
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(feedback_storage, "flush_feedback", broken)
+    monkeypatch.setitem(main.retraining_state, "status", "idle")
+    main.run_retraining_background(epochs=1, min_feedback=1)
+    assert main.retraining_state["status"] == "error"
+    assert "disco lleno" in main.retraining_state["message"]
+
+
+def _png_bytes():
+    import io
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), (0, 128, 0)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_batches_with_same_id_share_one_csv(client):
+    main.UPLOAD_DIR.mkdir(exist_ok=True)
+    main.OUTPUT_DIR.mkdir(exist_ok=True)
+    names = []
+    for batch in (["a.png", "b.png"], ["c.png"]):
+        response = client.post("/api/v1/images/process",
+                               files=[("files", (name, _png_bytes(), "image/png")) for name in batch],
+                               data={"batch_id": "subida-1"})
+        assert response.status_code == 200
+        names.append(response.json()["csv_filename"])
+    assert names == ["processed_images_subida-1.csv"] * 2
+    lines = (main.OUTPUT_DIR / names[0]).read_text(encoding="utf-8").splitlines()
+    assert lines[0].startswith("image_path,")
+    assert len(lines) == 4
+
+
+def test_invalid_batch_id_is_rejected(client):
+    response = client.post("/api/v1/images/process",
+                           files=[("files", ("a.png", _png_bytes(), "image/png"))],
+                           data={"batch_id": "../feedback"})
+    assert response.status_code == 400
+
+
+@pytest.fixture
+def feedback(client):
+    import feedback_storage
+
+    feedback_storage.FEEDBACK_DIR.mkdir(exist_ok=True)
+    feedback_storage.IMAGES_DIR.mkdir(exist_ok=True)
+    yield feedback_storage
+    feedback_storage.flush_feedback()
+
+
+def test_bulk_corrections_report_each_result(client, feedback):
+    feedback.save_feedback("uploads/a.jpg", 0, "sano", 0.9)
+    feedback.enqueue_feedback("uploads/b.jpg", 0, "sano", 0.7)  # aún en la cola del worker
+    response = client.post("/api/v1/feedback/correct/bulk", json={"corrections": [
+        {"image_path": "uploads/a.jpg", "corrected_label": 1},
+        {"image_path": "uploads/missing.jpg", "corrected_label": 0},
+        {"image_path": "uploads/b.jpg", "corrected_label": 1, "user_feedback": "se ve enfermo"},
+    ]})
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["success"], body["applied"], body["failed"]) == (False, 2, 1)
+    assert [r["image_path"] for r in body["results"]] == ["uploads/a.jpg", "uploads/missing.jpg", "uploads/b.jpg"]
+    assert [r["success"] for r in body["results"]] == [True, False, True]
+    corrected = feedback.get_training_data()
+    assert list(corrected[corrected["corrected"]]["image_path"]) == ["uploads/a.jpg", "uploads/b.jpg"]
+
+
+def test_bulk_corrections_limits(client, feedback, monkeypatch):
+    assert client.post("/api/v1/feedback/correct/bulk", json={"corrections": []}).status_code == 400
+    monkeypatch.setattr(main, "MAX_BULK_CORRECTIONS", 2)
+    corrections = [{"image_path": f"uploads/{i}.jpg", "corrected_label": 0} for i in range(3)]
+    assert client.post("/api/v1/feedback/correct/bulk", json={"corrections": corrections}).status_code == 413
+
+
+def _png_of_size(size):
+    import io
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_oversized_request_is_rejected_before_parsing(client, monkeypatch):
+    main.UPLOAD_DIR.mkdir(exist_ok=True)
+    monkeypatch.setattr(main, "MAX_UPLOAD_REQUEST_BYTES", 1000)
+    monkeypatch.setattr(main, "UPLOAD_FORM_OVERHEAD_BYTES", 0)
+    response = client.post("/api/v1/images/process", files=[("files", ("a.png", b"x" * 5000, "image/png"))])
+    assert response.status_code == 413
+
+    def chunked():
+        yield b'--x\r\nContent-Disposition: form-data; name="files"; filename="a.png"\r\n\r\n'
+        for _ in range(10):
+            yield b"x" * 500
+        yield b"\r\n--x--\r\n"
+
+    response = client.post("/api/v1/images/process", content=chunked(),
+                           headers={"content-type": "multipart/form-data; boundary=x"})
+    assert response.status_code == 413
+    assert list(main.UPLOAD_DIR.iterdir()) == []
+
+
+def test_oversized_file_is_reported_and_others_processed(client, monkeypatch):
+    main.UPLOAD_DIR.mkdir(exist_ok=True)
+    main.OUTPUT_DIR.mkdir(exist_ok=True)
+    big, small = _png_of_size((64, 64)), _png_of_size((4, 4))
+    monkeypatch.setattr(main, "MAX_UPLOAD_FILE_BYTES", len(small) + 10)
+    response = client.post("/api/v1/images/process", files=[("files", ("grande.png", big, "image/png")),
+                                                            ("files", ("chica.png", small, "image/png"))])
+    assert response.status_code == 200
+    body = response.json()
+    assert [f["filename"] for f in body["processed_files"]] == ["chica.png"]
+    assert len(body["errors"]) == 1 and "grande.png" in body["errors"][0]
+    assert len(list(main.UPLOAD_DIR.iterdir())) == 1  # el archivo parcial se elimina
+
+
+def test_cascade_stats_endpoint(client, monkeypatch):
+    monkeypatch.setattr(predict, "_cascade_stats", {"images": 10, "escalated": 3})
+    response = client.get("/api/v1/model/cascade/stats")
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["images"], body["escalated"], body["fast_decided"], body["escalation_rate"]) == (10, 3, 7, 0.3)
+    assert body["threshold"] == predict.CASCADE_THRESHOLD
+
+
+def test_metrics_is_503_without_prometheus_client(workdir):
+    # Sin el paquete, las métricas son no-ops y la API sigue funcionando
+    code = (
+        "import sys; sys.modules['prometheus_client'] = None\n"
+        "from fastapi.testclient import TestClient\n"
+        "import main, metrics\n"
+        "assert not metrics.PROMETHEUS_AVAILABLE\n"
+        "metrics.STAGE_SECONDS.labels(stage='write').observe(0.1)\n"
+        "metrics.IMAGES_PROCESSED.labels(result='classified').inc()\n"
+        "client = TestClient(main.app)\n"
+        "response = client.get('/metrics')\n"
+        "assert response.status_code == 503, response.status_code\n"
+        "assert 'prometheus' in response.json()['detail']\n"
+        "assert client.get('/api/v1/model/cascade/stats').status_code == 200\n"
+    )
+    env = {k: v for k, v in os.environ.items() if k != "PROMETHEUS_MULTIPROC_DIR"}
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            env={**env, "PYTHONPATH": os.path.dirname(main.__file__)})
+    assert result.returncode == 0, result.stderr
+
+
+def test_metrics_exports_stage_and_result_labels(client, feedback, monkeypatch):
+    pytest.importorskip("prometheus_client")
+    main.UPLOAD_DIR.mkdir(exist_ok=True)
+    main.OUTPUT_DIR.mkdir(exist_ok=True)
+
+    def fake_classify(batch):
+        return [{"label": 1, "label_name": "sick", "label_name_es": "enfermo",
+                 "confidence": 0.9, "stage": "fast"} for _ in range(batch.shape[0])]
+
+    monkeypatch.setattr(main, "MODEL_AVAILABLE", True)
+    monkeypatch.setattr(predict, "classify_batch", fake_classify)
+    response = client.post("/api/v1/images/process", files=[("files", ("gato.png", _png_bytes(), "image/png")),
+                                                            ("files", ("roto.png", b"no", "image/png"))])
+    assert response.status_code == 200
+
+    body = client.get("/metrics").text
+    for sample in ('process_stage_seconds_bucket{le="0.001",stage="upload_write"}',
+                   'process_stage_seconds_count{stage="validation"}',
+                   'process_stage_seconds_count{stage="inference"}',
+                   'inference_seconds_count{batch_size="1"}',
+                   'images_processed_total{result="classified"}',
+                   'cascade_decisions_total{stage="fast"}',
+                   'invalid_files_total'):
+        assert sample in body, sample
+
+
+def _post_profiled(client, **kwargs):
+    main.UPLOAD_DIR.mkdir(exist_ok=True)
+    main.OUTPUT_DIR.mkdir(exist_ok=True)
+    return client.post("/api/v1/images/process", files=[("files", ("gato.png", _png_bytes(), "image/png"))],
+                       **kwargs)
+
+
+@pytest.mark.parametrize("headers, params", [
+    ({}, {}),
+    ({"X-Profile-Token": "incorrecto"}, {}),
+    ({}, {"profile": "incorrecto"}),
+])
+def test_profiling_requires_admin_token(client, monkeypatch, headers, params):
+    import profiling
+
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", "secreto")
+    response = _post_profiled(client, headers=headers, params=params)
+    assert response.status_code == 200
+    assert "X-Profile-Path" not in response.headers
+    assert not profiling.PROFILE_DIR.exists()
+
+
+def test_profiling_disabled_without_admin_token(client, monkeypatch):
+    import profiling
+
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", None)
+    response = _post_profiled(client, headers={"X-Profile-Token": "secreto"})
+    assert "X-Profile-Path" not in response.headers
+    assert not profiling.PROFILE_DIR.exists()
+
+
+def test_profiling_with_admin_token_writes_report(client, monkeypatch):
+    import profiling
+
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", "secreto")
+    response = _post_profiled(client, headers={"X-Profile-Token": "secreto"})
+    assert response.status_code == 200
+    path = response.headers["X-Profile-Path"]
+    assert [str(p) for p in profiling.PROFILE_DIR.iterdir()] == [path]
+    assert os.path.getsize(path) > 0
@@ -0,0 +1,37 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("pandas")
+import torch.nn.functional as F
+
+import distill
+from predict import StudentCNN, load_model, model_artifact
+from training_engine import atomic_torch_save
+
+
+def test_student_artifact_loads_through_load_model(workdir):
+    student = StudentCNN(width=4).eval()
+    # Mismo formato que escribe distill.py
+    atomic_torch_save(model_artifact(student, "student_cnn", {"width": 4}, teacher="artifacts/best_model.pth",
+                                     created_at="2024-01-01T00:00:00"), "student_model.pth")
+    loaded = load_model("student_model.pth")
+    assert isinstance(loaded, StudentCNN) and not loaded.training
+    assert loaded.conv[0].out_channels == 4
+    # Global average pooling: también sirve a menor resolución (primera etapa de la cascada)
+    for size in (128, 64):
+        batch = torch.randn(2, 3, size, size)
+        with torch.no_grad():
+            assert torch.allclose(loaded(batch), student(batch))
+
+
+def test_distillation_loss_mixes_soft_and_hard_targets():
+    torch.manual_seed(0)
+    student, teacher = torch.randn(4, 2), torch.randn(4, 2)
+    labels = torch.tensor([0, 1, 1, 0])
+    hard = distill.distillation_loss(student, teacher, labels, temperature=4.0, alpha=0.0)
+    assert torch.isclose(hard, F.cross_entropy(student, labels))
+    # Solo la parte blanda: nula si el estudiante reproduce al profesor
+    assert distill.distillation_loss(teacher, teacher, labels, temperature=4.0, alpha=1.0).abs() < 1e-6
+    soft = distill.distillation_loss(student, teacher, labels, temperature=4.0, alpha=1.0)
+    mixed = distill.distillation_loss(student, teacher, labels, temperature=4.0, alpha=0.5)
+    assert torch.isclose(mixed, 0.5 * soft + 0.5 * hard)
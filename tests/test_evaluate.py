@@ -0,0 +1,86 @@
+import csv
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("PIL")
+
+import evaluate
+from predict import SimpleCNN
+
+ROOT = os.path.dirname(evaluate.__file__)
+
+
+@pytest.fixture
+def holdout(workdir):
+    """CSV de 4 imágenes etiquetadas (una ilegible) y un checkpoint SimpleCNN aleatorio"""
+    from PIL import Image
+
+    (workdir / "images").mkdir()
+    rows = []
+    for i, label in enumerate([0, 1, 0]):
+        path = f"images/{i}.png"
+        Image.new("RGB", (16, 16), (200 * label, 100, 50)).save(path)
+        rows.append((path, label))
+    (workdir / "images" / "broken.png").write_bytes(b"no es una imagen")
+    rows.append(("images/broken.png", 1))
+    with open("holdout.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["image_path", "label", "timestamp", "source"])
+        for path, label in rows:
+            writer.writerow([path, label, "", "test"])
+    torch.manual_seed(0)
+    torch.save(SimpleCNN().state_dict(), "model.pth")
+    return workdir
+
+
+def _run_cli(*args):
+    return subprocess.run(
+        [sys.executable, os.path.join(ROOT, "evaluate.py"), "holdout.csv", "--checkpoint", "model.pth",
+         "--workers", "0", "--threads", "1", *args],
+        capture_output=True, text=True,
+        env={**os.environ, "PYTHONPATH": ROOT, "INFERENCE_BACKEND": "", "INFERENCE_PRECISION": "fp32"},
+    )
+
+
+def test_cli_writes_predictions_and_report(holdout):
+    result = _run_cli("--output", "preds.csv", "--report", "report.json", "--backend", "torchscript")
+    assert result.returncode == 0, result.stdout + result.stderr
+
+    with open("preds.csv", newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        assert reader.fieldnames == ["image_path", "label", "predicted_label", "predicted_label_name",
+                                     "confidence", "prob_healthy", "prob_sick", "correct"]
+        predictions = list(reader)
+    assert [p["image_path"] for p in predictions] == ["images/0.png", "images/1.png", "images/2.png",
+                                                      "images/broken.png"]
+    assert predictions[-1]["predicted_label_name"] == "error" and predictions[-1]["correct"] == ""
+    for p in predictions[:3]:
+        assert p["predicted_label"] in ("0", "1")
+        assert abs(float(p["prob_healthy"]) + float(p["prob_sick"]) - 1) < 1e-4
+        assert p["correct"] == str(int(p["predicted_label"] == p["label"]))
+
+    report = json.loads((holdout / "report.json").read_text())
+    assert report["backend"] == "torchscript"
+    assert report["evaluated_images"] == 3 and report["unreadable_images"] == 1
+    assert report["labeled_images"] == 3
+
+
+def test_cli_min_accuracy_gate_exits_with_code_2(holdout):
+    result = _run_cli("--output", "preds.csv", "--min-accuracy", "1.01")
+    assert result.returncode == 2, result.stdout + result.stderr
+
+    assert _run_cli("--output", "preds.csv", "--min-accuracy", "0").returncode == 0
+
+
+def test_torchscript_backend_matches_eager(holdout):
+    eager = evaluate.evaluate_checkpoint("holdout.csv", checkpoint="model.pth", workers=0,
+                                         precision="fp32", backend="eager")
+    scripted = evaluate.evaluate_checkpoint("holdout.csv", checkpoint="model.pth", workers=0,
+                                            precision="fp32", backend="torchscript")
+    assert scripted["backend"] == "torchscript"
+    assert scripted["confusion_matrix"] == eager["confusion_matrix"]
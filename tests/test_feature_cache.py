@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+from PIL import Image
+
+import feature_cache
+from feature_cache import FeatureCache, backbone_hash
+from predict import SimpleCNN
+from evaluate import EvalDataset
+
+
+def _image(path, color):
+    Image.new("RGB", (32, 32), color).save(path)
+    return str(path)
+
+
+@pytest.fixture
+def model():
+    torch.manual_seed(0)
+    return SimpleCNN().eval()
+
+
+def test_cache_key_follows_backbone_weights_only(tmp_path, model):
+    path = FeatureCache(model, tmp_path).path
+    with torch.no_grad():
+        model.fc[1].weight.add_(1.0)
+    assert FeatureCache(model, tmp_path).path == path
+    with torch.no_grad():
+        model.conv[0].weight.add_(1.0)
+    assert FeatureCache(model, tmp_path).path != path
+    assert backbone_hash(model) != backbone_hash(SimpleCNN())
+
+
+def test_features_round_trip_in_float16(tmp_path, model):
+    images = [_image(tmp_path / f"{i}.png", (40 * i, 80, 120)) for i in range(3)]
+    cache = FeatureCache(model, tmp_path / "cache")
+    features, valid = cache.get_features(images + [str(tmp_path / "no_existe.png")])
+    assert valid == [0, 1, 2] and (cache.hits, cache.misses) == (0, 3)
+    assert features.dtype == torch.float32
+    batch = torch.stack([EvalDataset([{"image_path": p, "label": -1}])[0][0] for p in images])
+    with torch.no_grad():
+        expected = model.conv(batch).flatten(1)
+    assert torch.allclose(features, expected.half().float())
+    cache.save()
+
+    reloaded = FeatureCache(model, tmp_path / "cache")
+    again, _ = reloaded.get_features(images)
+    assert (reloaded.hits, reloaded.misses) == (3, 0)
+    assert torch.equal(again, features)
+
+
+def test_file_hash_reused_until_size_or_mtime_change(tmp_path, model, monkeypatch):
+    image = _image(tmp_path / "a.png", (10, 20, 30))
+    calls = []
+    real_hash = feature_cache.file_hash
+    monkeypatch.setattr(feature_cache, "file_hash", lambda p: calls.append(p) or real_hash(p))
+    cache = FeatureCache(model, tmp_path / "cache")
+    cache.get_features([image])
+    cache.get_features([image])
+    assert len(calls) == 1 and cache.hits == 1
+
+    # Otra imagen en la misma ruta: cambian el tamaño o el mtime y se vuelve a calcular
+    st = os.stat(image)
+    Image.new("RGB", (48, 48), (200, 10, 10)).save(image)
+    os.utime(image, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    cache.get_features([image])
+    assert len(calls) == 2 and cache.misses == 1
+    assert len(cache.features) == 2
@@ -0,0 +1,110 @@
+import pytest
+
+pytest.importorskip("pandas")
+
+import feedback_storage as fs
+
+
+@pytest.fixture
+def storage(workdir):
+    fs.FEEDBACK_DIR.mkdir(exist_ok=True)
+    fs.IMAGES_DIR.mkdir(exist_ok=True)
+    fs._row_count_cache.update(inode=None, offset=0, rows=0)
+    yield fs
+    fs.flush_feedback()
+
+
+def _append(timestamp, image_path, label=0):
+    record = fs._feedback_record(image_path, label, "sano", 0.9)
+    record["timestamp"] = timestamp
+    with fs._feedback_lock():
+        fs._append_rows([record], fsync=False)
+
+
+def test_enqueued_feedback_is_visible_after_flush(storage):
+    for i in range(5):
+        fs.enqueue_feedback(f"uploads/{i}.jpg", 0, "sano", 0.9)
+    assert fs.flush_feedback() == 5
+    assert fs.pending_feedback() == 0
+    df = fs.get_feedback_data()
+    assert list(df["image_path"]) == [f"uploads/{i}.jpg" for i in range(5)]
+
+
+def test_save_feedback_keeps_order_after_queue(storage):
+    fs.enqueue_feedback("uploads/a.jpg", 0, "sano", 0.9)
+    fs.save_feedback("uploads/b.jpg", 1, "enfermo", 0.8)
+    assert list(fs.get_feedback_data()["image_path"]) == ["uploads/a.jpg", "uploads/b.jpg"]
+
+
+def test_failed_flush_requeues_batch(storage, monkeypatch):
+    fs.enqueue_feedback("uploads/a.jpg", 0, "sano", 0.9)
+
+    def fail(rows, fsync):
+        raise OSError("disco lleno")
+
+    with monkeypatch.context() as m:
+        m.setattr(fs, "_append_rows", fail)
+        with pytest.raises(OSError):
+            fs.flush_feedback()
+    assert fs.pending_feedback() == 1
+    assert fs.flush_feedback() == 1
+
+
+def test_watermark_includes_rows_flushed_late_with_older_timestamps(storage):
+    _append("2024-01-01T10:00:00", "uploads/a.jpg")
+    _append("2024-01-01T10:05:00", "uploads/b.jpg")
+    fs.mark_retrained(fs.feedback_row_count())
+
+    # Otro worker vacía su cola después del reentrenamiento con un timestamp anterior
+    _append("2024-01-01T10:01:00", "uploads/late.jpg")
+    df = fs.get_training_data(since_row=fs.get_last_retrain_row())
+    assert list(df["image_path"]) == ["uploads/late.jpg"]
+    assert list(df["feedback_row"]) == [2]
+
+
+def test_training_data_until_row_ignores_rows_after_snapshot(storage):
+    _append("2024-01-01T10:00:00", "uploads/a.jpg")
+    snapshot = fs.feedback_row_count()
+    _append("2024-01-01T10:05:00", "uploads/b.jpg")
+    df = fs.get_training_data(until_row=snapshot)
+    assert list(df["image_path"]) == ["uploads/a.jpg"]
+
+
+def test_legacy_timestamp_state(storage):
+    _append("2024-01-01T10:00:00", "uploads/a.jpg")
+    _append("2024-01-01T10:05:00", "uploads/b.jpg")
+    fs.RETRAIN_STATE_JSON.write_text('{"last_feedback_timestamp": "2024-01-01T10:00:00"}')
+    assert fs.get_last_retrain_row() is None
+    df = fs.get_training_data(since=fs.get_last_retrain_timestamp())
+    assert list(df["image_path"]) == ["uploads/b.jpg"]
+
+
+def test_watermark_beyond_csv_uses_all_feedback(storage):
+    _append("2024-01-01T10:00:00", "uploads/a.jpg")
+    df = fs.get_training_data(since_row=10)
+    assert list(df["image_path"]) == ["uploads/a.jpg"]
+
+
+def test_training_label_prefers_correction(storage):
+    fs.save_feedback("uploads/a.jpg", 0, "sano", 0.9)
+    results = fs.save_corrections([{"image_path": "uploads/a.jpg", "corrected_label": 1},
+                                   {"image_path": "uploads/missing.jpg", "corrected_label": 0}])
+    assert [r["success"] for r in results] == [True, False]
+    df = fs.get_training_data()
+    assert list(df["label"]) == [0, 1]
+    assert list(df["corrected"]) == [False, True]
+
+
+def test_feedback_count_includes_queue_without_flushing(storage):
+    _append("2024-01-01T00:00:00", "uploads/old.jpg")
+    fs.enqueue_feedback("uploads/a.jpg", 0, "sano", 0.9)
+    fs.enqueue_feedback("uploads/b.jpg", 1, "enfermo", 0.8)
+    assert fs.feedback_count() == 3
+    assert fs.pending_feedback() == 2
+    fs.flush_feedback()
+    assert fs.feedback_count() == 3
+    fs.save_corrections([{"image_path": "uploads/a.jpg", "corrected_label": 1,
+                          "user_feedback": "línea 1\nlínea 2"}])
+    assert fs.feedback_count() == len(fs.get_feedback_data())
+    _append("2024-01-02T00:00:00", "uploads/new.jpg")
+    assert fs.feedback_count() == len(fs.get_feedback_data())
@@ -0,0 +1,27 @@
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from generate_csv import inspect_image
+
+
+def test_inspect_image_valid(workdir):
+    Image.new("RGB", (20, 10), "red").save("cat.jpg")
+    info = inspect_image("cat.jpg")
+    assert info["valid"]
+    assert (info["width"], info["height"]) == (20, 10)
+    assert len(info["sha256"]) == 64
+
+
+def test_inspect_image_corrupt_is_invalid(workdir):
+    with open("broken.jpg", "wb") as f:
+        f.write(b"no es una imagen")
+    info = inspect_image("broken.jpg")
+    assert not info["valid"]
+    assert info["sha256"] is not None
+
+
+def test_inspect_image_missing_file_is_invalid(workdir):
+    # Archivo borrado entre el escaneo y la validación: no debe abortar la generación
+    info = inspect_image("deleted.jpg")
+    assert info == {"sha256": None, "width": None, "height": None, "valid": False}
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+import hw_profile
+
+
+@pytest.fixture
+def profile_path(tmp_path, monkeypatch):
+    path = tmp_path / "hw_profile.json"
+    monkeypatch.setattr(hw_profile, "PROFILE_PATH", path)
+    monkeypatch.setattr(hw_profile, "_profile", None)
+    monkeypatch.setattr(hw_profile, "available_cpus", lambda: 64)  # sin afinidad restringida
+    return path
+
+
+def test_save_and_load_on_same_host(profile_path):
+    hw_profile.save_hw_profile({"inference": {"threads": 2, "backend": "torchscript"}})
+    assert not profile_path.with_suffix(".json.tmp").exists()
+    profile = hw_profile.load_hw_profile()
+    assert profile["host"] == hw_profile.host_info()
+    assert hw_profile.hw_setting("inference", "threads") == 2
+    assert hw_profile.hw_setting("training", "batch_size", 32) == 32
+
+
+@pytest.mark.parametrize("host_change", [{"cpus": 999}, {"machine": "otra-arquitectura"}])
+def test_profile_from_other_host_is_ignored(profile_path, host_change):
+    host = {**hw_profile.host_info(), **host_change}
+    profile_path.write_text(json.dumps({"inference": {"threads": 2}, "host": host}))
+    assert hw_profile.load_hw_profile() == {}
+    assert hw_profile.hw_setting("inference", "threads", 1) == 1
+
+
+def test_hostname_change_keeps_profile(profile_path):
+    host = {**hw_profile.host_info(), "hostname": "otro-contenedor"}
+    profile_path.write_text(json.dumps({"inference": {"threads": 2}, "host": host}))
+    assert hw_profile.hw_setting("inference", "threads") == 2
+
+
+def test_pinned_process_keeps_profile_and_caps_threads(profile_path, monkeypatch):
+    hw_profile.save_hw_profile({"inference": {"threads": 8}, "training": {"threads": 1, "batch_size": 32}})
+    # Un reentrenamiento fijado con RETRAIN_CPUS (o taskset) ve menos CPUs que la máquina
+    monkeypatch.setattr(hw_profile, "available_cpus", lambda: 2)
+    hw_profile.load_hw_profile(reload=True)
+    assert hw_profile.hw_setting("inference", "threads") == 2
+    assert hw_profile.hw_setting("training", "threads") == 1
+    assert hw_profile.hw_setting("training", "batch_size") == 32
+
+
+def test_invalid_or_missing_profile(profile_path, capsys):
+    assert hw_profile.load_hw_profile() == {}
+    profile_path.write_text("{no es json")
+    assert hw_profile.load_hw_profile(reload=True) == {}
+    assert "inválido" in capsys.readouterr().out
+
+
+def test_autotune_picks_fastest_config_and_batch_within_budget(monkeypatch):
+    pytest.importorskip("torch")
+    import autotune
+
+    # (backend, threads, batch) -> (p50, p95); un solo backend/precisión para acotar el caso
+    timings = {
+        ("eager", 1, 1): (4.0, 5.0), ("eager", 1, 8): (20.0, 22.0), ("eager", 1, 32): (60.0, 70.0),
+        ("eager", 2, 1): (3.0, 3.5), ("eager", 2, 8): (12.0, 14.0), ("eager", 2, 32): (40.0, 80.0),
+    }
+    state = {}
+
+    def fake_time_inference(model, batch_size, precision, repeats):
+        p50, p95 = timings[(state["backend"], state["threads"], batch_size)]
+        return {"batch_size": batch_size, "p50_ms": p50, "p95_ms": p95,
+                "images_per_second": round(batch_size * 1000 / p50, 1)}
+
+    monkeypatch.setattr(autotune, "inference_model", lambda: (object(), "falso"))
+    monkeypatch.setattr(autotune, "time_inference", fake_time_inference)
+    monkeypatch.setattr(autotune, "compile_model",
+                        lambda model, backend, precision: state.update(backend=backend) or model)
+    monkeypatch.setattr(autotune.torch, "set_num_threads", lambda n: state.update(threads=n))
+    config, results = autotune.tune_inference([1, 2], [1, 8, 32], ["fp32"], ["eager"], repeats=1,
+                                              latency_budget_ms=50)
+    assert len(results) == 6
+    # Hilos con menor latencia a batch 1; el batch 32 supera el presupuesto de p95
+    assert config["threads"] == 2
+    assert config["batch_size"] == 8
+    assert autotune.default_threads(6) == [1, 2, 4, 6]
+    assert autotune.percentile([5, 1, 3, 2, 4], 0.5) == 3
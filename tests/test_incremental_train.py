@@ -0,0 +1,165 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip("torch")
+pd = pytest.importorskip("pandas")
+
+import feedback_storage as fs
+import incremental_train as it
+from replay_buffer import ReplayBuffer
+
+
+@pytest.fixture
+def storage(workdir):
+    fs.FEEDBACK_DIR.mkdir(exist_ok=True)
+    fs.IMAGES_DIR.mkdir(exist_ok=True)
+    return workdir
+
+
+def _append(timestamp, image_path):
+    record = fs._feedback_record(image_path, 0, "sano", 0.9)
+    record["timestamp"] = timestamp
+    with fs._feedback_lock():
+        fs._append_rows([record], fsync=False)
+
+
+def test_feedback_window_snapshot_and_late_rows(storage):
+    _append("2024-01-01T10:05:00", "uploads/a.jpg")
+    window = it.feedback_window()
+    assert window == {"since_row": None, "since": None, "until_row": 1}
+
+    it.record_retrain(pd.DataFrame(), ReplayBuffer(path=storage / "buffer.json"), window["until_row"])
+    _append("2024-01-01T10:00:00", "uploads/late.jpg")  # flush tardío de otro worker
+    window = it.feedback_window()
+    assert window == {"since_row": 1, "since": None, "until_row": 2}
+    df = fs.get_training_data(since_row=window["since_row"], until_row=window["until_row"])
+    assert list(df["image_path"]) == ["uploads/late.jpg"]
+
+
+def test_is_new_feedback_by_row_and_legacy_timestamp():
+    df = pd.DataFrame({"feedback_row": [0, 1, 2],
+                       "timestamp": ["2024-01-03", "2024-01-01", "2024-01-02"]})
+    by_row = it.is_new_feedback(df, {"since_row": 1, "since": None, "until_row": 3})
+    assert list(by_row) == [False, True, True]
+    by_time = it.is_new_feedback(df, {"since_row": None, "since": "2024-01-01", "until_row": 3})
+    assert list(by_time) == [True, False, True]
+
+
+def test_dedup_feedback_keeps_corrected_and_distinct(workdir):
+    near = 0xF0F0F0F0F0F0F0F0
+    df = pd.DataFrame({
+        "image_path": ["uploads/a.jpg", "uploads/b.jpg", "uploads/a.jpg", "uploads/c.jpg"],
+        "label": [0, 0, 1, 1],
+        "timestamp": ["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04"],
+        "corrected": [False, False, True, False],
+        "phash": [f"{near:016x}", f"{near ^ 0b11:016x}", f"{near:016x}", f"{~near & (2**64 - 1):016x}"],
+        "feedback_row": [0, 1, 2, 3],
+    })
+    result, report = it.dedup_feedback(df, max_distance=4)
+    # a corregida gana a su predicción y a b (casi duplicada); c es distinta
+    assert list(result["feedback_row"]) == [2, 3]
+    assert report["removed_same_image"] == 1
+    assert report["removed_near_duplicates"] == 1
+    assert it.DEDUP_REPORT.exists()
+
+    unfiltered, report = it.dedup_feedback(df, max_distance=-1)
+    assert report is None and len(unfiltered) == 4
+
+
+def _image(path, label=0):
+    from PIL import Image
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new("RGB", (16, 16), (200 * label, 100, 50)).save(path)
+    return str(path)
+
+
+def test_replay_after_full_retrain_seeds_with_original_dataset(storage):
+    originals = [_image(storage / "dataset" / f"orig_{i}.png", i % 2) for i in range(6)]
+    pd.DataFrame({"image_path": originals, "label": [i % 2 for i in range(6)],
+                  "timestamp": ""}).to_csv("dataset.csv", index=False)
+    buffer = ReplayBuffer(capacity=100, path=storage / "buffer.json")
+
+    # Reentrenamiento completo: el buffer sin sembrar no recibe el feedback
+    _append("2024-01-01T10:00:00", _image(storage / "uploads" / "a.png"))
+    window = it.feedback_window()
+    _, new_df = it.prepare_incremental_dataset(window, dedup_distance=-1)
+    it.record_retrain(new_df, buffer, window["until_row"])
+    assert len(buffer) == 0 and not buffer.seeded
+
+    # Primer reentrenamiento con replay: siembra con dataset.csv y el feedback anterior
+    _append("2024-01-02T10:00:00", _image(storage / "uploads" / "b.png", 1))
+    window = it.feedback_window()
+    csv_path, new_df = it.prepare_replay_dataset(buffer, window, dedup_distance=-1)
+    replay = pd.read_csv(csv_path).query("source == 'replay'")
+    assert set(originals) <= set(replay["image_path"])
+    assert str(storage / "uploads" / "a.png") in set(replay["image_path"])
+    it.record_retrain(new_df, buffer, window["until_row"])
+    assert buffer.seeded and len(buffer) == 8
+    assert ReplayBuffer.load(capacity=100, path=storage / "buffer.json").seeded
+
+
+def test_full_retrain_reads_feedback_in_place_and_replay_copies(storage):
+    upload = _image(storage / "uploads" / "a.png")
+    _append("2024-01-01T10:00:00", upload)
+    window = it.feedback_window()
+    csv_path, new_df = it.prepare_incremental_dataset(window, dedup_distance=-1)
+    assert list(pd.read_csv(csv_path)["image_path"]) == [upload]
+    assert list(new_df["image_path"]) == [upload]
+    assert not any(p.is_file() for p in fs.IMAGES_DIR.rglob("*"))
+
+    # El replay copia el feedback nuevo: el buffer no depende de uploads/
+    _append("2024-01-02T10:00:00", _image(storage / "uploads" / "b.png"))
+    buffer = ReplayBuffer(capacity=100, path=storage / "buffer.json")
+    _, new_df = it.prepare_replay_dataset(buffer, it.feedback_window(), dedup_distance=-1)
+    copies = [p for p in fs.IMAGES_DIR.rglob("*") if p.is_file()]
+    assert len(copies) == 2 and all(p.startswith(str(fs.IMAGES_DIR)) for p in new_df["image_path"])
+
+
+def test_resume_twice_keeps_new_feedback_and_watermark(workdir, monkeypatch):
+    torch = pytest.importorskip("torch")
+    from training_engine import read_checkpoint
+
+    images = [_image(workdir / "imgs" / f"{i}.png", i % 2) for i in range(10)]
+    pd.DataFrame({"image_path": images, "label": [i % 2 for i in range(10)]}).to_csv("inc.csv", index=False)
+    it.BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+    torch.save(it.SimpleCNN().state_dict(), it.ARTIFACTS_DIR / "best_model.pth")
+    extra_state = {"new_feedback": [{"image_path": images[0], "label": 0}], "feedback_rows": 7}
+
+    def interrupted(*args, **kwargs):
+        raise RuntimeError("interrumpido")
+
+    # Un backup más reciente (p. ej. de otro reentrenamiento) no debe usarse como referencia
+    newer = it.BACKUP_DIR / "best_model_backup_99991231_000000.pth"
+    newer.write_bytes(b"")
+    os.utime(newer, (time.time() + 3600, time.time() + 3600))
+
+    with monkeypatch.context() as m:
+        m.setattr(it, "check_precision", interrupted)
+        success, backup_path = it.retrain_model("inc.csv", epochs=1, extra_state=extra_state)
+        assert not success and backup_path.exists() and backup_path != newer
+        assert not it.resume_retrain(read_checkpoint(it.RETRAIN_CHECKPOINT), epochs=2)[0]
+    ckpt = read_checkpoint(it.RETRAIN_CHECKPOINT)
+    assert ckpt["epoch"] == 2 and ckpt["extra_state"] == extra_state
+
+    success, resumed_backup, new_feedback_df, feedback_rows = it.resume_retrain(ckpt, epochs=3)
+    assert success and not it.RETRAIN_CHECKPOINT.exists()
+    assert resumed_backup == backup_path
+    assert list(new_feedback_df["image_path"]) == [images[0]] and feedback_rows == 7
+
+
+def test_retrain_head_returns_its_own_backup(workdir):
+    torch = pytest.importorskip("torch")
+
+    images = [_image(workdir / "imgs" / f"{i}.png", i % 2) for i in range(10)]
+    pd.DataFrame({"image_path": images, "label": [i % 2 for i in range(10)]}).to_csv("inc.csv", index=False)
+    it.BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+    newer = it.BACKUP_DIR / "best_model_backup_99991231_000000.pth"
+    newer.write_bytes(b"")
+    os.utime(newer, (time.time() + 3600, time.time() + 3600))
+    torch.save(it.SimpleCNN().state_dict(), it.ARTIFACTS_DIR / "best_model.pth")
+
+    success, backup_path = it.retrain_head("inc.csv", epochs=1)
+    assert success and backup_path.exists() and backup_path != newer
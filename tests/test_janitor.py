@@ -0,0 +1,122 @@
+import json
+import os
+import time
+
+import pytest
+
+pytest.importorskip("pandas")
+
+import feedback_storage as fs
+import janitor
+
+DAY = 24 * 3600
+
+
+@pytest.fixture
+def tree(workdir):
+    fs.FEEDBACK_DIR.mkdir(exist_ok=True)
+    janitor.UPLOAD_DIR.mkdir()
+    janitor.OUTPUT_DIR.mkdir()
+    return workdir
+
+
+def make_file(path, age_days, size=10):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    old = time.time() - age_days * DAY
+    os.utime(path, (old, old))
+    return path
+
+
+def config(**overrides):
+    return {"uploads_ttl_days": 30, "uploads_quota_mb": 0, "outputs_ttl_days": 7, "outputs_quota_mb": 0,
+            "backups_keep": 2, "min_age_minutes": 60, "replay_only": False, **overrides}
+
+
+def add_feedback(path):
+    fs.save_feedback(str(path), 0, "sano", 0.9)
+
+
+def test_expired_uploads_without_feedback_are_deleted(tree):
+    orphan = make_file(janitor.UPLOAD_DIR / "orphan.jpg", 40)
+    recent = make_file(janitor.UPLOAD_DIR / "recent.jpg", 1)
+    janitor.run_janitor(config())
+    assert not orphan.exists()
+    assert recent.exists()
+
+
+def test_feedback_images_are_protected_by_default(tree):
+    used = make_file(janitor.UPLOAD_DIR / "used.jpg", 40)
+    add_feedback(used)
+    fs.mark_retrained(fs.feedback_row_count())
+    results = janitor.run_janitor(config())
+    assert used.exists()
+    assert results[0]["protected"] == 1
+
+
+def test_replay_only_deletes_retrained_feedback(tree):
+    used = make_file(janitor.UPLOAD_DIR / "used.jpg", 40)
+    new = make_file(janitor.UPLOAD_DIR / "new.jpg", 40)
+    add_feedback(used)
+    fs.mark_retrained(fs.feedback_row_count())
+    add_feedback(new)
+    janitor.run_janitor(config(replay_only=True))
+    assert not used.exists()
+    assert new.exists()
+
+
+def test_replay_buffer_and_holdout_are_protected(tree, monkeypatch):
+    from replay_buffer import BUFFER_PATH
+
+    buffered = make_file(janitor.UPLOAD_DIR / "buffered.jpg", 40)
+    holdout = make_file(janitor.UPLOAD_DIR / "holdout.jpg", 40)
+    BUFFER_PATH.parent.mkdir(parents=True, exist_ok=True)
+    BUFFER_PATH.write_text(json.dumps({"items": {"0": [{"image_path": str(buffered), "label": 0}]}}))
+    janitor.HOLDOUT_CSV.write_text(f"image_path,label\n{holdout},1\n")
+    janitor.run_janitor(config(replay_only=True))
+    assert buffered.exists() and holdout.exists()
+
+
+def test_quota_deletes_oldest_first(tree):
+    files = [make_file(janitor.UPLOAD_DIR / f"{i}.jpg", age_days=10 - i, size=400 * 1024) for i in range(5)]
+    results = janitor.run_janitor(config(uploads_ttl_days=0, uploads_quota_mb=1))
+    assert [f.exists() for f in files] == [False, False, False, True, True]
+    assert results[0]["remaining_bytes"] <= 1024 * 1024
+
+
+def test_dry_run_deletes_nothing(tree):
+    orphan = make_file(janitor.UPLOAD_DIR / "orphan.jpg", 40)
+    results = janitor.run_janitor(config(), dry_run=True)
+    assert orphan.exists()
+    assert results[0]["deleted"] == 1
+
+
+def test_keeps_latest_backups(tree):
+    backups = [make_file(janitor.BACKUP_DIR / f"best_model_backup_{i}.pth", age_days=5 - i) for i in range(4)]
+    janitor.run_janitor(config())
+    assert [b.exists() for b in backups] == [False, False, True, True]
+
+
+def test_default_config_from_env(monkeypatch):
+    monkeypatch.setenv("UPLOADS_TTL_DAYS", "3")
+    monkeypatch.setenv("JANITOR_REPLAY_ONLY", "1")
+    cfg = janitor.default_config()
+    assert cfg["uploads_ttl_days"] == 3
+    assert cfg["replay_only"] is True
+
+
+def test_unreferenced_feedback_copies_are_deleted(tree):
+    from replay_buffer import BUFFER_PATH
+
+    copies = janitor.FEEDBACK_IMAGES_DIR
+    stale = make_file(copies / "healthy" / "stale.jpg", 2)
+    buffered = make_file(copies / "healthy" / "buffered.jpg", 2)
+    training = make_file(copies / "sick" / "training.jpg", 2)
+    fresh = make_file(copies / "sick" / "fresh.jpg", 0)
+    BUFFER_PATH.write_text(json.dumps({"items": {"0": [{"image_path": str(buffered), "label": 0}]}}))
+    janitor.TRAINING_CSV.write_text(f"image_path,label\n{training},1\n")
+    results = janitor.run_janitor(config())
+    assert not stale.exists()
+    assert buffered.exists() and training.exists() and fresh.exists()
+    assert results[-1]["directory"] == str(copies)
+    assert (results[-1]["deleted"], results[-1]["protected"]) == (1, 3)
@@ -0,0 +1,53 @@
+import random
+
+from PIL import Image, ImageDraw
+
+from perceptual_hash import BKTree, dhash_file, hamming, DEFAULT_MAX_DISTANCE
+
+
+def _photo(path, size=(256, 192), seed=0, fmt="JPEG"):
+    rng = random.Random(seed)
+    img = Image.new("RGB", size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.ellipse([x, y, x + size[0] // 3, y + size[1] // 3],
+                     fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    img.save(path, format=fmt)
+    return img
+
+
+def test_bktree_matches_brute_force():
+    rng = random.Random(0)
+    hashes = [rng.getrandbits(64) for _ in range(300)]
+    # Casi duplicados: pocos bits cambiados respecto a hashes existentes
+    hashes += [h ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for h in hashes[:100]]
+    tree = BKTree()
+    for i, h in enumerate(hashes):
+        tree.add(h, i)
+    assert len(tree) == len(hashes)
+    for query in hashes[::7] + [rng.getrandbits(64) for _ in range(20)]:
+        for max_distance in (0, 2, DEFAULT_MAX_DISTANCE, 10):
+            expected = {i for i, h in enumerate(hashes) if hamming(query, h) <= max_distance}
+            assert {item for _, item in tree.search(query, max_distance)} == expected
+
+
+def test_dhash_survives_resize_and_reencoding(tmp_path):
+    original = _photo(tmp_path / "a.jpg")
+    original.resize((128, 96)).save(tmp_path / "a_small.png")
+    original.save(tmp_path / "a_low.jpg", quality=40)
+    _photo(tmp_path / "b.jpg", seed=1)
+
+    base = int(dhash_file(tmp_path / "a.jpg"), 16)
+    assert hamming(base, int(dhash_file(tmp_path / "a_small.png"), 16)) <= DEFAULT_MAX_DISTANCE
+    assert hamming(base, int(dhash_file(tmp_path / "a_low.jpg"), 16)) <= DEFAULT_MAX_DISTANCE
+    assert hamming(base, int(dhash_file(tmp_path / "b.jpg"), 16)) > DEFAULT_MAX_DISTANCE
+
+
+def test_dhash_file_unreadable_is_none(tmp_path):
+    broken = tmp_path / "roto.jpg"
+    broken.write_bytes(b"no es una imagen")
+    assert dhash_file(broken) is None
+    assert dhash_file(tmp_path / "no_existe.jpg") is None
+    _photo(tmp_path / "c.png", seed=2, fmt="PNG")
+    assert len(dhash_file(tmp_path / "c.png")) == 16
@@ -0,0 +1,25 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+import precision
+
+
+@pytest.mark.parametrize("flags, expected", [
+    ({"avx2", "avx512f", "avx512bw"}, False),  # AVX512 sin bf16 nativo (oneDNN lo emularía)
+    ({"avx512f", "avx512_bf16"}, True),
+    ({"amx_tile", "amx_bf16"}, True),
+    ({"fp", "asimd", "bf16"}, True),  # ARM
+])
+def test_cpu_supports_bf16_requires_native_flags(monkeypatch, flags, expected):
+    monkeypatch.setattr(precision, "_cpu_flags", lambda: flags)
+    assert precision.cpu_supports_bf16() is expected
+
+
+def test_resolve_precision_falls_back_to_fp32(monkeypatch):
+    monkeypatch.setattr(precision, "_cpu_flags", lambda: {"avx512f"})
+    cpu = torch.device("cpu")
+    assert precision.resolve_precision("bf16", cpu) == "fp32"
+    assert precision.resolve_precision(None, cpu) == "fp32"
+    with pytest.raises(ValueError):
+        precision.resolve_precision("fp16", cpu)
@@ -0,0 +1,136 @@
+import argparse
+import os
+import subprocess
+import sys
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("PIL")
+
+import predict
+from predict import SimpleCNN, StudentCNN, load_model, model_artifact
+
+
+def _same_weights(model, reference):
+    return all(torch.equal(a, b) for a, b in zip(model.state_dict().values(), reference.state_dict().values()))
+
+
+def test_load_state_dict_with_mmap(workdir):
+    reference = SimpleCNN()
+    torch.save(reference.state_dict(), "model.pth")
+    model = load_model("model.pth")
+    assert isinstance(model, SimpleCNN) and not model.training
+    assert _same_weights(model, reference)
+
+
+def test_load_artifact_architecture(workdir):
+    reference = StudentCNN(width=8)
+    torch.save(model_artifact(reference, "student_cnn", {"width": 8}), "student.pth")
+    model = load_model("student.pth")
+    assert isinstance(model, StudentCNN)
+    assert _same_weights(model, reference)
+
+
+def test_legacy_format_falls_back_without_mmap(workdir):
+    reference = SimpleCNN()
+    torch.save(reference.state_dict(), "legacy.pth", _use_new_zipfile_serialization=False)
+    assert _same_weights(load_model("legacy.pth"), reference)
+
+
+def test_full_pickle_checkpoint_falls_back(workdir):
+    # Objetos que no son tensores: weights_only=True falla con UnpicklingError
+    reference = SimpleCNN()
+    artifact = model_artifact(reference, "simple_cnn", args=argparse.Namespace(epochs=3))
+    torch.save(artifact, "full.pth")
+    assert _same_weights(load_model("full.pth"), reference)
+
+
+def test_missing_model_raises(workdir):
+    with pytest.raises(FileNotFoundError):
+        load_model("missing.pth")
+
+
+def test_torchscript_backend_matches_eager():
+    model = SimpleCNN().eval()
+    scripted = predict.compile_model(model, backend="torchscript", precision="fp32")
+    batch = torch.randn(3, 3, predict.IMG_SIZE, predict.IMG_SIZE)
+    with torch.no_grad():
+        assert torch.allclose(scripted(batch), model(batch), atol=1e-5)
+    assert predict.compile_model(model, backend="torchscript", precision="bf16") is model
+
+
+def test_torchscript_freezes_mmapped_weights_in_place(workdir):
+    torch.save(SimpleCNN().state_dict(), "model.pth")
+    model = load_model("model.pth")
+    assert model.shared_weights
+    frozen = predict.compile_model(model, backend="torchscript", precision="fp32")
+    assert not list(frozen.parameters())  # congelado: pesos como constantes
+    assert predict._private_constant_bytes(frozen, model) == 0
+
+
+def test_torchscript_skips_freeze_that_copies_shared_weights():
+    # conv + BatchNorm: freeze pliega la BN y crea pesos nuevos
+    model = torch.nn.Sequential(torch.nn.Conv2d(3, 4, 3), torch.nn.BatchNorm2d(4)).eval()
+    model.shared_weights = True
+    traced = predict.compile_model(model, backend="torchscript", img_size=8, precision="fp32")
+    assert [p.data_ptr() for p in traced.parameters()] == [p.data_ptr() for p in model.parameters()]
+
+    model.shared_weights = False
+    assert not list(predict.compile_model(model, backend="torchscript", img_size=8,
+                                          precision="fp32").parameters())
+
+
+def test_importing_predict_keeps_thread_count(workdir):
+    code = ("import torch; torch.set_num_threads(2); import predict; "
+            "assert torch.get_num_threads() == 2, 'import'; "
+            "predict.apply_inference_threads(); assert torch.get_num_threads() == 1, 'get_model'")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            env={**os.environ, "INFERENCE_THREADS": "1",
+                                 "PYTHONPATH": os.path.dirname(predict.__file__)})
+    assert result.returncode == 0, result.stderr
+
+
+class FixedLogits(torch.nn.Module):
+    """Modelo de prueba: devuelve logits fijos por posición en el lote"""
+
+    def __init__(self, logits):
+        super().__init__()
+        self.logits = torch.tensor(logits)
+        self.calls = []
+
+    def forward(self, x):
+        self.calls.append(len(x))
+        return self.logits[:len(x)]
+
+
+def test_cascade_escalates_only_below_threshold(monkeypatch):
+    monkeypatch.setattr(predict, "_cascade_stats", {"images": 0, "escalated": 0})
+    fast = FixedLogits([[5.0, 0.0], [0.1, 0.0], [0.0, 2.0], [0.0, 0.2]])
+    full = FixedLogits([[0.0, 5.0]] * 4)
+    batch = torch.zeros(4, 3, 16, 16)
+    threshold = torch.softmax(torch.tensor([0.0, 2.0]), dim=0)[1].item()  # confianza de la imagen 2
+
+    results = predict.predict_cascade(full, fast, batch, threshold=threshold, fast_img_size=16, precision="fp32")
+    # La imagen con confianza igual al umbral no se escala; las de menor confianza sí
+    assert [r["stage"] for r in results] == ["fast", "full", "fast", "full"]
+    assert [r["label"] for r in results] == [0, 1, 1, 1]
+    assert full.calls == [2]
+    stats = predict.get_cascade_stats()
+    assert (stats["images"], stats["escalated"], stats["fast_decided"]) == (4, 2, 2)
+    assert stats["escalation_rate"] == 0.5
+
+
+def test_cascade_resizes_first_stage_input(monkeypatch):
+    monkeypatch.setattr(predict, "_cascade_stats", {"images": 0, "escalated": 0})
+    sizes = []
+
+    class Recorder(FixedLogits):
+        def forward(self, x):
+            sizes.append(x.shape[-1])
+            return super().forward(x)
+
+    fast = Recorder([[5.0, 0.0]])
+    predict.predict_cascade(FixedLogits([[0.0, 5.0]]), fast, torch.zeros(1, 3, 32, 32),
+                            threshold=0.5, fast_img_size=16, precision="fp32")
+    assert sizes == [16]
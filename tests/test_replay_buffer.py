@@ -0,0 +1,49 @@
+from replay_buffer import ReplayBuffer
+
+
+def _rows(label, n, start=0):
+    return [{"image_path": f"img_{label}_{i}.jpg", "label": label, "timestamp": f"t{i}"}
+            for i in range(start, start + n)]
+
+
+def test_reservoir_is_balanced_and_bounded(tmp_path):
+    buffer = ReplayBuffer(capacity=10, path=tmp_path / "buffer.json")
+    buffer.add(_rows(0, 100) + _rows(1, 3) + [{"image_path": "x.jpg", "label": 7}])
+    assert len(buffer.items[0]) == 5 and len(buffer.items[1]) == 3
+    assert buffer.seen == {0: 100, 1: 3}
+    # Con reservoir sampling no se quedan solo las primeras filas
+    assert any(int(item["image_path"].split("_")[2].split(".")[0]) >= 5 for item in buffer.items[0])
+
+
+def test_save_and_load_continue_the_same_stream(tmp_path):
+    path = tmp_path / "buffer.json"
+    buffer = ReplayBuffer(capacity=10, path=path)
+    buffer.add(_rows(0, 50) + _rows(1, 50))
+    buffer.save()
+    assert not path.with_suffix(".tmp").exists()
+
+    loaded = ReplayBuffer.load(capacity=10, path=path)
+    assert loaded.items == buffer.items and loaded.seen == buffer.seen
+    # El estado del RNG se persiste: seguir añadiendo da el mismo resultado
+    buffer.add(_rows(0, 50, start=50))
+    loaded.add(_rows(0, 50, start=50))
+    assert loaded.items == buffer.items
+
+
+def test_load_with_smaller_capacity_and_missing_file(tmp_path):
+    path = tmp_path / "buffer.json"
+    assert len(ReplayBuffer.load(path=path)) == 0
+    buffer = ReplayBuffer(capacity=20, path=path)
+    buffer.add(_rows(0, 30) + _rows(1, 30))
+    buffer.save()
+    smaller = ReplayBuffer.load(capacity=4, path=path)
+    assert len(smaller.items[0]) == 2 and len(smaller.items[1]) == 2
+    assert {i["image_path"] for i in smaller.items[0]} <= {i["image_path"] for i in buffer.items[0]}
+
+
+def test_sample_skips_deleted_images(tmp_path):
+    kept = tmp_path / "kept.jpg"
+    kept.write_bytes(b"jpg")
+    buffer = ReplayBuffer(capacity=10, path=tmp_path / "buffer.json")
+    buffer.add([{"image_path": str(kept), "label": 0}, {"image_path": str(tmp_path / "gone.jpg"), "label": 1}])
+    assert [item["image_path"] for item in buffer.sample()] == [str(kept)]
@@ -0,0 +1,71 @@
+import subprocess
+import sys
+
+import pytest
+
+import retrain_isolation as ri
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(ri, "POLL_SECONDS", 0.02)
+    return {"nice": 10, "ionice": "none", "threads": 1, "cpus": None, "memory_mb": None,
+            "cgroup": None, "pause_depth": 0, "max_pause_seconds": 60.0}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("0-3,6", {0, 1, 2, 3, 6}),
+    (" 1 , 2-2 ,", {1, 2}),
+    ("", set()),
+])
+def test_parse_cpus(text, expected):
+    assert ri.parse_cpus(text) == expected
+
+
+def test_limits_from_env(monkeypatch):
+    monkeypatch.setenv("RETRAIN_CPUS", "2-3")
+    monkeypatch.setenv("RETRAIN_THREADS", "2")
+    monkeypatch.setenv("RETRAIN_PAUSE_DEPTH", "4")
+    monkeypatch.delenv("RETRAIN_MEMORY_MB", raising=False)
+    limits = ri.limits_from_env()
+    assert limits["cpus"] == {2, 3}
+    assert limits["threads"] == 2
+    assert limits["pause_depth"] == 4
+    assert limits["memory_mb"] is None
+    assert ri.child_env(limits)["OMP_NUM_THREADS"] == "2"
+
+
+def test_run_isolated_writes_log(tmp_path, limits):
+    log = tmp_path / "retrain.log"
+    code = "import os; print('hilos', os.environ['OMP_NUM_THREADS'])"
+    returncode, paused, warnings = ri.run_isolated([sys.executable, "-c", code], limits, timeout=30, log_path=log)
+    assert returncode == 0 and paused == 0
+    assert "hilos 1" in ri.log_tail(log)
+    assert ri.log_tail(tmp_path / "no_existe.log") == ""
+
+
+def test_run_isolated_timeout_kills_process(tmp_path, limits):
+    with pytest.raises(subprocess.TimeoutExpired):
+        ri.run_isolated([sys.executable, "-c", "import time; time.sleep(30)"], limits, timeout=0.3,
+                        log_path=tmp_path / "retrain.log")
+
+
+def test_run_isolated_pauses_while_busy_and_caps_pause(tmp_path, limits):
+    limits.update(pause_depth=1, max_pause_seconds=0.2)
+    states = []
+    returncode, paused, _ = ri.run_isolated(
+        [sys.executable, "-c", "import time; time.sleep(0.3)"], limits, timeout=30,
+        log_path=tmp_path / "retrain.log", queue_depth=lambda: 3, on_state=states.append)
+    assert returncode == 0
+    # Siempre ocupado: se pausa, se reanuda al llegar a max_pause_seconds y termina
+    assert states[:2] == [True, False]
+    assert paused >= 0.2
+
+
+def test_run_isolated_does_not_pause_when_idle(tmp_path, limits):
+    limits.update(pause_depth=1)
+    states = []
+    returncode, paused, _ = ri.run_isolated(
+        [sys.executable, "-c", "pass"], limits, timeout=30,
+        log_path=tmp_path / "retrain.log", queue_depth=lambda: 0, on_state=states.append)
+    assert returncode == 0 and paused == 0 and states == []
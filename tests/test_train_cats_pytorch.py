@@ -0,0 +1,72 @@
+import socket
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pd = pytest.importorskip("pandas")
+
+import torch.multiprocessing as mp
+from torch.utils.data import DistributedSampler
+
+import training_engine
+import train_cats_pytorch as tc
+
+
+def _dataset_csv(workdir, n=20, missing=2):
+    rows = []
+    for i in range(n + missing):
+        path = f"img_{i}.jpg"
+        if i < n:
+            (workdir / path).write_bytes(b"jpg")
+        rows.append({"image_path": path, "label": i % 2})
+    pd.DataFrame(rows).to_csv("dataset.csv", index=False)
+    return "dataset.csv"
+
+
+def test_load_splits_drops_missing_and_is_disjoint(workdir):
+    train, val, test = tc.load_splits(_dataset_csv(workdir))
+    assert (len(train), len(val), len(test)) == (14, 3, 3)
+    paths = [set(part["image_path"]) for part in (train, val, test)]
+    assert not (paths[0] & paths[1] or paths[0] & paths[2] or paths[1] & paths[2])
+    assert len(set.union(*paths)) == 20
+    # Los splits guardados en el checkpoint se recuperan igual al reanudar
+    restored = tc.splits_from_state(tc.splits_to_state(train, val, test))
+    for original, again in zip((train, val, test), restored):
+        assert list(again["image_path"]) == list(original["image_path"])
+        assert list(again["label"]) == list(original["label"])
+
+
+def test_distributed_sampler_partitions_train_split():
+    data = list(range(15))
+    parts = [list(DistributedSampler(data, num_replicas=3, rank=r, shuffle=True, seed=42)) for r in range(3)]
+    assert sorted(sum(parts, [])) == data
+    assert all(len(p) == 5 for p in parts)
+
+
+def _ddp_worker(rank, world_size, port, results):
+    training_engine.setup_distributed(rank, world_size, master_port=port)
+    try:
+        sums = training_engine._reduce_sums(float(rank + 1), 1.0)
+        flag = training_engine.sync_flag(rank == 1)
+        results.put((rank, list(sums), flag, training_engine.is_main_process()))
+    finally:
+        training_engine.cleanup_distributed()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_reduce_and_stop_flag_across_processes():
+    if not torch.distributed.is_available():
+        pytest.skip("torch.distributed no disponible")
+    ctx = mp.get_context("spawn")
+    results = ctx.SimpleQueue()
+    mp.start_processes(_ddp_worker, args=(2, _free_port(), results), nprocs=2, join=True,
+                       start_method="spawn")
+    by_rank = dict((r[0], r[1:]) for r in (results.get(), results.get()))
+    # Suma de métricas entre procesos y parada si cualquier proceso la pide
+    assert by_rank[0] == ([3.0, 2.0], True, True)
+    assert by_rank[1] == ([3.0, 2.0], True, False)
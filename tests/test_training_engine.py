@@ -0,0 +1,176 @@
+import random
+
+import pytest
+
+torch = pytest.importorskip("torch")
+np = pytest.importorskip("numpy")
+
+import training_engine
+from training_engine import (EarlyStopping, TimeBudget, build_scheduler, load_checkpoint, read_checkpoint,
+                             save_checkpoint)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(training_engine.time, "perf_counter", fake)
+    return fake
+
+
+def run_epoch(budget, clock, seconds):
+    budget.start_epoch()
+    clock.now += seconds
+    budget.end_epoch()
+
+
+def test_early_stopping_patience_and_min_delta():
+    stopper = EarlyStopping(patience=2, min_delta=0.1)
+    assert not stopper.step(1.0)
+    assert not stopper.step(0.95)  # mejora menor que min_delta
+    assert stopper.step(0.93)
+    assert stopper.best == 1.0
+
+
+def test_early_stopping_disabled_and_state_roundtrip():
+    stopper = EarlyStopping(patience=0)
+    assert not any(stopper.step(1.0) for _ in range(10))
+    restored = EarlyStopping(patience=3)
+    restored.load_state_dict({"best": 0.5, "bad_epochs": 2})
+    assert restored.step(0.6)
+
+
+def test_time_budget_stops_before_overrunning(clock):
+    budget = TimeBudget(250)
+    assert not budget.exhausted()
+    run_epoch(budget, clock, 100)
+    assert not budget.exhausted()  # 100 + 100 <= 250
+    run_epoch(budget, clock, 100)
+    assert budget.exhausted()  # 200 + 100 > 250
+
+
+def test_time_budget_without_limit(clock):
+    budget = TimeBudget(None)
+    run_epoch(budget, clock, 1e6)
+    assert not budget.exhausted()
+
+
+def test_time_budget_resume_keeps_epoch_average(clock):
+    # 10 épocas de 100s antes de interrumpir, presupuesto de 3240s
+    budget = TimeBudget(3240)
+    budget.load_state_dict(TimeBudget(3240, elapsed=1000.0, epochs=10).state_dict())
+    for _ in range(7):
+        run_epoch(budget, clock, 100)
+        assert not budget.exhausted()
+    assert budget.elapsed == 1700.0
+    # Con la media de todo el tiempo como una sola época se habría detenido en ~1600s
+    for _ in range(14):
+        run_epoch(budget, clock, 100)
+    assert budget.elapsed == 3100.0
+    assert not budget.exhausted()  # 3100 + 100 <= 3240
+    run_epoch(budget, clock, 100)
+    assert budget.exhausted()
+
+
+def test_time_budget_legacy_checkpoint_uses_session_average(clock):
+    budget = TimeBudget(3240)
+    budget.load_state_dict({"elapsed": 1000.0})
+    run_epoch(budget, clock, 100)
+    assert not budget.exhausted()
+    assert budget.state_dict() == {"elapsed": 1100.0, "epochs": 1, "epoch_seconds": 100.0}
+    # Un segundo reanudado mantiene la media de 100s por época
+    resumed = TimeBudget(3240)
+    resumed.load_state_dict(budget.state_dict())
+    assert resumed.elapsed + resumed.state_dict()["epoch_seconds"] / resumed.epochs == 1200.0
+    assert not resumed.exhausted()
+
+
+def _draws():
+    return random.random(), float(np.random.rand()), torch.rand(3).tolist()
+
+
+def test_checkpoint_restores_weights_optimizer_and_rng(workdir):
+    model = torch.nn.Linear(4, 2)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    scheduler = build_scheduler(optimizer, "plateau", epochs=5)
+    model(torch.randn(8, 4)).sum().backward()
+    optimizer.step()
+    save_checkpoint("ckpt.pt", model, optimizer, epoch=3, scheduler=scheduler, best_val_loss=0.5)
+    assert not (workdir / "ckpt.pt.tmp").exists()
+    expected_draws = _draws()
+    expected_weights = {k: v.clone() for k, v in model.state_dict().items()}
+
+    restored = torch.nn.Linear(4, 2)
+    restored_optimizer = torch.optim.Adam(restored.parameters(), lr=1e-3)
+    ckpt = load_checkpoint("ckpt.pt", restored, restored_optimizer, build_scheduler(restored_optimizer, "plateau", 5))
+    assert ckpt["epoch"] == 3 and ckpt["best_val_loss"] == 0.5
+    assert all(torch.equal(restored.state_dict()[k], v) for k, v in expected_weights.items())
+    assert restored_optimizer.state_dict()["state"][0]["step"] == 1
+    # Las mismas muestras aleatorias que justo después de guardar
+    assert _draws() == expected_draws
+    assert read_checkpoint("ckpt.pt")["epoch"] == 3
+
+
+def _optimizer(lr=0.1):
+    return torch.optim.SGD(torch.nn.Linear(2, 1).parameters(), lr=lr)
+
+
+def test_plateau_scheduler_halves_lr_after_patience():
+    optimizer = _optimizer()
+    scheduler = build_scheduler(optimizer, "plateau", epochs=10, patience=4)
+    assert isinstance(scheduler, torch.optim.lr_scheduler.ReduceLROnPlateau)
+    training_engine.scheduler_step(scheduler, 1.0)
+    for _ in range(2):  # patience // 2 épocas sin mejora
+        training_engine.scheduler_step(scheduler, 1.0)
+    assert training_engine.current_lr(optimizer) == pytest.approx(0.1)
+    training_engine.scheduler_step(scheduler, 1.0)
+    assert training_engine.current_lr(optimizer) == pytest.approx(0.05)
+
+
+def test_cosine_scheduler_anneals_over_epochs_and_none():
+    optimizer = _optimizer()
+    scheduler = build_scheduler(optimizer, "cosine", epochs=4)
+    lrs = []
+    for _ in range(4):
+        optimizer.step()
+        training_engine.scheduler_step(scheduler, 123.0)  # la métrica se ignora
+        lrs.append(training_engine.current_lr(optimizer))
+    assert lrs == sorted(lrs, reverse=True) and lrs[-1] == pytest.approx(0.0, abs=1e-12)
+    assert build_scheduler(_optimizer(), "none", epochs=4) is None
+    training_engine.scheduler_step(None, 1.0)
+
+
+@pytest.mark.parametrize("name", ["plateau", "cosine"])
+def test_schedule_state_roundtrips_through_checkpoint(workdir, name):
+    model = torch.nn.Linear(2, 1)
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+    scheduler = build_scheduler(optimizer, name, epochs=6, patience=2)
+    stopper = EarlyStopping(patience=3, min_delta=0.01)
+    for loss in (1.0, 0.9, 0.95, 0.97):
+        optimizer.step()
+        training_engine.scheduler_step(scheduler, loss)
+        stopper.step(loss)
+    save_checkpoint("ckpt.pt", model, optimizer, epoch=4, scheduler=scheduler,
+                    early_stopping=stopper.state_dict())
+
+    restored_optimizer = torch.optim.SGD(torch.nn.Linear(2, 1).parameters(), lr=0.1)
+    restored_scheduler = build_scheduler(restored_optimizer, name, epochs=6, patience=2)
+    restored_stopper = EarlyStopping(patience=3, min_delta=0.01)
+    ckpt = load_checkpoint("ckpt.pt", optimizer=restored_optimizer, scheduler=restored_scheduler)
+    restored_stopper.load_state_dict(ckpt["early_stopping"])
+    assert training_engine.current_lr(restored_optimizer) == pytest.approx(training_engine.current_lr(optimizer))
+    assert (restored_stopper.best, restored_stopper.bad_epochs) == (0.9, 2)
+    # Ambos continúan igual: misma decisión de parada y mismo LR en la siguiente época
+    for sched, opt, stop in ((scheduler, optimizer, stopper),
+                             (restored_scheduler, restored_optimizer, restored_stopper)):
+        opt.step()
+        training_engine.scheduler_step(sched, 0.99)
+        assert stop.step(0.99)
+    assert training_engine.current_lr(restored_optimizer) == pytest.approx(training_engine.current_lr(optimizer))
@@ -2,30 +2,45 @@
 import os, random, numpy as np, pandas as pd
 from PIL import Image, ImageOps
 import torch, torch.nn as nn, torch.optim as optim
-from torch.utils.data import Dataset, DataLoader
-from sklearn.metrics import confusion_matrix, classification_report
-import matplotlib
-matplotlib.use('Agg')  # Backend no interactivo para evitar problemas en servidores
-import matplotlib.pyplot as plt
+from torch.utils.data import Dataset, DataLoader, DistributedSampler
+from torch.nn.parallel import DistributedDataParallel as DDP
+import torch.multiprocessing as mp
+# sklearn y matplotlib se importan solo en el reporte final (train_worker): quien importa
+# este módulo (incremental_train.py, distill.py) no paga su tiempo de importación
 import sys
 import traceback
+from training_engine import (train_one_epoch, evaluate, save_checkpoint, read_checkpoint, load_checkpoint, atomic_torch_save,
+                             EarlyStopping, TimeBudget, build_scheduler, scheduler_step, current_lr,
+                             add_schedule_args, schedule_summary,
+                             setup_distributed, cleanup_distributed, is_main_process, sync_flag, unwrap_model,
+                             check_precision)
+from precision import resolve_precision, add_precision_arg
+from profiling import start_training_profiler
+from hw_profile import hw_setting
 
 # ------------- Config -------------
 CSV = "dataset.csv"   # generado en Paso 1
 IMG_SIZE = 128
-BATCH = 16
+# Batch, workers del DataLoader e hilos: del perfil de hardware (python autotune.py) si existe
+BATCH = hw_setting("training", "batch_size", 16)
+NUM_WORKERS = hw_setting("training", "num_workers", 0)
+TRAIN_THREADS = hw_setting("training", "threads")
 EPOCHS = 20
 OUT_DIR = "artifacts"
+CHECKPOINT = os.path.join(OUT_DIR, "train_checkpoint.pt")  # checkpoint completo por época (--resume)
 os.makedirs(OUT_DIR, exist_ok=True)
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f"Usando dispositivo: {device}", flush=True)
-# Crear archivo de log
-log_file = open("training.log", "w", encoding="utf-8")
+# Archivo de log (se abre en train_worker; en entrenamiento distribuido solo escribe el rank 0)
+log_file = None
+log_enabled = True
 def log_print(*args):
+    if not log_enabled:
+        return
     msg = " ".join(str(a) for a in args)
     print(msg, flush=True)
-    log_file.write(msg + "\n")
-    log_file.flush()
+    if log_file is not None:
+        log_file.write(msg + "\n")
+        log_file.flush()
 
 # ------------- Dataset -------------
 class CatsDataset(Dataset):
@@ -60,10 +75,24 @@ class CatsDataset(Dataset):
         label = int(row['label'])
         return tensor, label
 
+# ------------- Modelo sencillo -------------
+class SimpleCNN(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv = nn.Sequential(
+            nn.Conv2d(3,32,3,padding=1), nn.ReLU(), nn.MaxPool2d(2),
+            nn.Conv2d(32,64,3,padding=1), nn.ReLU(), nn.MaxPool2d(2),
+            nn.Conv2d(64,128,3,padding=1), nn.ReLU(), nn.MaxPool2d(2),
+        )
+        feat = (IMG_SIZE//8)*(IMG_SIZE//8)*128
+        self.fc = nn.Sequential(nn.Flatten(), nn.Linear(feat,256), nn.ReLU(), nn.Dropout(0.4), nn.Linear(256,2))
+    def forward(self,x): return self.fc(self.conv(x))
+
 # ------------- Load CSV and split -------------
-log_print(f"Cargando CSV: {CSV}")
-try:
-    df = pd.read_csv(CSV)
+def load_splits(csv_path):
+    """Carga el CSV, descarta imágenes inexistentes y divide en train/val/test (70/15/15)"""
+    log_print(f"Cargando CSV: {csv_path}")
+    df = pd.read_csv(csv_path)
     log_print(f"Total de imágenes: {len(df)}")
     # Normalizar rutas en el DataFrame
     df['image_path'] = df['image_path'].str.replace('\\', os.sep).str.replace('/', os.sep)
@@ -88,124 +117,233 @@ try:
     train = df.iloc[:int(0.7*n)]
     val   = df.iloc[int(0.7*n):int(0.85*n)]
     test  = df.iloc[int(0.85*n):]
-    log_print(f"Train: {len(train)}, Val: {len(val)}, Test: {len(test)}")
-except Exception as e:
-    print(f"Error al cargar el CSV: {e}")
-    traceback.print_exc()
-    sys.exit(1)
-
-try:
-    train_loader = DataLoader(CatsDataset(train,train=True), batch_size=BATCH, shuffle=True)
-    val_loader   = DataLoader(CatsDataset(val,train=False), batch_size=BATCH, shuffle=False)
-    test_loader  = DataLoader(CatsDataset(test,train=False), batch_size=BATCH, shuffle=False)
-except Exception as e:
-    log_print(f"Error al crear los DataLoaders: {e}")
-    traceback.print_exc()
-    log_file.close()
-    sys.exit(1)
+    return train, val, test
 
-# ------------- Modelo sencillo -------------
-class SimpleCNN(nn.Module):
-    def __init__(self):
-        super().__init__()
-        self.conv = nn.Sequential(
-            nn.Conv2d(3,32,3,padding=1), nn.ReLU(), nn.MaxPool2d(2),
-            nn.Conv2d(32,64,3,padding=1), nn.ReLU(), nn.MaxPool2d(2),
-            nn.Conv2d(64,128,3,padding=1), nn.ReLU(), nn.MaxPool2d(2),
-        )
-        feat = (IMG_SIZE//8)*(IMG_SIZE//8)*128
-        self.fc = nn.Sequential(nn.Flatten(), nn.Linear(feat,256), nn.ReLU(), nn.Dropout(0.4), nn.Linear(256,2))
-    def forward(self,x): return self.fc(self.conv(x))
+def splits_to_state(train, val, test):
+    """Serializa los splits (rutas y labels) para guardarlos en el checkpoint"""
+    return {name: part[['image_path','label']].to_dict('list') for name, part in (('train',train),('val',val),('test',test))}
+
+def splits_from_state(state):
+    return tuple(pd.DataFrame(state[name]) for name in ('train','val','test'))
+
+
+def train_worker(local_rank, args):
+    """
+    Entrena el modelo. Con --nprocs/--nnodes > 1 se ejecuta una vez por proceso
+    (DistributedDataParallel sobre gloo); solo el rank 0 escribe logs, checkpoints y el modelo.
+    """
+    global log_file, log_enabled
+    world_size = args.nprocs * args.nnodes
+    rank = args.node_rank * args.nprocs + local_rank
+    distributed = world_size > 1
+    if distributed:
+        # Repartir los núcleos entre procesos para no sobresuscribir la CPU
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // args.nprocs))
+        setup_distributed(rank, world_size, args.master_addr, args.master_port)
+    elif TRAIN_THREADS and "OMP_NUM_THREADS" not in os.environ:
+        # OMP_NUM_THREADS explícito (p. ej. el reentrenamiento aislado de la API) tiene prioridad
+        torch.set_num_threads(TRAIN_THREADS)
+    log_enabled = is_main_process()
+
+    if log_enabled:
+        print(f"Usando dispositivo: {device}" + (f" ({world_size} procesos, gloo)" if distributed else ""), flush=True)
+    ckpt_exists = args.resume and os.path.exists(CHECKPOINT)
+    # Crear archivo de log (se conserva el anterior al reanudar)
+    if log_enabled:
+        log_file = open("training.log", "a" if ckpt_exists else "w", encoding="utf-8")
+    if args.resume and not ckpt_exists:
+        log_print(f"No existe {CHECKPOINT}, se entrena desde cero")
 
-model = SimpleCNN().to(device)
-criterion = nn.CrossEntropyLoss()
-optimizer = optim.Adam(model.parameters(), lr=1e-3, weight_decay=1e-4)
+    try:
+        if ckpt_exists:
+            # Los splits se toman del checkpoint para no mezclar datos entre train/val/test
+            ckpt = read_checkpoint(CHECKPOINT)
+            train, val, test = splits_from_state(ckpt['splits'])
+        else:
+            train, val, test = load_splits(args.csv)
+        log_print(f"Train: {len(train)}, Val: {len(val)}, Test: {len(test)}")
+    except Exception as e:
+        print(f"Error al cargar el CSV: {e}")
+        traceback.print_exc()
+        sys.exit(1)
+
+    try:
+        train_ds, val_ds = CatsDataset(train,train=True), CatsDataset(val,train=False)
+        if distributed:
+            # Cada proceso ve una partición distinta del dataset en cada época
+            train_sampler = DistributedSampler(train_ds, num_replicas=world_size, rank=rank, shuffle=True, seed=42)
+            val_sampler = DistributedSampler(val_ds, num_replicas=world_size, rank=rank, shuffle=False)
+            train_loader = DataLoader(train_ds, batch_size=BATCH, sampler=train_sampler, num_workers=NUM_WORKERS)
+            val_loader   = DataLoader(val_ds, batch_size=BATCH, sampler=val_sampler, num_workers=NUM_WORKERS)
+        else:
+            train_sampler = None
+            train_loader = DataLoader(train_ds, batch_size=BATCH, shuffle=True, num_workers=NUM_WORKERS)
+            val_loader   = DataLoader(val_ds, batch_size=BATCH, shuffle=False, num_workers=NUM_WORKERS)
+        test_loader  = DataLoader(CatsDataset(test,train=False), batch_size=BATCH, shuffle=False, num_workers=NUM_WORKERS)
+    except Exception as e:
+        log_print(f"Error al crear los DataLoaders: {e}")
+        traceback.print_exc()
+        if log_file: log_file.close()
+        sys.exit(1)
+
+    model = SimpleCNN().to(device)
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(model.parameters(), lr=1e-3, weight_decay=1e-4)
+    scheduler = build_scheduler(optimizer, args.scheduler, args.epochs, args.patience)
+    stopper = EarlyStopping(patience=args.patience, min_delta=args.min_delta)
+    budget = TimeBudget(args.time_budget)
+    precision = args.precision  # ya resuelta en main() (fp32 si la CPU no soporta bf16)
 
-# ------------- Entrenamiento -------------
-print("\nIniciando entrenamiento...")
-try:
     best_val_loss = 1e9
-    history = {'train_loss':[], 'val_loss':[], 'train_acc':[], 'val_acc':[]}
-    for epoch in range(1, EPOCHS+1):
-        model.train()
-        running_loss=0; correct=0; n=0
-        for xb,yb in train_loader:
-            xb, yb = xb.to(device), yb.to(device)
-            optimizer.zero_grad(); out = model(xb); loss = criterion(out,yb); loss.backward(); optimizer.step()
-            running_loss += loss.item()*xb.size(0)
-            preds = out.argmax(dim=1); correct += (preds==yb).sum().item(); n += xb.size(0)
-        train_loss = running_loss/n; train_acc = correct/n
-
-        # valida
-        model.eval()
-        vloss=0; vcorrect=0; vn=0
-        ys=[]; ypred=[]
-        with torch.no_grad():
-            for xb,yb in val_loader:
-                xb, yb = xb.to(device), yb.to(device)
-                out = model(xb); loss = criterion(out,yb)
-                vloss += loss.item()*xb.size(0)
-                preds = out.argmax(dim=1)
-                ys.extend(yb.cpu().numpy().tolist()); ypred.extend(preds.cpu().numpy().tolist())
-                vcorrect += (preds==yb).sum().item(); vn += xb.size(0)
-        val_loss = vloss/vn; val_acc = vcorrect/vn
-
-        history['train_loss'].append(train_loss); history['val_loss'].append(val_loss)
-        history['train_acc'].append(train_acc); history['val_acc'].append(val_acc)
-
-        log_print(f"Epoch {epoch}/{EPOCHS} - train_loss {train_loss:.4f} train_acc {train_acc:.4f} - val_loss {val_loss:.4f} val_acc {val_acc:.4f}")
-
-        if val_loss < best_val_loss:
-            best_val_loss = val_loss
-            torch.save(model.state_dict(), os.path.join(OUT_DIR, "best_model.pth"))
-except Exception as e:
-    print(f"Error durante el entrenamiento: {e}")
-    traceback.print_exc()
-    sys.exit(1)
-
-# ------------- Evaluación final en test -------------
-try:
-    model.load_state_dict(torch.load(os.path.join(OUT_DIR, "best_model.pth")))
-    model.eval()
-    ys=[]; ypred=[]
-    tloss=0; tn=0
-    with torch.no_grad():
-        for xb,yb in test_loader:
-            xb,yb = xb.to(device), yb.to(device)
-            out = model(xb); loss = criterion(out,yb)
-            tloss += loss.item()*xb.size(0); tn += xb.size(0)
-            preds = out.argmax(dim=1)
-            ys.extend(yb.cpu().numpy().tolist()); ypred.extend(preds.cpu().numpy().tolist())
-    test_loss = tloss/tn
-    print("Test loss:", test_loss)
-    # Obtener las clases únicas presentes
-    unique_classes = sorted(list(set(ys + ypred)))
-    target_names_list = ['sano', 'enfermo']
-    # Filtrar target_names según las clases presentes
-    filtered_target_names = [target_names_list[i] for i in unique_classes if i < len(target_names_list)]
-    print(classification_report(ys, ypred, labels=unique_classes, target_names=filtered_target_names, zero_division=0))
-    print("Confusion matrix:\n", confusion_matrix(ys, ypred, labels=unique_classes))
-except Exception as e:
-    log_print(f"Error durante la evaluación: {e}")
-    traceback.print_exc()
-    log_file.close()
-    sys.exit(1)
-
-# ------------- Guardar curvas (ejemplo) -------------
-try:
-    if len(history['train_loss']) > 0:
+    history = {'train_loss':[], 'val_loss':[], 'train_acc':[], 'val_acc':[], 'lr':[]}
+    start_epoch = 1
+    if ckpt_exists:
+        load_checkpoint(ckpt, model, optimizer, scheduler)
+        start_epoch = ckpt['epoch'] + 1
+        best_val_loss = ckpt['best_val_loss']
+        history = ckpt['history']
+        stopper.load_state_dict(ckpt['early_stopping'])
+        budget.load_state_dict(ckpt.get('time_budget') or {'elapsed': ckpt.get('elapsed', 0.0)})
+        log_print(f"Reanudando desde {CHECKPOINT}: época {ckpt['epoch']} completada")
+    if distributed:
+        model = DDP(model)
+
+    # ------------- Entrenamiento -------------
+    log_print(f"Configuración: epochs={args.epochs} patience={args.patience} min_delta={args.min_delta} "
+              f"scheduler={args.scheduler} time_budget={args.time_budget} procesos={world_size} precision={precision}")
+    if log_enabled:
+        print("\nIniciando entrenamiento...")
+    stop_reason = "completado"
+    epochs_run = start_epoch - 1
+    profiler = start_training_profiler(args.profile, "train_cats_pytorch") if is_main_process() else None
+    try:
+        for epoch in range(start_epoch, args.epochs+1):
+            if sync_flag(budget.exhausted()):
+                stop_reason = "presupuesto de tiempo"
+                break
+            if train_sampler is not None:
+                train_sampler.set_epoch(epoch)
+            budget.start_epoch()
+            train_loss, train_acc = train_one_epoch(model, train_loader, criterion, optimizer, device, precision,
+                                                    profiler=profiler)
+            # valida
+            val_loss, val_acc, _, _ = evaluate(model, val_loader, criterion, device, precision)
+            lr = current_lr(optimizer)
+            scheduler_step(scheduler, val_loss)
+            budget.end_epoch()
+            epochs_run = epoch
+
+            history['train_loss'].append(train_loss); history['val_loss'].append(val_loss)
+            history['train_acc'].append(train_acc); history['val_acc'].append(val_acc)
+            history['lr'].append(lr)
+
+            log_print(f"Epoch {epoch}/{args.epochs} - train_loss {train_loss:.4f} train_acc {train_acc:.4f} - val_loss {val_loss:.4f} val_acc {val_acc:.4f} - lr {lr:.2e} - {budget.elapsed / max(budget.epochs, 1):.1f}s/época")
+
+            should_stop = sync_flag(stopper.step(val_loss))
+            if is_main_process():
+                if val_loss < best_val_loss:
+                    best_val_loss = val_loss
+                    atomic_torch_save(unwrap_model(model).state_dict(), os.path.join(OUT_DIR, "best_model.pth"))
+                save_checkpoint(CHECKPOINT, model, optimizer, epoch, scheduler=scheduler,
+                                best_val_loss=best_val_loss, history=history,
+                                early_stopping=stopper.state_dict(), time_budget=budget.state_dict(),
+                                splits=splits_to_state(train, val, test), csv=args.csv)
+            if should_stop:
+                stop_reason = f"early stopping ({args.patience} épocas sin mejora)"
+                break
+    except Exception as e:
+        print(f"Error durante el entrenamiento: {e}")
+        traceback.print_exc()
+        sys.exit(1)
+    finally:
+        if profiler is not None:
+            profiler.close()
+
+    cleanup_distributed()
+    model = unwrap_model(model)
+    if not log_enabled:
+        return
+
+    log_print(schedule_summary(epochs_run, args.epochs, stop_reason) + f", tiempo de entrenamiento: {budget.elapsed:.1f}s")
+
+    # El entrenamiento terminó: el checkpoint ya no es necesario
+    if os.path.exists(CHECKPOINT):
+        os.remove(CHECKPOINT)
+
+    # ------------- Evaluación final en test -------------
+    try:
+        from sklearn.metrics import confusion_matrix, classification_report
+        model.load_state_dict(torch.load(os.path.join(OUT_DIR, "best_model.pth")))
+        test_loss, _, ys, ypred = evaluate(model, test_loader, criterion, device)
+        print("Test loss:", test_loss)
+        # Obtener las clases únicas presentes
+        unique_classes = sorted(list(set(ys + ypred)))
+        target_names_list = ['sano', 'enfermo']
+        # Filtrar target_names según las clases presentes
+        filtered_target_names = [target_names_list[i] for i in unique_classes if i < len(target_names_list)]
+        print(classification_report(ys, ypred, labels=unique_classes, target_names=filtered_target_names, zero_division=0))
+        print("Confusion matrix:\n", confusion_matrix(ys, ypred, labels=unique_classes))
+        if precision != "fp32":
+            # El modelo se guarda en fp32: comprobar que servirlo en bf16 no degrada la accuracy
+            check = check_precision(model, test_loader, criterion, device, precision)
+            log_print(f"Accuracy test fp32 {check['fp32_acc']:.4f} / {precision} {check['acc']:.4f} (delta {check['delta']:+.4f})")
+            if not check['ok']:
+                log_print(f"⚠️  {precision} reduce la accuracy más de lo tolerado; usar fp32 para inferencia")
+    except Exception as e:
+        log_print(f"Error durante la evaluación: {e}")
+        traceback.print_exc()
+        log_file.close()
+        sys.exit(1)
+
+    # ------------- Guardar curvas (ejemplo) -------------
+    try:
+        import matplotlib
+        matplotlib.use('Agg')  # Backend no interactivo para evitar problemas en servidores
+        import matplotlib.pyplot as plt
         epochs = range(1, len(history['train_loss'])+1)
-    plt.figure(); plt.plot(epochs, history['train_loss'], label='train_loss'); plt.plot(epochs, history['val_loss'], label='val_loss')
-    plt.legend(); plt.title('Loss'); plt.savefig(os.path.join(OUT_DIR,'loss.png'))
-    plt.close()
-    plt.figure(); plt.plot(epochs, history['train_acc'], label='train_acc'); plt.plot(epochs, history['val_acc'], label='val_acc')
-    plt.legend(); plt.title('Accuracy'); plt.savefig(os.path.join(OUT_DIR,'acc.png'))
-    plt.close()
-    log_print("\nEntrenamiento completado exitosamente!")
-    log_print(f"Modelo guardado en: {os.path.join(OUT_DIR, 'best_model.pth')}")
-    log_print(f"Gráficas guardadas en: {OUT_DIR}")
-    log_file.close()
-except Exception as e:
-    log_print(f"Error al guardar las gráficas: {e}")
-    traceback.print_exc()
-    log_file.close()
+        plt.figure(); plt.plot(epochs, history['train_loss'], label='train_loss'); plt.plot(epochs, history['val_loss'], label='val_loss')
+        plt.legend(); plt.title('Loss'); plt.savefig(os.path.join(OUT_DIR,'loss.png'))
+        plt.close()
+        plt.figure(); plt.plot(epochs, history['train_acc'], label='train_acc'); plt.plot(epochs, history['val_acc'], label='val_acc')
+        plt.legend(); plt.title('Accuracy'); plt.savefig(os.path.join(OUT_DIR,'acc.png'))
+        plt.close()
+        log_print("\nEntrenamiento completado exitosamente!")
+        log_print(f"Modelo guardado en: {os.path.join(OUT_DIR, 'best_model.pth')}")
+        log_print(f"Gráficas guardadas en: {OUT_DIR}")
+        log_file.close()
+    except Exception as e:
+        log_print(f"Error al guardar las gráficas: {e}")
+        traceback.print_exc()
+        log_file.close()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Entrena SimpleCNN con dataset.csv")
+    parser.add_argument("--csv", default=CSV, help="CSV de entrenamiento")
+    parser.add_argument("--epochs", type=int, default=EPOCHS, help="Número de épocas")
+    parser.add_argument("--resume", action="store_true",
+                        help=f"Reanudar desde {CHECKPOINT} si existe (modelo, optimizador, época, RNG y splits)")
+    add_schedule_args(parser, patience=5, scheduler="plateau")
+    add_precision_arg(parser, default=os.environ.get("PRECISION") or hw_setting("training", "precision"))
+    parser.add_argument("--profile", type=int, nargs="?", const=10, default=0, metavar="PASOS",
+                        help="Perfilar PASOS pasos de entrenamiento con torch.profiler (outputs/profiles/)")
+    # Entrenamiento data-parallel (DistributedDataParallel + gloo)
+    parser.add_argument("--nprocs", type=int, default=1,
+                        help="Procesos de entrenamiento en esta máquina (batch efectivo = BATCH * procesos)")
+    parser.add_argument("--nnodes", type=int, default=1, help="Número de nodos")
+    parser.add_argument("--node-rank", type=int, default=0, help="Índice de este nodo (0 = nodo maestro)")
+    parser.add_argument("--master-addr", default="127.0.0.1", help="Dirección TCP del rank 0")
+    parser.add_argument("--master-port", type=int, default=29500, help="Puerto TCP del rank 0")
+    args = parser.parse_args()
+    args.precision = resolve_precision(args.precision, device)
+
+    if args.nprocs * args.nnodes > 1:
+        mp.spawn(train_worker, args=(args,), nprocs=args.nprocs, join=True)
+    else:
+        train_worker(0, args)
+
+
+if __name__ == "__main__":
+    main()
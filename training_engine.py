@@ -0,0 +1,352 @@
+"""
+Utilidades de entrenamiento compartidas por train_cats_pytorch.py e incremental_train.py
+
+- Bucles de entrenamiento y validación por época
+- Checkpoints completos (modelo, optimizador, scheduler, época, estados RNG, splits)
+  escritos de forma atómica para poder reanudar un entrenamiento interrumpido
+- Early stopping, scheduler de learning rate y presupuesto de tiempo
+- Entrenamiento data-parallel multiproceso (DistributedDataParallel con gloo en CPU)
+- Precisión mixta bf16 opcional (autocast) con comprobación de accuracy frente a fp32
+"""
+import os
+import random
+import time
+
+import numpy as np
+import torch
+import torch.distributed as dist
+
+from precision import autocast
+
+
+def is_distributed() -> bool:
+    return dist.is_available() and dist.is_initialized()
+
+
+def is_main_process() -> bool:
+    """True en procesos no distribuidos o en el rank 0"""
+    return not is_distributed() or dist.get_rank() == 0
+
+
+def _reduce_sums(*values):
+    """Suma valores entre todos los procesos (sin efecto si no hay entrenamiento distribuido)"""
+    if not is_distributed():
+        return values
+    t = torch.tensor(values, dtype=torch.float64)
+    dist.all_reduce(t, op=dist.ReduceOp.SUM)
+    return t.tolist()
+
+
+def sync_flag(flag: bool) -> bool:
+    """True en todos los procesos si algún proceso devuelve True (decisiones de parada)"""
+    if not is_distributed():
+        return flag
+    t = torch.tensor([1 if flag else 0])
+    dist.all_reduce(t, op=dist.ReduceOp.MAX)
+    return bool(t.item())
+
+
+def setup_distributed(rank: int, world_size: int, master_addr: str = "127.0.0.1",
+                      master_port: int = 29500, backend: str = "gloo"):
+    """
+    Inicializa el grupo de procesos para DistributedDataParallel (gloo sobre TCP en CPU)
+
+    Con master_addr apuntando a otro host, los mismos parámetros sirven para varios nodos.
+    """
+    dist.init_process_group(
+        backend=backend,
+        init_method=f"tcp://{master_addr}:{master_port}",
+        rank=rank,
+        world_size=world_size,
+    )
+
+
+def cleanup_distributed():
+    if is_distributed():
+        dist.destroy_process_group()
+
+
+def unwrap_model(model):
+    """Devuelve el modelo original si está envuelto en DistributedDataParallel"""
+    return model.module if hasattr(model, "module") else model
+
+
+def train_one_epoch(model, loader, criterion, optimizer, device, precision="fp32", profiler=None):
+    """
+    Entrena una época
+
+    Con precision="bf16" solo el forward va en autocast; la loss se calcula en fp32 y
+    los pesos y el optimizador se mantienen en fp32 (bf16 no necesita loss scaling).
+    profiler (profiling.TrainingProfiler, opcional) avanza un paso por batch.
+
+    Returns:
+        (loss promedio por muestra, accuracy), agregados entre procesos si es distribuido
+    """
+    model.train()
+    running_loss = 0.0; correct = 0; n = 0
+    for xb, yb in loader:
+        xb, yb = xb.to(device), yb.to(device)
+        optimizer.zero_grad()
+        with autocast(precision, device):
+            out = model(xb)
+        out = out.float()
+        loss = criterion(out, yb)
+        loss.backward()
+        optimizer.step()
+        running_loss += loss.item() * xb.size(0)
+        correct += (out.argmax(dim=1) == yb).sum().item()
+        n += xb.size(0)
+        if profiler is not None:
+            profiler.step()
+    running_loss, correct, n = _reduce_sums(running_loss, correct, n)
+    return (running_loss / n if n else 0.0), (correct / n if n else 0.0)
+
+
+def evaluate(model, loader, criterion, device, precision="fp32"):
+    """
+    Evalúa el modelo sin gradientes
+
+    Returns:
+        (loss promedio por muestra, accuracy, labels reales, predicciones)
+        loss y accuracy se agregan entre procesos; labels y predicciones son las del proceso local
+    """
+    model.eval()
+    running_loss = 0.0; correct = 0; n = 0
+    ys = []; ypred = []
+    with torch.no_grad():
+        for xb, yb in loader:
+            xb, yb = xb.to(device), yb.to(device)
+            with autocast(precision, device):
+                out = model(xb)
+            out = out.float()
+            running_loss += criterion(out, yb).item() * xb.size(0)
+            preds = out.argmax(dim=1)
+            ys.extend(yb.cpu().tolist()); ypred.extend(preds.cpu().tolist())
+            correct += (preds == yb).sum().item()
+            n += xb.size(0)
+    running_loss, correct, n = _reduce_sums(running_loss, correct, n)
+    return (running_loss / n if n else 0.0), (correct / n if n else 0.0), ys, ypred
+
+
+def check_precision(model, loader, criterion, device, precision, tolerance: float = 0.01) -> dict:
+    """
+    Compara la accuracy con la precisión indicada frente a fp32 sobre el mismo loader
+
+    Args:
+        tolerance: Caída máxima de accuracy aceptada antes de avisar
+
+    Returns:
+        dict con fp32_acc, acc (en `precision`), delta y ok
+    """
+    _, fp32_acc, _, _ = evaluate(model, loader, criterion, device, "fp32")
+    if precision == "fp32":
+        return {"fp32_acc": fp32_acc, "acc": fp32_acc, "delta": 0.0, "ok": True}
+    _, acc, _, _ = evaluate(model, loader, criterion, device, precision)
+    delta = acc - fp32_acc
+    return {"fp32_acc": fp32_acc, "acc": acc, "delta": delta, "ok": delta >= -tolerance}
+
+
+def capture_rng_state() -> dict:
+    """Estado de todos los generadores aleatorios usados en el entrenamiento"""
+    state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state: dict):
+    """Restaura el estado guardado con capture_rng_state"""
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"].cpu())
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+def atomic_torch_save(obj, path):
+    """
+    Guarda con torch.save en un archivo temporal del mismo directorio y lo reemplaza
+    con os.replace: un proceso que muera a mitad de escritura nunca deja el archivo corrupto
+    """
+    path = str(path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        torch.save(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def save_checkpoint(path, model, optimizer, epoch: int, scheduler=None, **extra):
+    """
+    Guarda un checkpoint completo para reanudar el entrenamiento
+
+    Args:
+        path: Ruta del checkpoint
+        model, optimizer, scheduler: Objetos cuyo state_dict se guarda
+        epoch: Última época completada
+        extra: Estado adicional (mejor métrica, historial, splits, ...)
+    """
+    atomic_torch_save({
+        "model": unwrap_model(model).state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "scheduler": scheduler.state_dict() if scheduler is not None else None,
+        "epoch": epoch,
+        "rng": capture_rng_state(),
+        **extra,
+    }, path)
+
+
+def read_checkpoint(path, map_location="cpu") -> dict:
+    """Lee un checkpoint sin restaurar nada (para consultar splits, época, etc.)"""
+    # weights_only=False: el checkpoint incluye estados RNG y splits, no solo tensores
+    return torch.load(path, map_location=map_location, weights_only=False)
+
+
+def load_checkpoint(checkpoint, model=None, optimizer=None, scheduler=None, map_location="cpu") -> dict:
+    """
+    Carga un checkpoint y restaura los objetos indicados y el estado RNG
+
+    Args:
+        checkpoint: Ruta del checkpoint o dict ya leído con read_checkpoint
+
+    Returns:
+        dict completo del checkpoint
+    """
+    ckpt = checkpoint if isinstance(checkpoint, dict) else read_checkpoint(checkpoint, map_location)
+    if model is not None:
+        unwrap_model(model).load_state_dict(ckpt["model"])
+    if optimizer is not None:
+        optimizer.load_state_dict(ckpt["optimizer"])
+    if scheduler is not None and ckpt.get("scheduler") is not None:
+        scheduler.load_state_dict(ckpt["scheduler"])
+    restore_rng_state(ckpt["rng"])
+    return ckpt
+
+
+class EarlyStopping:
+    """
+    Detiene el entrenamiento cuando la métrica monitorizada (val_loss) deja de mejorar
+
+    Args:
+        patience: Épocas sin mejora antes de detener (0 desactiva el early stopping)
+        min_delta: Mejora mínima para considerar que la métrica mejoró
+    """
+    def __init__(self, patience: int = 5, min_delta: float = 0.0):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.best = float("inf")
+        self.bad_epochs = 0
+
+    def step(self, value: float) -> bool:
+        """Registra la métrica de una época. Devuelve True si hay que detenerse"""
+        if value < self.best - self.min_delta:
+            self.best = value
+            self.bad_epochs = 0
+        else:
+            self.bad_epochs += 1
+        return self.patience > 0 and self.bad_epochs >= self.patience
+
+    def state_dict(self) -> dict:
+        return {"best": self.best, "bad_epochs": self.bad_epochs}
+
+    def load_state_dict(self, state: dict):
+        self.best = state["best"]
+        self.bad_epochs = state["bad_epochs"]
+
+
+class TimeBudget:
+    """
+    Presupuesto de tiempo de entrenamiento: no empieza una época que previsiblemente
+    terminaría fuera del presupuesto (según la duración media de las épocas anteriores)
+
+    Al reanudar se restaura con load_state_dict (tiempo y épocas ya medidas), para que la
+    duración media no se calcule con todo el tiempo acumulado como si fuera una sola época.
+
+    Args:
+        seconds: Segundos disponibles (None o 0 = sin límite)
+        elapsed: Segundos ya consumidos (al reanudar desde un checkpoint)
+        epochs: Épocas en las que se consumió elapsed (0 = desconocido: la media se calcula
+            solo con las épocas de esta sesión)
+    """
+    def __init__(self, seconds: float = None, elapsed: float = 0.0, epochs: int = 0):
+        self.seconds = seconds
+        self._start = None
+        self.load_state_dict({"elapsed": elapsed, "epochs": epochs})
+
+    def start_epoch(self):
+        self._start = time.perf_counter()
+
+    def end_epoch(self):
+        duration = time.perf_counter() - self._start
+        self.elapsed += duration
+        self._timed += duration
+        self.epochs += 1
+
+    def exhausted(self) -> bool:
+        if not self.seconds or self.epochs == 0:
+            return False
+        return self.elapsed + self._timed / self.epochs > self.seconds
+
+    def state_dict(self) -> dict:
+        return {"elapsed": self.elapsed, "epochs": self.epochs, "epoch_seconds": self._timed}
+
+    def load_state_dict(self, state: dict):
+        self.elapsed = state.get("elapsed", 0.0)
+        self.epochs = state.get("epochs") or 0
+        # Tiempo de las épocas contadas (checkpoints antiguos solo guardaban elapsed)
+        self._timed = state.get("epoch_seconds", self.elapsed if self.epochs else 0.0)
+
+
+def build_scheduler(optimizer, name: str, epochs: int, patience: int = 5):
+    """
+    Crea el scheduler de learning rate
+
+    Args:
+        name: "plateau" (reduce el LR a la mitad si val_loss no mejora),
+              "cosine" (cosine annealing durante `epochs`) o "none"
+    """
+    if name == "plateau":
+        return torch.optim.lr_scheduler.ReduceLROnPlateau(
+            optimizer, mode="min", factor=0.5, patience=max(1, patience // 2)
+        )
+    if name == "cosine":
+        return torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=max(1, epochs))
+    return None
+
+
+def scheduler_step(scheduler, val_loss: float):
+    """Avanza el scheduler (ReduceLROnPlateau necesita la métrica)"""
+    if scheduler is None:
+        return
+    if isinstance(scheduler, torch.optim.lr_scheduler.ReduceLROnPlateau):
+        scheduler.step(val_loss)
+    else:
+        scheduler.step()
+
+
+def current_lr(optimizer) -> float:
+    return optimizer.param_groups[0]["lr"]
+
+
+def add_schedule_args(parser, patience: int = 5, scheduler: str = "plateau"):
+    """Agrega al parser las opciones de early stopping, scheduler y presupuesto de tiempo"""
+    parser.add_argument("--patience", type=int, default=patience,
+                        help="Épocas sin mejora de val_loss antes de detener (0 = sin early stopping)")
+    parser.add_argument("--min-delta", type=float, default=1e-4,
+                        help="Mejora mínima de val_loss para reiniciar la paciencia")
+    parser.add_argument("--scheduler", choices=["plateau", "cosine", "none"], default=scheduler,
+                        help="Scheduler de learning rate")
+    parser.add_argument("--time-budget", type=float, default=None,
+                        help="Segundos máximos de entrenamiento (no se empieza una época que no quepa)")
+
+
+def schedule_summary(epochs_run: int, epochs_planned: int, stop_reason: str) -> str:
+    """Resumen para el log: épocas ejecutadas frente al plan fijo"""
+    saved = max(0, epochs_planned - epochs_run)
+    return (f"Épocas ejecutadas: {epochs_run}/{epochs_planned} "
+            f"(ahorradas: {saved}, motivo: {stop_reason})")